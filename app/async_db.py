@@ -0,0 +1,105 @@
+"""
+Async facade over the blocking database and PDF functions.
+
+The handlers in app/bot.py await these wrappers instead of calling sqlite
+and reportlab directly, so the blocking work runs on a small thread pool
+and the event loop keeps serving updates and scheduled jobs meanwhile.
+"""
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.get_random_line import draw_quotes, pick_unseen_quotes
+from app.make_quotes_from_csv import import_csv_file
+from app.quotes_from_md import import_md_file
+from db.db_fill_in import ImportResult
+from db.db_ratings import RatingBuffer
+from db.db_search import SearchPage, search_quotes
+from db.db_seen import SeenSet, load_seen, mark_seen
+from db.db_users import load_subscriptions, save_subscription
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Number of threads used for blocking work, can be overridden with DB_WORKERS
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="quotes-db")
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking function on the database thread pool and awaits its result.
+    
+    Args:
+        func (Callable): The blocking function to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+        
+    Returns:
+        The value returned by func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def pick_unseen_quotes_async(user_ids: list[int]) -> dict[int, dict]:
+    """Async version of pick_unseen_quotes."""
+    return await run_blocking(pick_unseen_quotes, user_ids)
+
+
+async def draw_quotes_async(count: int) -> list[dict]:
+    """Async version of draw_quotes."""
+    return await run_blocking(draw_quotes, count)
+
+
+async def load_seen_async(user_ids: list[int]) -> dict[int, SeenSet]:
+    """Async version of load_seen."""
+    return await run_blocking(load_seen, user_ids)
+
+
+async def mark_seen_async(pairs: list[tuple[int, int]]) -> None:
+    """Async version of mark_seen."""
+    await run_blocking(mark_seen, pairs)
+
+
+async def search_quotes_async(query: str, page: int = 0, page_size: int = 10) -> SearchPage:
+    """Async version of search_quotes."""
+    return await run_blocking(search_quotes, query, page, page_size)
+
+
+async def flush_ratings_async(buffer: RatingBuffer) -> int:
+    """Async version of RatingBuffer.flush."""
+    return await run_blocking(buffer.flush)
+
+
+async def load_subscriptions_async() -> dict[int, tuple[str, list[str] | None]]:
+    """Async version of load_subscriptions."""
+    return await run_blocking(load_subscriptions)
+
+
+async def save_subscription_async(user_id: int, period: str, times: list[str] | None) -> None:
+    """Async version of save_subscription."""
+    await run_blocking(save_subscription, user_id, period, times)
+
+
+async def import_md_file_async(file_path: str) -> ImportResult:
+    """Async version of import_md_file."""
+    return await run_blocking(import_md_file, file_path)
+
+
+async def import_csv_file_async(file_path: str) -> list[ImportResult]:
+    """Async version of import_csv_file."""
+    return await run_blocking(import_csv_file, file_path)
+
+
+def shutdown_executor() -> None:
+    """
+    Waits for pending blocking work and stops the thread pool.
+    """
+    _executor.shutdown(wait=True)
+    logger.info("Database thread pool stopped")
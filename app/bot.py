@@ -1,9 +1,10 @@
 import os
-import json
+import asyncio
 import logging
+from contextlib import ExitStack
 from datetime import datetime, time
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, Document
+from telegram import Update, Message, InlineKeyboardMarkup, ReplyKeyboardMarkup, Document
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,11 +14,43 @@ from telegram.ext import (
     CallbackQueryHandler,
     filters,
 )
-from app.get_random_line import get_random_quote
-from db.db_modify import modify_cell
-from app.quotes_from_md import parse_md_to_quotes
-from db.db_fill_in import db_fill_in
-from app.make_pdf import make_pdf
+from app.async_db import (
+    pick_unseen_quotes_async,
+    flush_ratings_async,
+    load_subscriptions_async,
+    save_subscription_async,
+    import_md_file_async,
+    import_csv_file_async,
+    search_quotes_async,
+    shutdown_executor,
+)
+from app.scheduler import QuoteScheduler
+from app.send_queue import BROADCAST, INTERACTIVE, MAX_SENDS_PER_SECOND, SendQueue
+from app.cache import TTLCache
+from app.pdf_worker import PdfRenderQueue
+from app.prefetch import QuotePrefetcher
+from app.metrics import (
+    HANDLER_SECONDS,
+    METRICS_LOG_INTERVAL,
+    METRICS_PORT,
+    SCHEDULER_LAG_SECONDS,
+    log_summary,
+    start_http_server,
+    timed,
+)
+from app.messages import (
+    ADD_QUOTES_BUTTON,
+    BEST_QUOTES_BUTTON,
+    MAIN_MENU,
+    QUOTE_PARSE_MODE,
+    RANDOM_QUOTE_BUTTON,
+    RATED_KEYBOARDS,
+    format_search_results,
+    render_quote,
+    search_keyboard,
+)
+from app.get_random_line import on_ratings_flushed
+from db.db_ratings import RatingBuffer
 
 # Load environment variables
 load_dotenv()
@@ -42,42 +75,107 @@ PERIODS = {
     '4': {'name': 'Four times a day', 'times': ['08:00', '12:00', '16:00', '20:00']}
 }
 
-# Store user preferences
-user_preferences = {}
-
-# Store active message interactions
-active_interactions = {}  # Format: {message_id: {user_id: action}}
-
-async def send_quote_to_user(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Helper function to send a quote to a specific user."""
-    quote_data = json.loads(get_random_quote())
-    if 'error' not in quote_data:
-        print('Sending quote to user')
-        message = (
-            f"{quote_data['content']}\n\n"
-            f"*{quote_data['book']}*\n"
-            f"_{quote_data['author']}_"
-        )
-        
-        # Always show active buttons for new messages
-        keyboard = [
-            [
-                InlineKeyboardButton("👍 Like", callback_data=f"like_{quote_data['id']}"),
-                InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{quote_data['id']}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        sent_message = await context.bot.send_message(
+PERIOD_KEYBOARD = ReplyKeyboardMarkup([[f"{k} - {v['name']}"] for k, v in PERIODS.items()], one_time_keyboard=True)
+
+# Users indexed by the minute slots they are due in, only those of this worker's shard
+scheduler = QuoteScheduler()
+
+# Recently rated messages, answered without a database round trip,
+# older ratings are caught by the message_ratings table on flush
+# Format: {(message_id, user_id): action}
+active_interactions = TTLCache(maxsize=10000, ttl=24 * 3600)
+
+# Like/dislike votes waiting to be written to the database
+rating_buffer = RatingBuffer(on_flush=on_ratings_flushed)
+
+# Seconds between rating buffer flushes
+RATING_FLUSH_INTERVAL = 5
+
+# Renders the best quotes PDF in a worker process
+pdf_queue = PdfRenderQueue()
+
+# Quotes drawn in advance for the random button
+prefetcher = QuotePrefetcher()
+
+# Search results per page
+SEARCH_PAGE_SIZE = 5
+
+# Updates handled at the same time, so one slow import, search or PDF request
+# doesn't hold up everyone else, can be overridden with CONCURRENT_UPDATES
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+
+# Outgoing quotes, kept within Telegram's global and per-chat rate limits
+send_queue = SendQueue()
+
+# Prometheus endpoint, started in post_init when METRICS_PORT is set
+metrics_server = None
+
+def queue_quote(
+    chat_id: int,
+    context: ContextTypes.DEFAULT_TYPE,
+    quote_data: dict,
+    priority: int = BROADCAST,
+) -> asyncio.Future:
+    """
+    Queue a picked quote for a user without waiting for it to be sent.
+    
+    Texts were escaped and split at import, the keyboard goes under the last
+    part. Each part is queued once the previous one went out, so long quotes
+    arrive in order. Returns a future resolved when the last part was sent,
+    or with the error of the first part that failed.
+    """
+    parts, reply_markup = render_quote(quote_data)
+    delivered = asyncio.get_running_loop().create_future()
+
+    def queue_part(number: int) -> None:
+        text = parts[number]
+        markup = reply_markup if number == len(parts) - 1 else None
+        sent = send_queue.submit(chat_id, lambda: context.bot.send_message(
             chat_id=chat_id,
-            text=message,
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
-        
-        # Initialize interaction tracking for this message
-        active_interactions[sent_message.message_id] = {}
+            text=text,
+            parse_mode=QUOTE_PARSE_MODE,
+            reply_markup=markup
+        ), priority)
+        sent.add_done_callback(lambda sent: part_done(number, sent))
+
+    def part_done(number: int, sent: asyncio.Future) -> None:
+        if sent.cancelled():
+            delivered.cancel()
+        elif sent.exception() is not None:
+            delivered.set_exception(sent.exception())
+        elif number + 1 < len(parts):
+            queue_part(number + 1)
+        else:
+            delivered.set_result(sent.result())
+
+    queue_part(0)
+    return delivered
+
+def log_failed_delivery(user_id: int, delivered: asyncio.Future) -> None:
+    """Done callback of a queued broadcast, which nobody awaits."""
+    if not delivered.cancelled() and delivered.exception() is not None:
+        logger.error(f"Error sending quote to user {user_id}: {delivered.exception()}")
+
+async def send_quote_to_user(
+    chat_id: int,
+    context: ContextTypes.DEFAULT_TYPE,
+    quote_data: dict | None = None,
+    priority: int = INTERACTIVE,
+) -> None:
+    """
+    Helper function to send a quote to a specific user.
+    
+    Uses quote_data when it was already picked by the caller, otherwise picks
+    one the user hasn't seen yet. The messages go through the send queue,
+    where interactive replies overtake scheduled broadcasts.
+    """
+    if quote_data is None:
+        quote_data = await prefetcher.get_quote(chat_id)
+    if quote_data is not None:
+        logger.debug("Sending quote %s to %s", quote_data['id'], chat_id)
+        await queue_quote(chat_id, context, quote_data, priority)
 
+@timed(HANDLER_SECONDS, handler='handle_like_dislike')
 async def handle_like_dislike(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle Like/Dislike button presses."""
     query = update.callback_query
@@ -93,66 +191,57 @@ async def handle_like_dislike(update: Update, context: ContextTypes.DEFAULT_TYPE
         message_id = query.message.message_id
         
         # Check if user has already interacted with this specific message
-        if message_id in active_interactions and user_id in active_interactions[message_id]:
+        if (message_id, user_id) in active_interactions:
             await query.answer("You've already rated this quote!", show_alert=True)
             return
         
         try:
-            # Get current value and modify it
+            # Counted on the next flush, which records the rating in the same transaction
+            if not rating_buffer.add(message_id, user_id, quote_id, action):
+                active_interactions.set((message_id, user_id), action)
+                await query.answer("You've already rated this quote!", show_alert=True)
+                return
+            
+            # Remember the interaction for this specific message
+            active_interactions.set((message_id, user_id), action)
+            
             if action == 'like':
-                modify_cell(quote_id, 'value', 10)
                 await query.answer("Quote liked! 👍")
             else:  # dislike
-                modify_cell(quote_id, 'value', 1)
                 await query.answer("Quote disliked! 👎")
             
-            # Store the interaction for this specific message
-            active_interactions[message_id][user_id] = action
-            
             # Update the message to show disabled buttons
-            keyboard = [
-                [
-                    InlineKeyboardButton("👍 Liked" if action == 'like' else "👎 Disliked", 
-                                       callback_data="disabled")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
+            await query.edit_message_reply_markup(reply_markup=RATED_KEYBOARDS[action])
             
         except Exception as e:
             logger.error(f"Error modifying quote value: {e}")
             await query.answer("Error updating quote value", show_alert=True)
 
+@timed(HANDLER_SECONDS, handler='start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     if update.effective_user and update.message:
         user = update.effective_user
-        keyboard = [
-            [KeyboardButton("📚 Get a Random Quote")],
-            [KeyboardButton("➕ Add quotes")],
-            [KeyboardButton("🏆 Best_quotes")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await update.message.reply_text(
             f'Hi {user.first_name}! I will send you random quotes.\n'
             'Use /settings to configure how often you want to receive quotes.\n'
             'Or click the button below to get a random quote right now!\n'
             'To add your own quotes, click "➕ Add quotes".\n'
             'To get a PDF with the best quotes, click "🏆 Best_quotes".',
-            reply_markup=reply_markup
+            reply_markup=MAIN_MENU
         )
 
+@timed(HANDLER_SECONDS, handler='settings')
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the settings conversation."""
     if update.message:
-        keyboard = [[f"{k} - {v['name']}"] for k, v in PERIODS.items()]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
         await update.message.reply_text(
             'Please choose how often you want to receive quotes:',
-            reply_markup=reply_markup
+            reply_markup=PERIOD_KEYBOARD
         )
     return SETTING_PERIOD
 
+@timed(HANDLER_SECONDS, handler='set_period')
 async def set_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the period selection."""
     if update.effective_user and update.message and update.message.text:
@@ -160,63 +249,101 @@ async def set_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         choice = update.message.text[0]  # Get the first character of the choice
         
         if choice in PERIODS:
-            user_preferences[user_id] = PERIODS[choice]
+            scheduler.subscribe(user_id, PERIODS[choice]['times'])
+            await save_subscription_async(user_id, choice, PERIODS[choice]['times'])
             # Restore all main buttons as in /start
-            keyboard = [
-                [KeyboardButton("📚 Get a Random Quote")],
-                [KeyboardButton("➕ Add quotes")],
-                [KeyboardButton("🏆 Best_quotes")]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
             await update.message.reply_text(
                 f'Great! You will receive quotes {PERIODS[choice]["name"].lower()}.',
-                reply_markup=reply_markup
+                reply_markup=MAIN_MENU
             )
             return ConversationHandler.END
         else:
             await update.message.reply_text('Please choose a valid option.')
     return SETTING_PERIOD
 
+@timed(HANDLER_SECONDS, handler='send_quote')
 async def send_quote(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a random quote to users based on their schedule."""
-    current_time = datetime.now().strftime('%H:%M')
+    now = datetime.now()
+    current_time = now.strftime('%H:%M')
+    # The job is aligned to the start of the minute, anything past it is lag
+    SCHEDULER_LAG_SECONDS.observe(now.second + now.microsecond / 1_000_000)
+    
+    # Only users scheduled for this minute (and every-minute users) are touched
+    due_users = scheduler.due_users(current_time)
+    if not due_users:
+        return
     
-    for user_id, preferences in user_preferences.items():
-        # If times is None, it means "every minute" mode
-        if preferences['times'] is None:
-            await send_quote_to_user(user_id, context)
-        # Otherwise check if current time matches any of the scheduled times
-        elif current_time in preferences['times']:
-            await send_quote_to_user(user_id, context)
+    # Pick a quote each due user hasn't seen yet, in one batch
+    assigned = await pick_unseen_quotes_async(due_users)
+    for user_id, quote in assigned.items():
+        prefetcher.note_seen(user_id, quote['id'])
+    if len(assigned) < len(due_users):
+        logger.warning(f"No quotes available for {len(due_users) - len(assigned)} users")
+    
+    # Everything is queued at once and the job returns, the send queue paces the
+    # actual sends, which for a large broadcast take longer than the minute to the next run
+    for user_id, quote in assigned.items():
+        queue_quote(user_id, context, quote, BROADCAST).add_done_callback(
+            lambda delivered, user_id=user_id: log_failed_delivery(user_id, delivered)
+        )
+
+@timed(HANDLER_SECONDS, handler='flush_ratings')
+async def flush_ratings(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write buffered like/dislike votes to the database."""
+    try:
+        await flush_ratings_async(rating_buffer)
+    except Exception as e:
+        logger.error(f"Error flushing ratings: {e}")
+
+@timed(HANDLER_SECONDS, handler='flush_seen')
+async def flush_seen(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write quotes handed out by the random button to the users' seen history."""
+    try:
+        await prefetcher.flush()
+    except Exception as e:
+        logger.error(f"Error writing seen quotes: {e}")
 
+@timed(HANDLER_SECONDS, handler='handle_random_quote')
 async def handle_random_quote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the random quote button press."""
     if update.effective_user and update.message:
         await send_quote_to_user(update.effective_user.id, context)
 
+@timed(HANDLER_SECONDS, handler='add_quotes_entry')
 async def add_quotes_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handler for 'Add quotes' button. Prompts user to upload a .md file."""
+    """Handler for 'Add quotes' button. Prompts user to upload a .md or .csv file."""
     if update.message:
         await update.message.reply_text(
-            "Please upload a markdown (.md) file with your quotes.")
+            "Please upload a markdown (.md) file with your quotes, "
+            "or a .csv file with source, author and quote columns.")
     return WAITING_MD_FILE
 
+@timed(HANDLER_SECONDS, handler='handle_md_file')
 async def handle_md_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handles the uploaded .md file, parses and adds quotes to the database."""
+    """Handles the uploaded .md or .csv file, parses and adds quotes to the database."""
     if update.message and update.message.document and update.effective_user:
         file = update.message.document
-        if not (file.file_name and file.file_name.endswith('.md')):
-            await update.message.reply_text("File must have a .md extension. Please try again.")
+        if not (file.file_name and file.file_name.endswith(('.md', '.csv'))):
+            await update.message.reply_text("File must have a .md or .csv extension. Please try again.")
             return WAITING_MD_FILE
         # Download file
         file_path = os.path.join("app", f"user_{update.effective_user.id}_{file.file_name}")
         new_file = await file.get_file()
         await new_file.download_to_drive(file_path)
         try:
-            book_quotes = parse_md_to_quotes(file_path)
-            db_fill_in(book_quotes)
-            count = len(book_quotes.content)
-            await update.message.reply_text(f"Successfully added {count} quotes from '{book_quotes.book}' by {book_quotes.author}.")
+            if file.file_name.endswith('.csv'):
+                results = await import_csv_file_async(file_path)
+                inserted = sum(result.inserted for result in results)
+                skipped = sum(result.skipped for result in results)
+                message = f"Successfully added {inserted} quotes from {len(results)} books."
+            else:
+                result = await import_md_file_async(file_path)
+                skipped = result.skipped
+                message = f"Successfully added {result.inserted} quotes from '{result.book}' by {result.author}."
+            if skipped:
+                message += f" Skipped {skipped} quotes that were already in the database."
+            await update.message.reply_text(message)
         except Exception as e:
             await update.message.reply_text(f"Error processing file: {e}")
         finally:
@@ -225,36 +352,157 @@ async def handle_md_file(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return ConversationHandler.END
     else:
         if update.message:
-            await update.message.reply_text("Please upload a markdown (.md) file.")
+            await update.message.reply_text("Please upload a markdown (.md) or .csv file.")
         return WAITING_MD_FILE
 
+@timed(HANDLER_SECONDS, handler='deliver_best_quotes')
+async def deliver_best_quotes(message: Message) -> None:
+    """Ждёт готовые PDF-файлы с лучшими цитатами и отправляет их пользователю."""
+    try:
+        pdf_paths = await pdf_queue.get_pdfs()
+        if pdf_paths:
+            # Every volume is opened before the first is sent, so a newer build
+            # replacing the cache meanwhile cannot take the later ones away
+            with ExitStack() as stack:
+                pdf_files = [stack.enter_context(open(pdf_path, "rb")) for pdf_path in pdf_paths]
+                for pdf_path, pdf_file in zip(pdf_paths, pdf_files):
+                    await message.reply_document(pdf_file, filename=os.path.basename(pdf_path))
+        else:
+            await message.reply_text("Не удалось создать PDF-файл. Возможно, нет лучших цитат.")
+    except Exception as e:
+        logger.error(f"Error delivering best quotes PDF: {e}")
+        await message.reply_text("Не удалось создать PDF-файл.")
+
+@timed(HANDLER_SECONDS, handler='handle_best_quotes')
 async def handle_best_quotes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Генерирует PDF с лучшими цитатами и отправляет пользователю."""
+    """Ставит генерацию PDF с лучшими цитатами в очередь и сразу отвечает пользователю."""
     if update.message:
         await update.message.reply_text("Генерирую PDF с лучшими цитатами...")
-        pdf_path = make_pdf("best_quotes.pdf")
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, "rb") as pdf_file:
-                await update.message.reply_document(pdf_file, filename="best_quotes.pdf")
-        else:
-            await update.message.reply_text("Не удалось создать PDF-файл. Возможно, нет лучших цитат.")
+        # Deliver in the background so the handler returns immediately
+        context.application.create_task(deliver_best_quotes(update.message), update=update)
 
-def main() -> None:
-    """Start the bot."""
-    # Get token from environment
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not token:
-        raise ValueError("No TELEGRAM_BOT_TOKEN found in environment variables")
+async def show_search_page(query: str, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Return the text and paging keyboard of one page of search results."""
+    results = await search_quotes_async(query, page, SEARCH_PAGE_SIZE)
+    text = format_search_results(query, results.quotes, page, SEARCH_PAGE_SIZE)
+    return text, search_keyboard(page, results.has_more)
+
+@timed(HANDLER_SECONDS, handler='handle_search')
+async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /search <words>: show the best matching quotes, with buttons to page through them."""
+    if not update.message:
+        return
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text("Usage: /search <words from a quote, book or author>")
+        return
+    # The paging buttons only carry the page number, the query stays with the user
+    context.user_data['search_query'] = query
+    try:
+        text, reply_markup = await show_search_page(query, 0)
+    except Exception as e:
+        logger.error(f"Error searching quotes: {e}")
+        await update.message.reply_text("Search failed, please try again later.")
+        return
+    await update.message.reply_text(text, parse_mode=QUOTE_PARSE_MODE, reply_markup=reply_markup)
+
+@timed(HANDLER_SECONDS, handler='handle_search_page')
+async def handle_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the Back/More buttons under search results."""
+    query = update.callback_query
+    if not (query and query.data and query.message):
+        return
+    search_query = context.user_data.get('search_query')
+    if not search_query:
+        await query.answer("This search has expired, please search again.", show_alert=True)
+        return
+    page = int(query.data.split('_')[1])
+    try:
+        text, reply_markup = await show_search_page(search_query, page)
+    except Exception as e:
+        logger.error(f"Error searching quotes: {e}")
+        await query.answer("Search failed, please try again later.", show_alert=True)
+        return
+    await query.answer()
+    await query.edit_message_text(text, parse_mode=QUOTE_PARSE_MODE, reply_markup=reply_markup)
+
+async def log_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write a summary of the latency histograms to the log."""
+    log_summary()
+
+async def post_init(application: Application) -> None:
+    """Restore saved schedules in one bulk read and start the metrics endpoint before the bot starts."""
+    global metrics_server
+    subscriptions = await load_subscriptions_async()
+    for user_id, (period, times) in subscriptions.items():
+        if period in PERIODS and scheduler.owns(user_id):
+            # The stored slots, so users keep the times they signed up for
+            scheduler.subscribe(user_id, times)
+    logger.info(f"Restored {len(scheduler)} subscriptions")
+    prefetcher.start_refill()
+    if METRICS_PORT:
+        # Every worker process serves its own metrics, on consecutive ports
+        metrics_server = start_http_server(METRICS_PORT + scheduler.shard)
+
+async def post_stop(application: Application) -> None:
+    """Send what is still queued while the bot can still make requests."""
+    await send_queue.close()
+
+async def post_shutdown(application: Application) -> None:
+    """Stop the PDF workers, write pending votes and seen quotes and stop the database thread pool."""
+    pdf_queue.shutdown()
+    rating_buffer.flush()
+    await prefetcher.flush()
+    shutdown_executor()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    log_summary()
 
-    # Create the Application
-    application = Application.builder().token(token).build()
+# Update types the handlers use, documents arrive as messages
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# How updates are received, can be overridden with BOT_MODE
+BOT_MODES = ('polling', 'webhook', 'sharded')
+DEFAULT_BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Bot API server, for a self-hosted one, e.g. http://localhost:8081
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+def configure_shard(shard: int, shards: int) -> None:
+    """Make this process schedule only the users of one shard out of several workers."""
+    global scheduler, send_queue
+    scheduler = QuoteScheduler(shard, shards)
+    # Telegram's global limit is per bot, so the workers split it
+    send_queue = SendQueue(rate=MAX_SENDS_PER_SECOND / shards)
+
+def build_application(token: str, with_updater: bool = True) -> Application:
+    """
+    Create the Application with all handlers and scheduled jobs registered.
+    
+    Args:
+        token (str): Bot token
+        with_updater (bool): False for workers that are handed updates by a dispatcher
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(CONCURRENT_UPDATES)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add conversation handler for settings
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler('settings', settings),
-            MessageHandler(filters.Regex('^➕ Add quotes$'), add_quotes_entry),
-            MessageHandler(filters.Regex('^🏆 Best_quotes$'), handle_best_quotes)
+            MessageHandler(filters.Regex(f'^{ADD_QUOTES_BUTTON}$'), add_quotes_entry),
+            MessageHandler(filters.Regex(f'^{BEST_QUOTES_BUTTON}$'), handle_best_quotes)
         ],
         states={
             SETTING_PERIOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_period)],
@@ -266,15 +514,81 @@ def main() -> None:
     # Add handlers
     application.add_handler(CommandHandler('start', start))
     application.add_handler(conv_handler)
-    application.add_handler(MessageHandler(filters.Regex('^📚 Get a Random Quote$'), handle_random_quote))
+    application.add_handler(MessageHandler(filters.Regex(f'^{RANDOM_QUOTE_BUTTON}$'), handle_random_quote))
+    application.add_handler(CommandHandler('search', handle_search))
     application.add_handler(CallbackQueryHandler(handle_like_dislike, pattern='^(like|dislike|disabled)'))
+    application.add_handler(CallbackQueryHandler(handle_search_page, pattern=r'^search_\d+$'))
 
     # Add job for sending quotes
     job_queue = application.job_queue
     if job_queue:
-        job_queue.run_repeating(send_quote, interval=60)  # Check every minute
+        # Check every minute, aligned to the start of the minute
+        first = 60 - datetime.now().second
+        job_queue.run_repeating(send_quote, interval=60, first=first)
+        job_queue.run_repeating(flush_ratings, interval=RATING_FLUSH_INTERVAL)
+        job_queue.run_repeating(flush_seen, interval=RATING_FLUSH_INTERVAL)
+        if METRICS_LOG_INTERVAL:
+            job_queue.run_repeating(log_metrics, interval=METRICS_LOG_INTERVAL, first=METRICS_LOG_INTERVAL)
 
-    # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    return application
 
+def webhook_config() -> dict:
+    """
+    Read the webhook settings from the environment.
+    
+    Configured with WEBHOOK_URL (public HTTPS base URL, required),
+    WEBHOOK_SECRET (required, checked against the secret token header of
+    every request), WEBHOOK_LISTEN, WEBHOOK_PORT and WEBHOOK_PATH.
+    
+    Returns:
+        dict: listen, port, url_path, webhook_url and secret_token
+    
+    Raises:
+        ValueError: If WEBHOOK_URL or WEBHOOK_SECRET is missing
+    """
+    base_url = os.getenv('WEBHOOK_URL')
+    if not base_url:
+        raise ValueError("No WEBHOOK_URL found in environment variables")
+    secret = os.getenv('WEBHOOK_SECRET')
+    if not secret:
+        raise ValueError("No WEBHOOK_SECRET found in environment variables")
+    url_path = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    return {
+        'listen': os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        'port': int(os.getenv('WEBHOOK_PORT', '8443')),
+        'url_path': url_path,
+        'webhook_url': f"{base_url.rstrip('/')}/{url_path}",
+        'secret_token': secret,
+    }
+
+def main(mode: str = DEFAULT_BOT_MODE, workers: int | None = None) -> None:
+    """
+    Start the bot.
+    
+    Args:
+        mode (str): 'polling' to fetch updates with getUpdates, 'webhook' to
+            receive them over HTTP, 'sharded' to receive them over HTTP and
+            spread users across several worker processes
+        workers (int | None): Number of worker processes in sharded mode
+    """
+    if mode not in BOT_MODES:
+        raise ValueError(f"Unknown bot mode: {mode}")
 
+    # Get token from environment
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        raise ValueError("No TELEGRAM_BOT_TOKEN found in environment variables")
+
+    if mode == 'sharded':
+        # Imported here so the single-process modes never load the dispatcher
+        from app.sharding import BOT_WORKERS, run_sharded
+        run_sharded(token, workers or BOT_WORKERS)
+        return
+
+    application = build_application(token)
+
+    # Start the Bot
+    if mode == 'webhook':
+        application.run_webhook(**webhook_config(), allowed_updates=ALLOWED_UPDATES)
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
@@ -1,77 +1,412 @@
+import os
 import sqlite3
 import json
+import logging
+import threading
 from datetime import datetime, timedelta
-from db.db_modify import modify_cell
+from app.messages import decode_payload
+from app.metrics import DB_SECONDS, timed
+from app.weighted_sampler import WeightPolicy, WeightedQuoteSampler
+from db.connection import get_connection, transaction
+from db.db_seen import SeenSet, load_seen, save_seen
 import random
 
+logger = logging.getLogger(__name__)
+
+# Random ids looked up per quote still needed in each sampling round
+OVERSAMPLE = 4
+
+# Minimum number of random ids looked up in a sampling round
+MIN_SAMPLE = 16
+
+# Sampling rounds before falling back to the last_seen index
+SAMPLE_ROUNDS = 3
+
+# Upper bound on bound parameters per IN (...) lookup
+MAX_LOOKUP_IDS = 500
+
+# How long a reserved quote stays hidden
+RESERVATION = timedelta(hours=168)
+
+# Columns of quotes_view, which carries the book and author names
+QUOTE_FIELDS = ('id', 'content', 'book', 'author', 'entry_date', 'value', 'last_seen', 'payload', 'content_hash')
+QUOTE_COLUMNS = ", ".join(QUOTE_FIELDS)
+
+# Position of the eligibility flag _lookup_rows appends to each row
+ELIGIBLE = len(QUOTE_FIELDS)
+
+# Random quotes tried per user before scanning for one they haven't seen
+UNSEEN_CANDIDATES = 8
+
+# Ids read per query when scanning for an unseen quote
+SCAN_PAGE_SIZE = 1000
+
+# "weighted" favours liked quotes, "uniform" ignores ratings
+QUOTE_SELECTION = os.getenv("QUOTE_SELECTION", "weighted")
+
+_sampler: WeightedQuoteSampler | None = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler() -> WeightedQuoteSampler | None:
+    """
+    Returns the process-wide weighted sampler, loading it on first use.
+
+    Loading reads the whole table, seconds on a large catalogue, so it must
+    not be called inside a write transaction: it would hold the write lock
+    for the whole load.
+    """
+    global _sampler
+    if QUOTE_SELECTION != "weighted":
+        return None
+    with _sampler_lock:
+        if _sampler is None:
+            sampler = WeightedQuoteSampler(WeightPolicy.from_env())
+            sampler.load(get_connection().cursor())
+            _sampler = sampler
+        return _sampler
+
+
+def on_ratings_flushed(deltas: dict[int, list[int]]) -> None:
+    """
+    Updates the weighted sampler after votes are written.
+
+    Args:
+        deltas (dict[int, list[int]]): Mapping of quote id to [likes, dislikes] added
+    """
+    if _sampler is not None:
+        _sampler.apply_rating_deltas(deltas)
+
+
+def _row_to_dict(row) -> dict:
+    """Converts a quotes row selected with QUOTE_COLUMNS to a dictionary."""
+    quote = dict(zip(QUOTE_FIELDS, row))
+    quote['payload'] = decode_payload(quote['payload'])
+    return quote
+
+
+def _lookup_rows(cursor, ids, current_time):
+    """
+    Fetches the rows with the given ids, plus a flag at row[ELIGIBLE] telling whether each is eligible.
+    """
+    rows = []
+    for start in range(0, len(ids), MAX_LOOKUP_IDS):
+        chunk = ids[start:start + MAX_LOOKUP_IDS]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT {QUOTE_COLUMNS}, last_seen < ?
+            FROM quotes_view
+            WHERE id IN ({placeholders})
+        """, (current_time, *chunk))
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def _id_bounds(cursor):
+    """Returns the smallest and largest quote id, (None, None) for an empty table."""
+    # Separate subqueries so SQLite can answer each from the end of the primary key
+    cursor.execute("SELECT (SELECT MIN(id) FROM quotes), (SELECT MAX(id) FROM quotes)")
+    return cursor.fetchone()
+
+
+def _pick_weighted_rows(cursor, sampler, current_time, new_last_seen, count):
+    """
+    Picks up to count distinct eligible rows drawn from the weighted sampler.
+
+    Ids the sampler still believed eligible but which were reserved elsewhere
+    or deleted are corrected in the sampler and redrawn.
+    """
+    sampler.sync_new(cursor)
+    picked = {}
+    for _ in range(SAMPLE_ROUNDS):
+        remaining = count - len(picked)
+        if remaining <= 0:
+            break
+        ids = sampler.draw(remaining, current_time, new_last_seen)
+        if not ids:
+            break
+        found = set()
+        for row in _lookup_rows(cursor, ids, current_time):
+            found.add(row[0])
+            if row[ELIGIBLE]:
+                picked[row[0]] = row[:ELIGIBLE]
+            else:
+                sampler.hide(row[0], row[6])
+        for id in ids:
+            if id not in found:
+                sampler.remove(id)
+    return list(picked.values())
+
+
+def _pick_eligible_rows(cursor, current_time, count):
+    """
+    Picks up to count distinct random rows whose last_seen is earlier than current_time.
+
+    Samples random ids from the primary key range and looks them up in one
+    IN (...) query per round, so each round costs O(k log n). When the
+    eligible pool is too sparse for sampling to fill the request, falls back
+    to the last_seen index, which only walks the (small) set of eligible rows
+    instead of the whole table.
+    """
+    min_id, max_id = _id_bounds(cursor)
+    if min_id is None:
+        return []
+
+    picked = {}
+    span = max_id - min_id + 1
+    for _ in range(SAMPLE_ROUNDS):
+        remaining = count - len(picked)
+        if remaining <= 0:
+            break
+        sample_size = min(span, max(remaining * OVERSAMPLE, MIN_SAMPLE))
+        ids = [i for i in random.sample(range(min_id, max_id + 1), sample_size) if i not in picked]
+        for row in _lookup_rows(cursor, ids, current_time):
+            if row[ELIGIBLE]:
+                picked[row[0]] = row[:ELIGIBLE]
+
+    rows = list(picked.values())
+    random.shuffle(rows)
+    if len(rows) >= count:
+        return rows[:count]
+
+    # Sparse pool: random order over the last_seen index only
+    cursor.execute(f"""
+        SELECT {QUOTE_COLUMNS}
+        FROM quotes_view
+        WHERE last_seen < ?
+        ORDER BY RANDOM()
+        LIMIT ?
+    """, (current_time, count + len(picked)))
+    for row in cursor.fetchall():
+        if len(rows) >= count:
+            break
+        if row[0] not in picked:
+            picked[row[0]] = row
+            rows.append(row)
+    return rows
+
+
+@timed(DB_SECONDS, function='reserve_random_quotes')
+def reserve_random_quotes(count: int) -> list[dict]:
+    """
+    Reserves up to count distinct random quotes whose last_seen is earlier than current time.
+
+    The quotes are picked and their last_seen is pushed 168 hours ahead in a
+    single transaction, so a whole broadcast costs a handful of statements.
+
+    Args:
+        count (int): Number of quotes wanted
+
+    Returns:
+        list[dict]: The reserved quotes, fewer than count if not enough are available
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    if count <= 0:
+        return []
+
+    current_time = datetime.now()
+    new_last_seen = current_time + RESERVATION
+
+    global _sampler
+    try:
+        # Loaded with a plain read first, the write lock is only taken for the draw itself
+        sampler = _get_sampler()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            if sampler is not None:
+                rows = _pick_weighted_rows(cursor, sampler, current_time, new_last_seen, count)
+                if len(rows) < count:
+                    # Top up uniformly, e.g. when the sampler is out of date
+                    picked = {row[0] for row in rows}
+                    for row in _pick_eligible_rows(cursor, current_time, count):
+                        if len(rows) < count and row[0] not in picked:
+                            rows.append(row)
+                            sampler.hide(row[0], new_last_seen)
+            else:
+                rows = _pick_eligible_rows(cursor, current_time, count)
+            cursor.executemany("""
+                UPDATE quotes
+                SET last_seen = ?
+                WHERE id = ?
+            """, [(new_last_seen, row[0]) for row in rows])
+    except sqlite3.Error as e:
+        # Draws from the rolled back transaction are no longer reserved
+        _sampler = None
+        logger.error(f"Database error: {e}")
+        raise
+
+    if len(rows) < count:
+        logger.warning(f"Only {len(rows)} of {count} requested quotes are available")
+    return [_row_to_dict(row) for row in rows]
+
+
+def _draw_candidates(cursor, sampler, count):
+    """Draws random quote ids, by rating weight when the sampler is enabled."""
+    if sampler is not None:
+        return sampler.sample(count)
+    min_id, max_id = _id_bounds(cursor)
+    if min_id is None:
+        return []
+    return [random.randint(min_id, max_id) for _ in range(count)]
+
+
+def _scan_unseen(cursor, seen: SeenSet):
+    """
+    Walks the primary key from a random point, wrapping around, for a quote not in seen.
+
+    Only needed near the end of a user's pass over the catalogue. When every
+    quote has been seen, the pass starts over and the first quote visited is used.
+    """
+    min_id, max_id = _id_bounds(cursor)
+    if min_id is None:
+        return None
+    start = random.randint(min_id, max_id)
+    first = None
+    for low, high in ((start, max_id), (min_id, start - 1)):
+        while low <= high:
+            cursor.execute(
+                "SELECT id FROM quotes WHERE id BETWEEN ? AND ? ORDER BY id LIMIT ?",
+                (low, high, SCAN_PAGE_SIZE),
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            if first is None:
+                first = ids[0]
+            for id in ids:
+                if id not in seen:
+                    return id
+            low = ids[-1] + 1
+    if first is not None:
+        seen.clear()
+    return first
+
+
+@timed(DB_SECONDS, function='pick_unseen_quotes')
+def pick_unseen_quotes(user_ids: list[int]) -> dict[int, dict]:
+    """
+    Picks one quote per user among the quotes that user hasn't received yet.
+
+    Every user walks through the whole catalogue independently: the global
+    last_seen reservation is not involved, so a quote sent to one user stays
+    available to everyone else. Candidates come from the weighted sampler (or
+    uniform id sampling) and are checked against each user's seen bitmap,
+    one lookup per round covers all users. Once a user has seen every quote,
+    their history is cleared and a new pass begins.
+
+    Args:
+        user_ids (list[int]): Telegram user ids, typically the users due in this minute
+
+    Returns:
+        dict[int, dict]: Mapping of user id to the picked quote, users are missing
+            only when there are no quotes at all
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    if not user_ids:
+        return {}
+
+    current_time = datetime.now()
+    seen = load_seen(user_ids)
+    picked = {}
+    try:
+        cursor = get_connection().cursor()
+        sampler = _get_sampler()
+        if sampler is not None:
+            sampler.sync_new(cursor)
+
+        for _ in range(SAMPLE_ROUNDS):
+            choices = {}
+            for user_id in user_ids:
+                if user_id in picked:
+                    continue
+                user_seen = seen[user_id]
+                for id in _draw_candidates(cursor, sampler, UNSEEN_CANDIDATES):
+                    if id not in user_seen:
+                        choices[user_id] = id
+                        break
+            if not choices:
+                break
+            rows = {row[0]: row[:ELIGIBLE] for row in _lookup_rows(cursor, list(set(choices.values())), current_time)}
+            for user_id, id in choices.items():
+                if id in rows:
+                    picked[user_id] = rows[id]
+                elif sampler is not None:
+                    # Deleted since the sampler was loaded
+                    sampler.remove(id)
+
+        for user_id in user_ids:
+            if user_id not in picked:
+                id = _scan_unseen(cursor, seen[user_id])
+                rows = _lookup_rows(cursor, [id], current_time) if id is not None else []
+                if rows:
+                    picked[user_id] = rows[0][:ELIGIBLE]
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+    for user_id, row in picked.items():
+        seen[user_id].add(row[0])
+    save_seen(seen.values())
+    return {user_id: _row_to_dict(row) for user_id, row in picked.items()}
+
+
+def draw_quotes(count: int) -> list[dict]:
+    """
+    Draws up to count distinct random quotes in one lookup, without reserving them.
+
+    Used to fill the prefetch buffer, whose quotes are recorded as seen per
+    user when they are handed out.
+
+    Args:
+        count (int): Number of quotes wanted
+
+    Returns:
+        list[dict]: The drawn quotes, possibly fewer than count
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    try:
+        cursor = get_connection().cursor()
+        sampler = _get_sampler()
+        if sampler is not None:
+            sampler.sync_new(cursor)
+        ids = list(dict.fromkeys(_draw_candidates(cursor, sampler, count)))
+        rows = _lookup_rows(cursor, ids, datetime.now())
+        if sampler is not None and len(rows) < len(ids):
+            # Deleted since the sampler was loaded
+            found = {row[0] for row in rows}
+            for id in ids:
+                if id not in found:
+                    sampler.remove(id)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+    random.shuffle(rows)
+    return [_row_to_dict(row) for row in rows]
+
+
+@timed(DB_SECONDS, function='get_random_quote')
 def get_random_quote():
     """
     Gets a random quote from the database where last_seen is earlier than current time.
-    Uses efficient random selection for large datasets.
+    Draws from the weighted sampler (or uniform primary-key sampling) with a
+    fallback to the last_seen index, so the cost does not grow with the size of the table.
     Returns the quote data as JSON.
     """
-    conn = None
     try:
-        # Connect to the database
-        conn = sqlite3.connect('quotes.db')
-        cursor = conn.cursor()
-        
-        # Get current time
-        current_time = datetime.now()
-        
-        # First, get the count of available quotes
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM quotes 
-            WHERE last_seen < ?
-        """, (current_time,))
-        
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            return json.dumps({'error': 'No quotes available'})
-            
-        # Get a random offset
-        random_offset = random.randint(0, count - 1)
-        
-        # Query to get a quote at the random offset
-        cursor.execute("""
-            SELECT id, content, book, author, entry_date, value, last_seen 
-            FROM quotes 
-            WHERE last_seen < ? 
-            LIMIT 1 OFFSET ?
-        """, (current_time, random_offset))
-        
-        # Get the result
-        result = cursor.fetchone()
-        
-        if result:
-            # Convert to dictionary
-            quote_dict = {
-                'id': result[0],
-                'content': result[1],
-                'book': result[2],
-                'author': result[3],
-                'entry_date': result[4],
-                'value': result[5],
-                'last_seen': result[6]
-            }
-            
-            # Calculate new last_seen (current time + 168 hours)
-            new_last_seen = current_time + timedelta(hours=168)
-            
-            # Update last_seen using modify_cell function
-            modify_cell(result[0], 'last_seen', new_last_seen)
-            
-            return json.dumps(quote_dict, ensure_ascii=False)
+        quotes = reserve_random_quotes(1)
+
+        if quotes:
+            return json.dumps(quotes[0], ensure_ascii=False)
         else:
             return json.dumps({'error': 'No quotes available'})
-            
+
     except sqlite3.Error as e:
         return json.dumps({'error': f'Database error: {str(e)}'})
     except Exception as e:
         return json.dumps({'error': f'Unexpected error: {str(e)}'})
-    finally:
-        if conn:
-            conn.close()
-
@@ -1,4 +1,3 @@
-import sqlite3
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
@@ -8,61 +7,52 @@ from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os
+import shutil
+import logging
+import tempfile
+from functools import cache
+from itertools import dropwhile, islice
+from xml.sax.saxutils import escape
+from db.connection import get_connection, get_db_path
+from db.db_ratings import iter_best_quotes
 
+logger = logging.getLogger(__name__)
 
-def make_pdf(output_path="best_quotes.pdf"):
+FONT_NAME = "DejaVuSans"
+FONT_PATH = os.path.join(os.path.dirname(__file__), "DejaVuSans.ttf")
+
+# Maximum number of quotes in the best quotes PDF, can be overridden with BEST_QUOTES_LIMIT
+BEST_QUOTES_LIMIT = int(os.getenv("BEST_QUOTES_LIMIT", "1000"))
+
+# Maximum number of pages per PDF volume, can be overridden with MAX_PDF_PAGES
+MAX_PAGES_PER_VOLUME = int(os.getenv("MAX_PDF_PAGES", "500"))
+
+# Number of flowables pulled from the database stream at a time
+FLOWABLE_WINDOW = 300
+
+# Directory holding the cached best quotes PDF, can be overridden with PDF_CACHE_DIR
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+
+# Prefix of the per-version cache directories, build directories must not start with it
+CACHE_DIR_PREFIX = "best_quotes_v"
+
+
+@cache
+def _get_styles():
     """
-    Fetches quotes with value 10 from quotes.db and generates a PDF file.
-    Each quote has content, and at the bottom, author and book in smaller font.
-    Quotes are sorted alphabetically by book.
-    Returns the path to the generated PDF file.
+    Registers the Unicode font and builds the paragraph styles, once per process.
+    Returns (quote_style, author_style), or None if the font file is missing.
     """
-    # Register a Unicode font (DejaVuSans)
-    font_name = "DejaVuSans"
-    font_path = os.path.join(os.path.dirname(__file__), "DejaVuSans.ttf")
-    if not os.path.exists(font_path):
-        print( f"Font file not found: {font_path}")
+    if not os.path.exists(FONT_PATH):
+        logger.error(f"Font file not found: {FONT_PATH}")
         return None
-    pdfmetrics.registerFont(TTFont(font_name, font_path))
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
 
-    # Check if database exists
-    if not os.path.exists("quotes.db"):
-        # Setup PDF
-        doc = SimpleDocTemplate(output_path, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-        story = []
-        styles = getSampleStyleSheet()
-        quote_style = ParagraphStyle(
-            'Quote',
-            parent=styles['Normal'],
-            fontName=font_name,
-            fontSize=14,
-            leading=18,
-            spaceAfter=12,
-        )
-        story.append(Paragraph("No best quotes found.", quote_style))
-        doc.build(story)
-        return output_path
-
-    # Connect to the database
-    conn = sqlite3.connect("quotes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT content, book, author FROM quotes WHERE value = 10
-    """)
-    quotes = cursor.fetchall()
-    conn.close()
-
-    # Sort quotes by book (alphabetically)
-    quotes.sort(key=lambda x: (x[1] or '').lower())
-
-    # Setup PDF
-    doc = SimpleDocTemplate(output_path, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-    story = []
     styles = getSampleStyleSheet()
     quote_style = ParagraphStyle(
         'Quote',
         parent=styles['Normal'],
-        fontName=font_name,
+        fontName=FONT_NAME,
         fontSize=14,
         leading=18,
         spaceAfter=12,
@@ -70,7 +60,7 @@ def make_pdf(output_path="best_quotes.pdf"):
     author_style = ParagraphStyle(
         'AuthorBook',
         parent=styles['Normal'],
-        fontName=font_name,
+        fontName=FONT_NAME,
         fontSize=10,
         leading=12,
         textColor=colors.grey,
@@ -78,16 +68,208 @@ def make_pdf(output_path="best_quotes.pdf"):
         italic=True,
         spaceAfter=24,
     )
+    return quote_style, author_style
+
+
+class StreamingDocTemplate(SimpleDocTemplate):
+    """
+    Document template that pulls flowables from an iterator while it builds.
+    Only a small window of flowables is held in memory at a time. When
+    max_pages is set, the build stops before the next flowable would spill
+    past the last allowed page, leaving the rest of the source for another volume.
+    """
+
+    def __init__(self, filename, source, max_pages=None, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.source = source
+        self.max_pages = max_pages
+        self.leftover = []
+        self._story = None
 
+    def build(self, flowables, *args, **kwargs):
+        self._story = flowables
+        super().build(flowables, *args, **kwargs)
+
+    def filterFlowables(self, flowables):
+        # Also called for reportlab's internal page-begin list, which is left alone
+        if flowables is not self._story:
+            return
+
+        # Top up the window from the source before it runs dry
+        if len(flowables) <= FLOWABLE_WINDOW:
+            flowables.extend(islice(self.source, FLOWABLE_WINDOW))
+
+        if self.max_pages is None or self.page < self.max_pages or flowables[0] is None:
+            return
+
+        # On the last allowed page, stop before anything that doesn't fit.
+        # An empty page always takes the flowable, so oversized quotes still progress.
+        frame = self.frame
+        _, height = flowables[0].wrap(frame._getAvailableWidth(), frame._aH)
+        if self._curPageFlowableCount and height > frame._y - frame._y1p:
+            self.leftover = flowables[:]
+            del flowables[1:]
+            flowables[0] = None
+
+
+def _iter_quote_flowables(quotes, quote_style, author_style):
+    """
+    Yields the flowables for each (content, book, author) row.
+    """
     for content, book, author in quotes:
-        story.append(Paragraph(content, quote_style))
-        author_book = f"{author or ''} <br/><i>{book or ''}</i>"
-        story.append(Paragraph(author_book, author_style))
-        story.append(Spacer(1, 0.5*cm))
+        yield Paragraph(escape(content), quote_style)
+        author_book = f"{escape(author or '')} <br/><i>{escape(book or '')}</i>"
+        yield Paragraph(author_book, author_style)
+        yield Spacer(1, 0.5*cm)
+
+
+def _new_doc(output_path, source, max_pages=None):
+    return StreamingDocTemplate(
+        output_path, source, max_pages=max_pages,
+        pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm,
+    )
+
+
+def _volume_path(output_path, number):
+    """Returns output_path for the first volume and name_<n>.pdf for the others."""
+    if number == 1:
+        return output_path
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{number}{ext}"
+
+
+def make_pdf_volumes(output_path="best_quotes.pdf", limit=BEST_QUOTES_LIMIT, max_pages=MAX_PAGES_PER_VOLUME):
+    """
+    Fetches the top liked quotes (positive score) from the quotes database and generates PDF files.
+    Each quote has content, and at the bottom, author and book in smaller font.
+    Quotes are ranked by score, then alphabetically by book, and streamed
+    from the ranking index straight into the documents, so memory stays
+    bounded however many quotes are exported.
+    A new volume (name_2.pdf, name_3.pdf, ...) is started whenever a
+    document reaches max_pages pages.
+    Returns the list of generated paths, or None if the font is missing.
+    """
+    styles = _get_styles()
+    if styles is None:
+        return None
+    quote_style, author_style = styles
+
+    # Check if database exists
+    quotes = iter_best_quotes(limit) if os.path.exists(get_db_path()) else iter(())
+    source = _iter_quote_flowables(quotes, quote_style, author_style)
+
+    first = list(islice(source, FLOWABLE_WINDOW))
+    if not first:
+        doc = _new_doc(output_path, iter(()))
+        doc.build([Paragraph("No best quotes found.", quote_style)])
+        return [output_path]
+
+    paths = []
+    story = first
+    while story:
+        path = _volume_path(output_path, len(paths) + 1)
+        doc = _new_doc(path, source, max_pages)
+        doc.build(story)
+        paths.append(path)
+        # A spacer carried over on its own would produce an empty volume
+        story = list(dropwhile(lambda f: isinstance(f, Spacer), doc.leftover))
+        if doc.leftover and not story:
+            story = list(islice(source, FLOWABLE_WINDOW))
+    return paths
+
+
+def make_pdf(output_path="best_quotes.pdf", limit=BEST_QUOTES_LIMIT):
+    """
+    Generates the best quotes PDF as a single document of any length.
+    Returns the path to the generated PDF file.
+    """
+    volumes = make_pdf_volumes(output_path, limit, max_pages=None)
+    return volumes[0] if volumes else None
+
+
+def get_best_quotes_version():
+    """
+    Returns the version of the liked quotes set.
+    The version is bumped by database triggers whenever a liked quote is
+    added, changed, removed, liked or unliked.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT value FROM meta WHERE key = 'best_quotes_version'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _cache_dir(version):
+    return os.path.join(PDF_CACHE_DIR, f"{CACHE_DIR_PREFIX}{version}")
+
+
+def _cached_versions():
+    """Returns the versions that have a cache directory, oldest first."""
+    versions = []
+    for name in os.listdir(PDF_CACHE_DIR):
+        suffix = name[len(CACHE_DIR_PREFIX):]
+        if name.startswith(CACHE_DIR_PREFIX) and suffix.isdigit():
+            versions.append(int(suffix))
+    return sorted(versions)
+
+
+def _drop_old_versions(version):
+    """
+    Deletes the documents of versions older than version, except the newest of them.
+
+    Newer versions built by other processes are left alone, and the previous
+    version is kept until the next build, so deliveries that already got its
+    paths can still open them.
+    """
+    older = [cached for cached in _cached_versions() if cached < version]
+    for cached in older[:-1]:
+        shutil.rmtree(_cache_dir(cached), ignore_errors=True)
+
+
+def get_cached_best_quotes_pdfs(version):
+    """
+    Returns the cached volume paths for a version of the liked set, or None if not built yet.
+    """
+    directory = _cache_dir(version)
+    if not os.path.isdir(directory):
+        return None
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory), key=_volume_number)]
+
+
+def _volume_number(name):
+    stem = os.path.splitext(name)[0]
+    suffix = stem.rsplit("_", 1)[-1]
+    return int(suffix) if suffix.isdigit() else 1
+
+
+def get_best_quotes_pdfs():
+    """
+    Returns the paths to up-to-date best quotes PDF volumes, building them
+    only when the liked set has changed since the cached copy was made.
+    Each build writes into its own temporary directory which is renamed into
+    place, so concurrent requests never see half-written documents.
+    Returns None if the PDF could not be generated.
+    """
+    version = get_best_quotes_version()
+    cached = get_cached_best_quotes_pdfs(version)
+    if cached:
+        return cached
 
-    if not story:
-        story.append(Paragraph("No best quotes found.", quote_style))
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="build_", suffix=".tmp", dir=PDF_CACHE_DIR)
+    try:
+        if make_pdf_volumes(os.path.join(tmp_dir, "best_quotes.pdf")) is None:
+            return None
+        try:
+            os.replace(tmp_dir, _cache_dir(version))
+        except OSError:
+            # Another build of the same version finished first
+            pass
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    doc.build(story)
-    return output_path
+    _drop_old_versions(version)
 
+    logger.info(f"Built best quotes PDF for version {version}")
+    return get_cached_best_quotes_pdfs(version)
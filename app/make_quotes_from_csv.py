@@ -1,4 +1,29 @@
 import csv
+import time
+import logging
+import argparse
+from itertools import chain
+from typing import Iterable, Iterator
+from db.db_fill_in import ImportResult, db_fill_in_rows
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Column positions of the source (book), author and quote
+SOURCE_COLUMN = 0
+AUTHOR_COLUMN = 1
+QUOTE_COLUMN = 2
+
+# First-row values that mark a header line rather than a quote
+HEADER_NAMES = {'source', 'book', 'title', 'author', 'quote', 'content', 'text',
+                'источник', 'книга', 'название', 'автор', 'цитата', 'текст'}
+
+# Books listed one by one in the command line summary
+MAX_LISTED_BOOKS = 50
+
+# Quotes can span many lines, allow fields well beyond the csv module's 128 KiB default
+FIELD_SIZE_LIMIT = 16 * 1024 * 1024
 
 # This function takes a filename, opens the CSV file, and prints each row as a list.
 def make_str_from_csv_file(filename):
@@ -22,3 +47,114 @@ def make_str_from_csv_file(filename):
 def to_md(data: str):
     with open('output.md', 'w', encoding='utf-8') as mdfile:
         mdfile.write(data)
+
+def _is_header(row: list[str]) -> bool:
+    """Tells whether a first row names the columns instead of holding a quote."""
+    return len(row) > QUOTE_COLUMN and all(
+        row[column].strip().lower() in HEADER_NAMES
+        for column in (SOURCE_COLUMN, AUTHOR_COLUMN, QUOTE_COLUMN)
+    )
+
+def iter_csv_quotes(file_path: str, delimiter: str = ',') -> Iterator[tuple[str | None, str | None, str]]:
+    """
+    Streams (source, author, quote) rows from a CSV file.
+
+    The file is read row by row. A header row is recognised by its column
+    names and skipped, as are rows without a quote. Empty source and author
+    cells become None.
+
+    Args:
+        file_path (str): Path to the CSV file, in UTF-8 (a BOM is allowed)
+        delimiter (str): Field separator
+
+    Yields:
+        tuple: source, author and quote of each row
+    """
+    csv.field_size_limit(FIELD_SIZE_LIMIT)
+    skipped = 0
+    with open(file_path, newline='', encoding='utf-8-sig') as csvfile:
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        for row in reader:
+            if reader.line_num == 1 and _is_header(row):
+                continue
+            quote = row[QUOTE_COLUMN].strip() if len(row) > QUOTE_COLUMN else ''
+            if not quote:
+                skipped += 1
+                continue
+            yield row[SOURCE_COLUMN].strip() or None, row[AUTHOR_COLUMN].strip() or None, quote
+    if skipped:
+        logger.warning(f"Skipped {skipped} rows without a quote in {file_path}")
+
+def import_csv_files(
+    file_paths: Iterable[str],
+    value: int = 5,
+    delimiter: str = ',',
+    single_transaction: bool = True,
+) -> list[ImportResult]:
+    """
+    Streams the quotes of one or more CSV files into the database.
+
+    Args:
+        file_paths (Iterable[str]): Paths to CSV files with source, author and quote columns
+        value (int): Rating value of the quotes, defaults to 5
+        delimiter (str): Field separator
+        single_transaction (bool): Import everything or nothing in one transaction,
+            otherwise commit every batch, see db_fill_in_rows
+
+    Returns:
+        list[ImportResult]: Quotes added and skipped for each (source, author) pair
+
+    Raises:
+        FileNotFoundError: If a file doesn't exist
+        ValueError: If the files contain no quotes
+    """
+    rows = chain.from_iterable(iter_csv_quotes(path, delimiter) for path in file_paths)
+    results = db_fill_in_rows(rows, value, single_transaction)
+    if not results:
+        raise ValueError("No quotes found in the file")
+    return results
+
+def import_csv_file(file_path: str) -> list[ImportResult]:
+    """
+    Streams the quotes of an uploaded CSV file straight into the database.
+
+    Every batch is committed on its own, so the bot keeps recording votes
+    and seen quotes while a large file is imported.
+
+    Args:
+        file_path (str): Path to the CSV file
+
+    Returns:
+        list[ImportResult]: Quotes added and skipped for each (source, author) pair
+    """
+    return import_csv_files([file_path], single_transaction=False)
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point, run with python -m app.make_quotes_from_csv."""
+    parser = argparse.ArgumentParser(
+        description="Import quotes from CSV files with source, author and quote columns.",
+    )
+    parser.add_argument('files', nargs='+', help="CSV files, imported together in one transaction")
+    parser.add_argument('--value', type=int, default=5, choices=range(1, 11), metavar='1-10',
+                        help="Rating value of the imported quotes (default: 5)")
+    parser.add_argument('--delimiter', default=',', help="Field separator (default: ,)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        results = import_csv_files(args.files, args.value, args.delimiter)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Import failed: {e}\n")
+    elapsed = time.perf_counter() - started
+
+    inserted = sum(result.inserted for result in results)
+    skipped = sum(result.skipped for result in results)
+    for result in results[:MAX_LISTED_BOOKS]:
+        print(f"{result.book or '-'} / {result.author or '-'}: {result.inserted} added, {result.skipped} skipped")
+    if len(results) > MAX_LISTED_BOOKS:
+        print(f"... and {len(results) - MAX_LISTED_BOOKS} more books")
+    rate = (inserted + skipped) / elapsed if elapsed else 0
+    print(f"{inserted} quotes added and {skipped} skipped from {len(results)} books in {elapsed:.1f}s ({rate:.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Message bodies and keyboards sent by the bot.
+
+Keyboards are immutable telegram objects, so one instance of each is
+shared by every message instead of being rebuilt per send. Quote texts
+are escaped for MarkdownV2 and split into messages Telegram accepts when
+a quote is imported (render_payload), the result is stored with the quote
+and sends only add the cached signature of its book.
+"""
+import re
+import functools
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+from telegram.constants import MessageLimit, ParseMode
+from telegram.helpers import escape_markdown
+
+from app.cache import TTLCache
+
+# Parse mode matching the escaping done by render_payload
+QUOTE_PARSE_MODE = ParseMode.MARKDOWN_V2
+
+# Longest message text Telegram accepts
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+# Rendered quotes kept in memory, and for how long in seconds
+RENDER_CACHE_SIZE = 10000
+RENDER_CACHE_TTL = 3600
+
+RANDOM_QUOTE_BUTTON = "📚 Get a Random Quote"
+ADD_QUOTES_BUTTON = "➕ Add quotes"
+BEST_QUOTES_BUTTON = "🏆 Best_quotes"
+
+MAIN_MENU = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton(RANDOM_QUOTE_BUTTON)],
+        [KeyboardButton(ADD_QUOTES_BUTTON)],
+        [KeyboardButton(BEST_QUOTES_BUTTON)],
+    ],
+    resize_keyboard=True,
+)
+
+# Shown in place of the rating buttons once a message has been rated
+RATED_KEYBOARDS = {
+    'like': InlineKeyboardMarkup([[InlineKeyboardButton("👍 Liked", callback_data="disabled")]]),
+    'dislike': InlineKeyboardMarkup([[InlineKeyboardButton("👎 Disliked", callback_data="disabled")]]),
+}
+
+# Signatures of distinct book and author pairs kept in memory
+SOURCE_CACHE_SIZE = 4096
+
+# Separates the messages of a quote in its stored payload, never part of a message text
+PART_SEPARATOR = "\x1e"
+
+# Characters of a quote shown in a search result
+SEARCH_PREVIEW_LENGTH = 200
+
+# Format: {(quote_id, content_hash): (parts, reply_markup)}, an edited quote gets a new hash
+_rendered: TTLCache[tuple[int, str | None], tuple[list[str], InlineKeyboardMarkup]] = TTLCache(
+    maxsize=RENDER_CACHE_SIZE, ttl=RENDER_CACHE_TTL
+)
+
+
+def _text_length(text: str) -> int:
+    """Length as Telegram counts it, in UTF-16 code units."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+@functools.lru_cache(maxsize=SOURCE_CACHE_SIZE)
+def format_source(book: str | None, author: str | None) -> str:
+    """
+    Formats the signature of a quote as MarkdownV2: the book in bold and the author in italics.
+
+    Signatures are shared by every quote of a book, so they are cached.
+    """
+    source = []
+    if book:
+        source.append(f"*{escape_markdown(book, version=2)}*")
+    if author:
+        source.append(f"_{escape_markdown(author, version=2)}_")
+    return "\n".join(source)
+
+
+def format_quote(quote: dict) -> str:
+    """
+    Formats a quote as MarkdownV2: the content, then the book in bold and the author in italics.
+    """
+    text = escape_markdown(quote['content'], version=2)
+    source = format_source(quote.get('book'), quote.get('author'))
+    return text + "\n\n" + source if source else text
+
+
+def _split_escaped(text: str, limit: int) -> list[str]:
+    """
+    Escapes text for MarkdownV2 in parts of at most limit UTF-16 code units.
+
+    Parts end at whitespace, a word longer than a whole part is cut between
+    characters. Escape sequences are never split, since every piece is
+    escaped on its own.
+    """
+    parts = []
+    current, length = [], 0
+    for word in re.findall(r'\S+\s*|\s+', text):
+        pieces = [escape_markdown(word, version=2)]
+        if _text_length(pieces[0]) > limit:
+            pieces = [escape_markdown(char, version=2) for char in word]
+        for piece in pieces:
+            size = _text_length(piece)
+            if current and length + size > limit:
+                parts.append("".join(current).rstrip())
+                current, length = [], 0
+            current.append(piece)
+            length += size
+    if current:
+        parts.append("".join(current).rstrip())
+    return [part for part in parts if part]
+
+
+def render_payload(content: str) -> list[str]:
+    """
+    Renders the text of a quote into the message texts it is sent as.
+
+    Most quotes fit in one message. Longer ones are split at whitespace into
+    parts Telegram accepts. The signature is not included, book and author
+    names live in their own tables and are added by sign_payload.
+
+    Args:
+        content (str): The quote text
+
+    Returns:
+        list[str]: MarkdownV2 texts of at most MAX_MESSAGE_LENGTH each, to send with QUOTE_PARSE_MODE
+    """
+    content = content.replace(PART_SEPARATOR, " ")
+    text = escape_markdown(content, version=2)
+    if _text_length(text) <= MAX_MESSAGE_LENGTH:
+        return [text]
+    return _split_escaped(content, MAX_MESSAGE_LENGTH)
+
+
+def sign_payload(parts: list[str], book: str | None, author: str | None) -> list[str]:
+    """
+    Adds the signature to rendered parts: at the end of the last one, or as
+    a message of its own when that one has no room left.
+    """
+    source = format_source(book, author)
+    if not source:
+        return parts
+    if parts:
+        signed = f"{parts[-1]}\n\n{source}"
+        if _text_length(signed) <= MAX_MESSAGE_LENGTH:
+            return [*parts[:-1], signed]
+    if _text_length(source) <= MAX_MESSAGE_LENGTH:
+        return [*parts, source]
+    # Absurdly long names lose their formatting rather than be cut inside it
+    return [*parts, *_split_escaped("\n".join(filter(None, (book, author))), MAX_MESSAGE_LENGTH)]
+
+
+def encode_payload(parts: list[str]) -> str:
+    """Serializes rendered message parts for the payload column of quotes."""
+    return PART_SEPARATOR.join(parts)
+
+
+def decode_payload(payload: str | None) -> list[str] | None:
+    """Reverses encode_payload, None for quotes without a stored payload."""
+    return payload.split(PART_SEPARATOR) if payload else None
+
+
+def rating_keyboard(quote_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("👍 Like", callback_data=f"like_{quote_id}"),
+        InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{quote_id}"),
+    ]])
+
+
+def render_quote(quote: dict) -> tuple[list[str], InlineKeyboardMarkup]:
+    """
+    Returns the message texts and rating keyboard for a quote.
+
+    The texts come from the payload stored at import time, quotes without
+    one are rendered here on first use. The signature is added to the last
+    text, or sent after it if it does not fit. Renders are cached by id and
+    content hash, so a quote edited with modify_cell, even by another
+    process, is rendered again.
+
+    Args:
+        quote (dict): Quote with id, content, book, author, payload and content_hash
+
+    Returns:
+        tuple[list[str], InlineKeyboardMarkup]: Texts to send in order with
+            QUOTE_PARSE_MODE, and the keyboard for the last one
+    """
+    key = (quote['id'], quote.get('content_hash'))
+    rendered = _rendered.get(key)
+    if rendered is None:
+        parts = quote.get('payload') or render_payload(quote['content'])
+        rendered = (sign_payload(parts, quote.get('book'), quote.get('author')), rating_keyboard(quote['id']))
+        _rendered.set(key, rendered)
+    return rendered
+
+
+def format_search_results(query: str, quotes: list[dict], page: int, page_size: int) -> str:
+    """
+    Formats one page of search results as a numbered MarkdownV2 list of shortened quotes.
+    """
+    if not quotes:
+        return escape_markdown(f'Nothing found for "{query}".', version=2)
+    heading = escape_markdown(f'Results for "{query}"', version=2)
+    lines = [f"*{heading}*"]
+    for number, quote in enumerate(quotes, start=page * page_size + 1):
+        content = quote['content']
+        if len(content) > SEARCH_PREVIEW_LENGTH:
+            content = content[:SEARCH_PREVIEW_LENGTH].rstrip() + "…"
+        source = " — ".join(part for part in (quote.get('book'), quote.get('author')) if part)
+        line = f"{number}\\. {escape_markdown(content, version=2)}"
+        if source:
+            line += f"\n_{escape_markdown(source, version=2)}_"
+        lines.append(line)
+    return "\n\n".join(lines)
+
+
+def search_keyboard(page: int, has_more: bool) -> InlineKeyboardMarkup | None:
+    """Returns the keyboard paging through search results, or None on a single page."""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Back", callback_data=f"search_{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("More ➡️", callback_data=f"search_{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
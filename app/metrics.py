@@ -0,0 +1,282 @@
+"""
+In-process metrics: latency histograms of handlers, database calls, PDF
+renders and the scheduler, and the depth of the send queue.
+
+Histograms are kept in memory by each process. They can be scraped in the
+Prometheus text format from the HTTP endpoint started with
+start_http_server, and summarized in the log with log_summary.
+"""
+import os
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator, TypeVar
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Upper bounds of the PDF render buckets, in seconds
+RENDER_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Upper bounds of the queue depth buckets, in messages
+DEPTH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Port of the Prometheus endpoint, disabled when 0, can be overridden with METRICS_PORT
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Seconds between metric summaries in the log, disabled when 0, can be overridden with METRICS_LOG_INTERVAL
+METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "300"))
+
+# Routine messages logged once in this many events, can be overridden with LOG_SAMPLE_EVERY
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+# Quantile reported in the log summary
+SUMMARY_QUANTILE = 0.95
+
+_registry: list["Histogram"] = []
+
+
+class _Series:
+    """Bucket counts and sum of one label combination."""
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int) -> None:
+        # One count per bucket plus the overflow above the last bound
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets, one series per combination of label values.
+
+    Safe to observe from the database thread pool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """
+        Records one value.
+
+        Args:
+            value (float): The observed value, seconds for latencies
+            **labels: A value for each of the histogram's label names
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.counts[index] += 1
+            series.sum += value
+
+    def snapshot(self) -> dict[tuple[str, ...], tuple[list[int], float]]:
+        """Returns a copy of the bucket counts and sum of every series."""
+        with self._lock:
+            return {key: (series.counts[:], series.sum) for key, series in self._series.items()}
+
+
+def timed(histogram: Histogram, **labels: Any) -> Callable[[F], F]:
+    """
+    Decorator recording how long each call of a function or coroutine function takes.
+
+    Calls that raise are recorded too.
+
+    Args:
+        histogram (Histogram): Histogram the durations go to
+        **labels: Label values of the series
+    """
+    def decorator(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+class LogSampler:
+    """
+    Lets through the first of every `every` events, for messages that would flood the log at full rate.
+    """
+
+    def __init__(self, every: int = LOG_SAMPLE_EVERY) -> None:
+        self.every = max(1, every)
+        self._events = itertools.count()
+
+    def sample(self) -> bool:
+        """Counts an event and tells whether it should be logged."""
+        return next(self._events) % self.every == 0
+
+
+HANDLER_SECONDS = Histogram(
+    "quotes_handler_seconds", "Time spent handling an update or running a scheduled job", ("handler",)
+)
+DB_SECONDS = Histogram(
+    "quotes_db_seconds", "Time spent in database calls, including waiting for the write lock", ("function",)
+)
+PDF_RENDER_SECONDS = Histogram(
+    "quotes_pdf_render_seconds", "Time a worker process spent rendering the best quotes PDF", buckets=RENDER_BUCKETS
+)
+SCHEDULER_LAG_SECONDS = Histogram(
+    "quotes_scheduler_lag_seconds", "Delay between the start of a minute and the broadcast job handling it"
+)
+SEND_QUEUE_DEPTH = Histogram(
+    "quotes_send_queue_depth", "Messages waiting in the send queue when another one is queued", buckets=DEPTH_BUCKETS
+)
+SEND_SECONDS = Histogram(
+    "quotes_send_seconds", "Time from queuing a message until Telegram accepted or rejected it", ("outcome",)
+)
+
+
+def _format_bound(bound: float) -> str:
+    return f"{bound:g}"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """
+    Returns every histogram in the Prometheus text exposition format.
+    """
+    lines = []
+    for histogram in _registry:
+        lines.append(f"# HELP {histogram.name} {histogram.documentation}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        for key, (counts, total) in sorted(histogram.snapshot().items()):
+            cumulative = 0
+            bounds = [*map(_format_bound, histogram.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(histogram.labelnames, key, (("le", bound),))
+                lines.append(f"{histogram.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(histogram.labelnames, key)
+            lines.append(f"{histogram.name}_sum{labels} {total}")
+            lines.append(f"{histogram.name}_count{labels} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _quantile_bound(buckets: tuple[float, ...], counts: list[int], quantile: float) -> str:
+    """Returns the upper bound of the bucket holding the quantile."""
+    target = quantile * sum(counts)
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        if cumulative >= target:
+            return f"<={_format_bound(bound)}"
+    return f">{_format_bound(buckets[-1])}"
+
+
+# Series as of the previous log summary, so each summary covers only its own interval
+_last_summary: dict[tuple[str, tuple[str, ...]], tuple[list[int], float]] = {}
+
+
+def _summary_lines() -> Iterator[str]:
+    for histogram in _registry:
+        for key, (counts, total) in sorted(histogram.snapshot().items()):
+            previous_counts, previous_total = _last_summary.get((histogram.name, key), ([0] * len(counts), 0.0))
+            _last_summary[(histogram.name, key)] = (counts, total)
+            interval = [count - previous for count, previous in zip(counts, previous_counts)]
+            observed = sum(interval)
+            if not observed:
+                continue
+            mean = (total - previous_total) / observed
+            quantile = _quantile_bound(histogram.buckets, interval, SUMMARY_QUANTILE)
+            labels = _format_labels(histogram.labelnames, key)
+            yield (
+                f"{histogram.name}{labels}: {observed} observed, mean {mean:.4g}, "
+                f"p{SUMMARY_QUANTILE * 100:.0f} {quantile}"
+            )
+
+
+def log_summary() -> None:
+    """
+    Logs the count, mean and 95th percentile bucket of every series observed since the previous summary.
+    """
+    lines = list(_summary_lines())
+    if lines:
+        logger.info("Metrics since the last summary:\n  " + "\n  ".join(lines))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves render_prometheus() at /metrics."""
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Scrapes every few seconds would drown the bot's own messages
+        pass
+
+
+def start_http_server(port: int = METRICS_PORT, address: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serves the Prometheus endpoint at /metrics from a background thread.
+
+    Args:
+        port (int): Port to listen on
+        address (str): Address to listen on
+
+    Returns:
+        ThreadingHTTPServer: The server, stopped with its shutdown() method
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="quotes-metrics", daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
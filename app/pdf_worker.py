@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from app.async_db import run_blocking
+from app.make_pdf import get_best_quotes_pdfs, get_best_quotes_version, get_cached_best_quotes_pdfs
+from app.metrics import PDF_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Number of processes rendering PDFs, can be overridden with PDF_WORKERS
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+
+
+def _render_job(submitted_at: float) -> tuple[list[str] | None, float, float]:
+    """
+    Runs in a worker process: builds the best quotes PDF volumes if they are stale.
+    Returns the paths and the wall-clock times the job started and finished.
+    """
+    started_at = time.time()
+    paths = get_best_quotes_pdfs()
+    return paths, started_at, time.time()
+
+
+class PdfRenderQueue:
+    """
+    Renders the best quotes PDF in a separate process.
+    
+    Requests arriving while a render of the same liked-set version is
+    already queued or running share that render instead of starting another.
+    
+    Attributes:
+        stats (dict): Counters and timings of cache hits, renders and coalesced requests
+    """
+
+    def __init__(self, max_workers: int = PDF_WORKERS) -> None:
+        self._max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._jobs: dict[int, asyncio.Future] = {}
+        self.stats = {
+            'cache_hits': 0,
+            'renders': 0,
+            'coalesced': 0,
+            'last_queue_wait': 0.0,
+            'last_render_time': 0.0,
+            'total_queue_wait': 0.0,
+            'total_render_time': 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers open their own database connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def get_pdfs(self) -> list[str] | None:
+        """
+        Returns the paths to up-to-date best quotes PDF volumes.
+        
+        Served straight from the cache when possible, otherwise rendered in a
+        worker process, joining an in-flight render of the same version.
+        
+        Returns:
+            list[str] | None: Paths to the volumes, or None if they could not be generated
+        """
+        version = await run_blocking(get_best_quotes_version)
+        cached = get_cached_best_quotes_pdfs(version)
+        if cached:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        job = self._jobs.get(version)
+        if job is not None:
+            self.stats['coalesced'] += 1
+        else:
+            job = self._jobs[version] = asyncio.ensure_future(self._render(version))
+        return await asyncio.shield(job)
+
+    async def _render(self, version: int) -> list[str] | None:
+        """
+        Submits one render to the worker pool and records its timings.
+        """
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        try:
+            paths, started_at, finished_at = await loop.run_in_executor(
+                self._get_executor(), _render_job, submitted_at
+            )
+        finally:
+            self._jobs.pop(version, None)
+
+        queue_wait = max(0.0, started_at - submitted_at)
+        render_time = finished_at - started_at
+        self.stats['renders'] += 1
+        self.stats['last_queue_wait'] = queue_wait
+        self.stats['last_render_time'] = render_time
+        self.stats['total_queue_wait'] += queue_wait
+        self.stats['total_render_time'] += render_time
+        PDF_RENDER_SECONDS.observe(render_time)
+        logger.info(f"Rendered best quotes PDF v{version}: waited {queue_wait:.3f}s, rendered in {render_time:.3f}s")
+        return paths
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
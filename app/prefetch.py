@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+from collections import deque
+
+from app.async_db import draw_quotes_async, load_seen_async, mark_seen_async, pick_unseen_quotes_async
+from app.cache import TTLCache
+from db.db_seen import SeenSet
+
+logger = logging.getLogger(__name__)
+
+# Quotes kept ready for the random button, can be overridden with PREFETCH_SIZE
+PREFETCH_SIZE = int(os.getenv("PREFETCH_SIZE", "256"))
+
+# Seen histories of recently active users kept in memory
+SEEN_CACHE_SIZE = 10000
+SEEN_CACHE_TTL = 3600
+
+
+class QuotePrefetcher:
+    """
+    Serves random button presses from a ring of quotes drawn in advance.
+
+    The ring is refilled in the background with one bulk query once it
+    drops below a quarter of its size. Each press takes the first quote in
+    the ring the user hasn't seen, checked against their seen history kept
+    in memory, and the resulting seen marks are written in batches by flush().
+
+    Attributes:
+        stats (dict): Counters of presses served from memory, misses and refills
+    """
+
+    def __init__(self, size: int = PREFETCH_SIZE) -> None:
+        self.size = size
+        self._ring: deque[dict] = deque()
+        self._seen: TTLCache[int, SeenSet] = TTLCache(maxsize=SEEN_CACHE_SIZE, ttl=SEEN_CACHE_TTL)
+        self._pending: list[tuple[int, int]] = []
+        self._refill_task: asyncio.Task | None = None
+        self.stats = {"hits": 0, "misses": 0, "refills": 0}
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    async def get_quote(self, user_id: int) -> dict | None:
+        """
+        Returns a quote the user hasn't seen yet, or None if there are no quotes.
+        """
+        seen = self._seen.get(user_id)
+        if seen is None:
+            seen = (await load_seen_async([user_id]))[user_id]
+            self._seen.set(user_id, seen)
+
+        quote = self._take(seen)
+        self.start_refill()
+        if quote is not None:
+            self.stats["hits"] += 1
+            seen.add(quote['id'])
+            self._pending.append((user_id, quote['id']))
+            return quote
+
+        # Nothing suitable in memory, let the database pick and record it
+        self.stats["misses"] += 1
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error writing seen quotes: {e}")
+        quotes = await pick_unseen_quotes_async([user_id])
+        # The pick may have started a new pass, reload the history next time
+        self._seen.pop(user_id)
+        return quotes.get(user_id)
+
+    def note_seen(self, user_id: int, quote_id: int) -> None:
+        """
+        Updates the cached history of a user after a quote was sent by another path.
+        """
+        seen = self._seen.get(user_id)
+        if seen is not None:
+            seen.add(quote_id)
+
+    def start_refill(self) -> None:
+        """
+        Starts a background refill when the ring runs low and none is running.
+        """
+        if len(self._ring) >= self.size // 4:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def flush(self) -> int:
+        """
+        Writes the seen marks collected since the last flush.
+
+        Returns:
+            int: Number of marks written
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            await mark_seen_async(pending)
+        except Exception:
+            self._pending.extend(pending)
+            raise
+        return len(pending)
+
+    def _take(self, seen: SeenSet) -> dict | None:
+        """Pops the first quote not in seen, rotating the skipped ones to the back."""
+        for _ in range(len(self._ring)):
+            quote = self._ring.popleft()
+            if quote['id'] not in seen:
+                return quote
+            self._ring.append(quote)
+        return None
+
+    async def _refill(self) -> None:
+        try:
+            quotes = await draw_quotes_async(self.size - len(self._ring))
+        except Exception as e:
+            logger.error(f"Error refilling quote prefetch buffer: {e}")
+            return
+        queued = {quote['id'] for quote in self._ring}
+        self._ring.extend(quote for quote in quotes if quote['id'] not in queued)
+        self.stats["refills"] += 1
@@ -1,11 +1,83 @@
 import logging
-from typing import List
+from itertools import chain
+from typing import Iterator, List
 from app.book import Book_quotes
+from db.db_fill_in import ImportResult, db_fill_in_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Separator between the metadata and the quotes
+SEPARATOR = '---'
+
+# Number of characters read from the file at a time
+READ_CHUNK_SIZE = 1 << 16
+
+def iter_md_sections(file_path: str) -> Iterator[str]:
+    """
+    Yields the sections of a markdown file split by "---", reading it in chunks.
+    
+    Produces the same sections as content.split('---') without holding the
+    whole file in memory.
+    
+    Args:
+        file_path (str): Path to the markdown file
+        
+    Yields:
+        str: The raw text of each section
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = ''
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            parts = buffer.split(SEPARATOR)
+            # The last part may continue in the next chunk
+            buffer = parts.pop()
+            yield from parts
+        yield buffer
+
+def stream_md_quotes(file_path: str) -> tuple[str, str, Iterator[str]]:
+    """
+    Reads the metadata of a markdown file and returns its quotes lazily.
+    
+    Args:
+        file_path (str): Path to the markdown file
+        
+    Returns:
+        tuple[str, str, Iterator[str]]: Book title, author and a generator of quotes
+        
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        ValueError: If the file format is invalid
+    """
+    sections = iter_md_sections(file_path)
+    head = [section for _, section in zip(range(3), sections)]
+
+    if len(head) < 3:
+        raise ValueError("Invalid markdown format: expected at least 3 sections")
+
+    # Parse metadata from first section
+    metadata = head[1].strip()
+    title = None
+    author = None
+    
+    for line in metadata.split('\n'):
+        if line.startswith('Название:'):
+            title = line.replace('Название:', '').strip()
+        elif line.startswith('Автор:'):
+            author = line.replace('Автор:', '').strip()
+            
+    if not title or not author:
+        raise ValueError("Missing required metadata: title or author")
+
+    # Quotes start after the third section, empty blocks are skipped
+    quotes = (quote for quote in (block.strip() for block in sections) if quote)
+    return title, author, quotes
+
 def parse_md_to_quotes(file_path: str) -> Book_quotes:
     """
     Parses a markdown file and returns a Book_quotes instance.
@@ -21,35 +93,8 @@ def parse_md_to_quotes(file_path: str) -> Book_quotes:
         ValueError: If the file format is invalid
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            
-        # Split content by "---"
-        sections = content.split('---')
-
-        if len(sections) < 3:
-            raise ValueError("Invalid markdown format: expected at least 3 sections")
- 
-        # Parse metadata from first section
-        metadata = sections[1].strip()
-        title = None
-        author = None
-        
-        for line in metadata.split('\n'):
-            if line.startswith('Название:'):
-                title = line.replace('Название:', '').strip()
-            elif line.startswith('Автор:'):
-                author = line.replace('Автор:', '').strip()
-                
-        if not title or not author:
-            raise ValueError("Missing required metadata: title or author")
-            
-        # Parse quotes from third section
-        quotes = []
-        for block in sections[3:]:
-            block = block.strip()
-            if block:  # Skip empty blocks
-                quotes.append(block)
+        title, author, quotes = stream_md_quotes(file_path)
+        quotes = list(quotes)
                 
         if not quotes:
             raise ValueError("No quotes found in the file")
@@ -70,3 +115,36 @@ def parse_md_to_quotes(file_path: str) -> Book_quotes:
         logger.error(f"Error parsing markdown file: {e}")
         raise
 
+
+def import_md_file(file_path: str) -> ImportResult:
+    """
+    Streams the quotes of a markdown file straight into the database.
+    
+    Sections are parsed from a generator over the file and inserted in
+    batches inside one transaction, so memory use does not depend on the
+    size of the file.
+    
+    Args:
+        file_path (str): Path to the markdown file
+        
+    Returns:
+        ImportResult: Book metadata and the number of quotes added and skipped
+        
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        ValueError: If the file format is invalid or contains no quotes
+    """
+    try:
+        title, author, quotes = stream_md_quotes(file_path)
+        # Checked before anything is written, so an empty file adds no book or author rows
+        first = next(quotes, None)
+        if first is None:
+            raise ValueError("No quotes found in the file")
+        return db_fill_in_stream(title, author, chain([first], quotes))
+        
+    except FileNotFoundError:
+        logger.error(f"File not found: {file_path}")
+        raise
+    except Exception as e:
+        logger.error(f"Error importing markdown file: {e}")
+        raise
@@ -0,0 +1,86 @@
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """
+    Returns the worker shard responsible for a user when running several worker processes.
+    """
+    return user_id % shards
+
+
+class QuoteScheduler:
+    """
+    Index of subscribed users by the minute slot ("HH:MM") they are due in.
+    
+    Looking up who is due at a given minute only touches the users in that
+    slot, instead of scanning every subscriber once a minute. With several
+    worker processes each one schedules only the users of its own shard.
+    """
+
+    def __init__(self, shard: int = 0, shards: int = 1) -> None:
+        self.shard = shard
+        self.shards = shards
+        self._slots: dict[str, set[int]] = defaultdict(set)
+        self._every_minute: set[int] = set()
+        self._user_times: dict[int, list[str] | None] = {}
+
+    def subscribe(self, user_id: int, times: list[str] | None) -> None:
+        """
+        Schedules a user, replacing any previous schedule.
+        
+        Args:
+            user_id (int): Telegram user id
+            times (list[str] | None): Slots in "HH:MM" format, or None for every minute
+        """
+        self.unsubscribe(user_id)
+        self._user_times[user_id] = times
+        if times is None:
+            self._every_minute.add(user_id)
+        else:
+            for slot in times:
+                self._slots[slot].add(user_id)
+
+    def owns(self, user_id: int) -> bool:
+        """
+        Tells whether the user belongs to the shard of this scheduler.
+        """
+        return shard_of(user_id, self.shards) == self.shard
+
+    def unsubscribe(self, user_id: int) -> None:
+        """
+        Removes a user from every slot.
+        
+        Args:
+            user_id (int): Telegram user id
+        """
+        if user_id not in self._user_times:
+            return
+        times = self._user_times.pop(user_id)
+        if times is None:
+            self._every_minute.discard(user_id)
+        else:
+            for slot in times:
+                users = self._slots.get(slot)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self._slots[slot]
+
+    def due_users(self, slot: str) -> list[int]:
+        """
+        Returns the users due at the given minute.
+        
+        Args:
+            slot (str): Current time in "HH:MM" format
+            
+        Returns:
+            list[int]: Users scheduled for this slot plus every-minute users
+        """
+        return list(self._every_minute | self._slots.get(slot, set()))
+
+    def __len__(self) -> int:
+        return len(self._user_times)
+
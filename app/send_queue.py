@@ -0,0 +1,265 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+from telegram.error import RetryAfter
+
+from app.metrics import SEND_QUEUE_DEPTH, SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Sends in flight at the same time
+MAX_CONCURRENT_SENDS = 20
+
+# Telegram allows about 30 messages per second overall, can be overridden with MAX_SENDS_PER_SECOND
+MAX_SENDS_PER_SECOND = float(os.getenv("MAX_SENDS_PER_SECOND", "25"))
+
+# ... and about one message per second to the same chat, with short bursts tolerated
+CHAT_SENDS_PER_SECOND = 1.0
+CHAT_BURST = 3
+
+# Attempts per message before giving up on repeated RetryAfter errors
+MAX_SEND_ATTEMPTS = 3
+
+# Per-chat buckets idle for this many seconds are dropped
+CHAT_BUCKET_TTL = 60
+
+# Priorities, lower is sent first
+INTERACTIVE = 0
+BROADCAST = 1
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """Returns how long until a token is available, 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self._tokens -= 1
+
+    def idle_since(self) -> float:
+        return self._updated
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    send: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+def _retry_delay(error: RetryAfter) -> float:
+    """Returns the RetryAfter delay in seconds."""
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+class SendQueue:
+    """
+    Outbound message queue that keeps within Telegram's rate limits.
+
+    Every send passes a global token bucket and a token bucket for its chat.
+    A message whose chat is out of tokens is put back until it has one, so
+    it never holds up messages to other chats. Interactive replies are
+    dequeued before scheduled broadcasts. A RetryAfter from Telegram pauses
+    all sending for the requested time and the message is queued again.
+
+    Attributes:
+        stats (dict): Counters and timings of sent, failed and retried messages
+    """
+
+    def __init__(
+        self,
+        rate: float = MAX_SENDS_PER_SECOND,
+        chat_rate: float = CHAT_SENDS_PER_SECOND,
+        chat_burst: float = CHAT_BURST,
+        max_concurrency: int = MAX_CONCURRENT_SENDS,
+    ) -> None:
+        # A small burst allowance absorbs sleep overshoot without exceeding the limit by much
+        self._global = TokenBucket(rate, max(1.0, rate / 10))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int, TokenBucket] = {}
+        self._max_concurrency = max_concurrency
+        self._queue: asyncio.PriorityQueue[_Job] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._pacing = asyncio.Lock()
+        self._seq = itertools.count()
+        self._delayed = 0
+        self._paused_until = 0.0
+        self._last_cleanup = time.monotonic()
+        self.stats = {
+            "sent": 0,
+            "failed": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "max_depth": 0,
+            "last_latency": 0.0,
+            "total_latency": 0.0,
+        }
+
+    @property
+    def depth(self) -> int:
+        """Messages waiting, including those held back by their chat's bucket."""
+        return (self._queue.qsize() if self._queue else 0) + self._delayed
+
+    def submit(self, chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = BROADCAST) -> asyncio.Future:
+        """
+        Queues a send and returns a future resolved with its result.
+
+        Args:
+            chat_id (int): Chat the message goes to, used for the per-chat limit
+            send (Callable): Coroutine function performing the Bot API call
+            priority (int): INTERACTIVE or BROADCAST
+
+        Returns:
+            asyncio.Future: Resolved with the return value of send, or its exception
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._seq), chat_id, send, future, time.monotonic())
+        self._queue.put_nowait(job)
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.depth)
+        SEND_QUEUE_DEPTH.observe(self.depth)
+        return future
+
+    async def send(self, chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = INTERACTIVE) -> Any:
+        """Queues a send and waits for it to go out."""
+        return await self.submit(chat_id, send, priority)
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        Waits up to timeout seconds for queued messages to go out, then stops the workers.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.depth} unsent messages")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _drain(self) -> None:
+        while self.depth:
+            await self._queue.join()
+            await asyncio.sleep(0.05)
+
+    def _start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.get_running_loop().create_task(self._work()) for _ in range(self._max_concurrency)
+        ]
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        if now - self._last_cleanup > CHAT_BUCKET_TTL:
+            self._chats = {
+                chat: bucket for chat, bucket in self._chats.items()
+                if now - bucket.idle_since() < CHAT_BUCKET_TTL
+            }
+            self._last_cleanup = now
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _requeue_later(self, job: _Job, delay: float) -> None:
+        self._delayed += 1
+
+        def _put() -> None:
+            self._delayed -= 1
+            if self._queue is not None:
+                self._queue.put_nowait(job)
+
+        asyncio.get_running_loop().call_later(delay, _put)
+
+    async def _work(self) -> None:
+        while True:
+            # One worker at a time waits for the global bucket, holding a single job,
+            # so an interactive reply queued meanwhile is next in line
+            async with self._pacing:
+                job = await self._queue.get()
+                now = time.monotonic()
+                chat = self._chat_bucket(job.chat_id, now)
+                chat_delay = chat.delay(now)
+                if chat_delay > 0:
+                    # Out of tokens for this chat, let other chats go first
+                    self._requeue_later(job, chat_delay)
+                    self._queue.task_done()
+                    continue
+                chat.take(now)
+
+                # The global bucket and a RetryAfter pause hold up every chat
+                while (wait := max(self._global.delay(now), self._paused_until - now)) > 0:
+                    await asyncio.sleep(wait)
+                    now = time.monotonic()
+                self._global.take(now)
+
+            try:
+                await self._send(job)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, job: _Job) -> None:
+        job.attempts += 1
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            delay = _retry_delay(e)
+            self.stats["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            if job.attempts < MAX_SEND_ATTEMPTS:
+                logger.warning(f"Rate limited by Telegram, retrying chat {job.chat_id} in {delay}s")
+                self.stats["retried"] += 1
+                self._requeue_later(job, delay)
+                return
+            self._finish(job, error=e)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, result=result)
+
+    def _finish(self, job: _Job, result: Any = None, error: Exception | None = None) -> None:
+        latency = time.monotonic() - job.enqueued_at
+        self.stats["last_latency"] = latency
+        self.stats["total_latency"] += latency
+        SEND_SECONDS.observe(latency, outcome="sent" if error is None else "failed")
+        if error is None:
+            self.stats["sent"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        else:
+            self.stats["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(error)
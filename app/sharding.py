@@ -0,0 +1,162 @@
+"""
+Sharded mode: one dispatcher process and several bot worker processes.
+
+The dispatcher serves the webhook and routes every update by user id to
+the queue of one worker, so all updates of a user, and their schedule,
+always live in the same process. Workers run the regular Application
+without an updater and share the SQLite database.
+"""
+import os
+import json
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+
+import tornado.web
+from telegram import Bot, Update
+
+from app import bot
+from app.scheduler import shard_of
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes, can be overridden with BOT_WORKERS
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "2"))
+
+# Updates waiting per worker before the dispatcher answers 503 and Telegram retries
+WORKER_QUEUE_SIZE = 10000
+
+# Seconds a worker gets to finish its pending work on shutdown
+WORKER_STOP_TIMEOUT = 30
+
+# Update fields that carry the user, in the order they are checked
+USER_FIELDS = ("message", "edited_message", "callback_query")
+
+
+def update_user_id(data: dict) -> int | None:
+    """
+    Returns the id of the user who sent a raw update, or the chat id if there is no sender.
+    """
+    for field in USER_FIELDS:
+        payload = data.get(field)
+        if payload:
+            sender = payload.get("from") or payload.get("chat") or {}
+            return sender.get("id")
+    return None
+
+
+class UpdateRouter(tornado.web.RequestHandler):
+    """
+    Webhook endpoint that hands each update to the worker owning its user.
+    """
+
+    def initialize(self, secret_token: str, queues: list) -> None:
+        self.secret_token = secret_token
+        self.queues = queues
+
+    def post(self) -> None:
+        if self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+
+        user_id = update_user_id(data)
+        shard = shard_of(user_id, len(self.queues)) if user_id is not None else 0
+        try:
+            # The raw body is forwarded, the worker parses it into an Update
+            self.queues[shard].put_nowait(self.request.body)
+        except queue.Full:
+            logger.warning(f"Worker {shard} is overloaded, asking Telegram to retry")
+            raise tornado.web.HTTPError(503)
+
+
+def _run_worker(shard: int, shards: int, updates, token: str) -> None:
+    """Entry point of a worker process."""
+    # The dispatcher stops workers through their queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot.configure_shard(shard, shards)
+    asyncio.run(_serve_worker(bot.build_application(token, with_updater=False), updates))
+
+
+async def _serve_worker(application, updates) -> None:
+    """
+    Feeds updates from the dispatcher queue into the application until it receives None.
+    """
+    loop = asyncio.get_running_loop()
+    # Without an updater the post_init, post_stop and post_shutdown hooks are called here
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info(f"Worker {bot.scheduler.shard} of {bot.scheduler.shards} started")
+    try:
+        while (body := await loop.run_in_executor(None, updates.get)) is not None:
+            update = Update.de_json(json.loads(body), application.bot)
+            await application.update_queue.put(update)
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def _serve_dispatcher(token: str, queues: list) -> None:
+    """
+    Registers the webhook and routes updates until SIGINT or SIGTERM.
+    """
+    config = bot.webhook_config()
+    app = tornado.web.Application([
+        (f"/{config['url_path']}", UpdateRouter, {"secret_token": config["secret_token"], "queues": queues}),
+    ])
+    server = app.listen(config["port"], config["listen"])
+
+    api = {"base_url": f"{bot.TELEGRAM_API_URL}/bot"} if bot.TELEGRAM_API_URL else {}
+    async with Bot(token, **api) as telegram_bot:
+        await telegram_bot.set_webhook(
+            config["webhook_url"],
+            secret_token=config["secret_token"],
+            allowed_updates=bot.ALLOWED_UPDATES,
+        )
+    logger.info(f"Dispatching updates to {len(queues)} workers on port {config['port']}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    server.stop()
+
+
+def run_sharded(token: str, workers: int = BOT_WORKERS) -> None:
+    """
+    Starts the worker processes and runs the dispatcher until it is stopped.
+
+    Args:
+        token (str): Bot token
+        workers (int): Number of worker processes
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=_run_worker, args=(shard, workers, queues[shard], token), name=f"quotes-worker-{shard}")
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(_serve_dispatcher(token, queues))
+    finally:
+        for updates in queues:
+            updates.put(None)
+        for process in processes:
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop in time, terminating it")
+                process.terminate()
+        logger.info("All workers stopped")
@@ -0,0 +1,305 @@
+import os
+import heapq
+import random
+import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WeightPolicy:
+    """
+    How a quote's rating turns into its chance of being drawn.
+
+    A quote with score 0 has weight `base`. Each net like adds `like_bonus`
+    times `base`, each net dislike multiplies the weight by `dislike_factor`.
+
+    Attributes:
+        base (float): Weight of an unrated quote
+        like_bonus (float): Extra weight per net like, relative to base
+        dislike_factor (float): Multiplier per net dislike
+        max_weight (float): Upper bound on any weight
+        min_weight (float): Lower bound, so disliked quotes still come up occasionally
+    """
+    base: float = 1.0
+    like_bonus: float = 0.5
+    dislike_factor: float = 0.5
+    max_weight: float = 10.0
+    min_weight: float = 0.05
+
+    def weight(self, score: int) -> float:
+        if score >= 0:
+            weight = self.base * (1 + self.like_bonus * score)
+        else:
+            weight = self.base * self.dislike_factor ** -score
+        return min(self.max_weight, max(self.min_weight, weight))
+
+    @classmethod
+    def from_env(cls) -> "WeightPolicy":
+        """
+        Builds a policy from the QUOTE_WEIGHT_* environment variables.
+        """
+        return cls(
+            base=float(os.getenv("QUOTE_WEIGHT_BASE", cls.base)),
+            like_bonus=float(os.getenv("QUOTE_WEIGHT_LIKE_BONUS", cls.like_bonus)),
+            dislike_factor=float(os.getenv("QUOTE_WEIGHT_DISLIKE_FACTOR", cls.dislike_factor)),
+            max_weight=float(os.getenv("QUOTE_WEIGHT_MAX", cls.max_weight)),
+            min_weight=float(os.getenv("QUOTE_WEIGHT_MIN", cls.min_weight)),
+        )
+
+
+class FenwickTree:
+    """
+    Binary indexed tree over non-negative float weights, 1-based.
+
+    Point updates, prefix sums and weighted lookups all run in O(log n).
+    """
+
+    def __init__(self, weights: array) -> None:
+        """
+        Builds the tree in O(n) from weights, where weights[0] is unused.
+        """
+        self._tree = array('d', weights)
+        self._tree[0] = 0.0
+        size = len(self._tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def add(self, index: int, delta: float) -> None:
+        size = len(self._tree)
+        while index < size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index: int) -> float:
+        total = 0.0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def append(self, weight: float) -> None:
+        """
+        Adds a new last index with the given weight in O(log n).
+        """
+        index = len(self._tree)
+        # A node covers (index - lowbit, index], all of it already in the tree except itself
+        covered = self.prefix_sum(index - 1) - self.prefix_sum(index - (index & -index))
+        self._tree.append(covered + weight)
+
+    def total(self) -> float:
+        return self.prefix_sum(len(self))
+
+    def find(self, value: float) -> int:
+        """
+        Returns the smallest index whose prefix sum exceeds value.
+        """
+        position = 0
+        step = 1 << (len(self).bit_length())
+        while step:
+            next_position = position + step
+            if next_position <= len(self) and self._tree[next_position] <= value:
+                position = next_position
+                value -= self._tree[next_position]
+            step >>= 1
+        return position + 1
+
+
+class WeightedQuoteSampler:
+    """
+    Draws eligible quotes with probability proportional to their rating weight.
+
+    Quote ids index straight into a Fenwick tree, so a draw costs O(log n)
+    and rating or visibility changes update one entry. Reserved quotes get
+    weight 0 until their last_seen passes, tracked with a heap of expiries.
+    """
+
+    def __init__(self, policy: WeightPolicy | None = None) -> None:
+        self.policy = policy or WeightPolicy()
+        self._lock = threading.Lock()
+        self._tree = FenwickTree(array('d', [0.0]))
+        self._scores = array('i', [0])
+        self._present = bytearray(1)
+        self._hidden_until = array('d', [0.0])
+        self._expiries: list[tuple[float, int]] = []
+        self.max_id = 0
+
+    def load(self, cursor) -> None:
+        """
+        Reads every quote's id, score and last_seen in one pass and rebuilds the tree.
+        """
+        now_ts = datetime.now().timestamp()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM quotes")
+        max_id = cursor.fetchone()[0]
+        scores = array('i', bytes(4 * (max_id + 1)))
+        present = bytearray(max_id + 1)
+        hidden_until = array('d', bytes(8 * (max_id + 1)))
+        expiries = []
+
+        cursor.execute("SELECT id, score, last_seen FROM quotes")
+        while rows := cursor.fetchmany(10000):
+            for id, score, last_seen in rows:
+                scores[id] = score
+                present[id] = 1
+                until_ts = _timestamp(last_seen)
+                if until_ts > now_ts:
+                    hidden_until[id] = until_ts
+                    expiries.append((until_ts, id))
+
+        with self._lock:
+            self._scores = scores
+            self._present = present
+            self._hidden_until = hidden_until
+            self._expiries = expiries
+            heapq.heapify(self._expiries)
+            self.max_id = max_id
+            weights = array('d', bytes(8 * (max_id + 1)))
+            for id in range(1, max_id + 1):
+                weights[id] = self._current_weight(id)
+            self._tree = FenwickTree(weights)
+        logger.info(f"Loaded {sum(present)} quotes into the weighted sampler")
+
+    def sync_new(self, cursor) -> None:
+        """
+        Adds quotes inserted since the last load or sync, found through the primary key.
+
+        The read runs without the lock, so rows another thread added in the
+        meantime are skipped rather than counted twice.
+        """
+        cursor.execute("SELECT id, score, last_seen FROM quotes WHERE id > ? ORDER BY id", (self.max_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        now_ts = datetime.now().timestamp()
+        with self._lock:
+            rows = [row for row in rows if row[0] > self.max_id]
+            if not rows:
+                return
+            self._grow(rows[-1][0])
+            for id, score, last_seen in rows:
+                self._scores[id] = score
+                self._present[id] = 1
+                self._hidden_until[id] = 0.0
+                self._tree.add(id, self._current_weight(id))
+                self._hide(id, _timestamp(last_seen), now_ts)
+
+    def draw(self, count: int, now: datetime, hide_until: datetime) -> list[int]:
+        """
+        Draws up to count distinct eligible quote ids and hides them until hide_until.
+        """
+        now_ts = now.timestamp()
+        until_ts = hide_until.timestamp()
+        ids = []
+        with self._lock:
+            self._release_expired(now_ts)
+            for _ in range(count):
+                total = self._tree.total()
+                if total <= 1e-9:
+                    break
+                id = self._tree.find(random.random() * total)
+                if id > self.max_id or self._current_weight(id) <= 0:
+                    # Rounding at the very end of the range, redraw next time
+                    continue
+                self._hide(id, until_ts, now_ts)
+                ids.append(id)
+        return ids
+
+    def sample(self, count: int) -> list[int]:
+        """
+        Draws count eligible quote ids with replacement, leaving them eligible.
+        """
+        ids = []
+        with self._lock:
+            self._release_expired(datetime.now().timestamp())
+            total = self._tree.total()
+            if total <= 1e-9:
+                return ids
+            for _ in range(count):
+                id = self._tree.find(random.random() * total)
+                if id <= self.max_id and self._current_weight(id) > 0:
+                    ids.append(id)
+        return ids
+
+    def hide(self, id: int, until: datetime | str | None) -> None:
+        """
+        Makes a quote ineligible until the given time.
+        """
+        with self._lock:
+            if 0 < id <= self.max_id and self._present[id]:
+                self._hide(id, _timestamp(until), datetime.now().timestamp())
+
+    def remove(self, id: int) -> None:
+        """
+        Forgets a quote that no longer exists.
+        """
+        with self._lock:
+            if 0 < id <= self.max_id and self._present[id]:
+                self._tree.add(id, -self._current_weight(id))
+                self._present[id] = 0
+
+    def apply_rating_deltas(self, deltas: dict[int, list[int]]) -> None:
+        """
+        Updates weights after a rating flush.
+
+        Args:
+            deltas (dict[int, list[int]]): Mapping of quote id to [likes, dislikes] added
+        """
+        with self._lock:
+            for id, (likes, dislikes) in deltas.items():
+                if not (0 < id <= self.max_id and self._present[id]):
+                    continue
+                old_weight = self._current_weight(id)
+                self._scores[id] += likes - dislikes
+                new_weight = self._current_weight(id)
+                if new_weight != old_weight:
+                    self._tree.add(id, new_weight - old_weight)
+
+    def _current_weight(self, id: int) -> float:
+        if not self._present[id] or self._hidden_until[id] > 0:
+            return 0.0
+        return self.policy.weight(self._scores[id])
+
+    def _hide(self, id: int, until_ts: float, now_ts: float) -> None:
+        """Sets when a quote becomes eligible again, a time in the past makes it eligible now."""
+        old_weight = self._current_weight(id)
+        self._hidden_until[id] = until_ts if until_ts > now_ts else 0.0
+        new_weight = self._current_weight(id)
+        if new_weight != old_weight:
+            self._tree.add(id, new_weight - old_weight)
+        if until_ts > now_ts:
+            heapq.heappush(self._expiries, (until_ts, id))
+
+    def _release_expired(self, now_ts: float) -> None:
+        while self._expiries and self._expiries[0][0] < now_ts:
+            until_ts, id = heapq.heappop(self._expiries)
+            # Ignore stale entries for quotes hidden again later
+            if id <= self.max_id and self._hidden_until[id] == until_ts:
+                self._hidden_until[id] = 0.0
+                self._tree.add(id, self._current_weight(id))
+
+    def _grow(self, max_id: int) -> None:
+        """Extends the arrays and the tree with empty slots up to max_id."""
+        for _ in range(max_id - self.max_id):
+            self._scores.append(0)
+            self._present.append(0)
+            self._hidden_until.append(0.0)
+            self._tree.append(0.0)
+        self.max_id = max(self.max_id, max_id)
+
+
+def _timestamp(value: datetime | str | None) -> float:
+    """Converts a last_seen value to a POSIX timestamp, 0 for missing values."""
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
@@ -1,6 +1,7 @@
 import sqlite3
 import logging
 import os
+from db.connection import get_db_path, transaction
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -8,11 +9,11 @@ logger = logging.getLogger(__name__)
 
 def clear_database():
     """
-    Deletes all entries from the quotes table in the database.
+    Deletes all entries from the quotes table in the database, along with
+    the books and authors they referenced.
     The table structure remains intact, only the data is removed.
     """
-    db_path = "quotes.db"
-    conn = None
+    db_path = get_db_path()
     
     try:
         # Check if database exists
@@ -20,18 +21,15 @@ def clear_database():
             logger.error(f"Database not found at {db_path}")
             return
             
-        # Connect to database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Delete all entries from quotes table
-        cursor.execute("DELETE FROM quotes")
-        
-        # Commit the changes
-        conn.commit()
-        
-        # Get the number of deleted rows
-        deleted_rows = cursor.rowcount
+        # Delete all entries from quotes table in one transaction
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM quotes")
+            # Get the number of deleted rows
+            deleted_rows = cursor.rowcount
+            # After the quotes, whose delete triggers still look up the names
+            cursor.execute("DELETE FROM books")
+            cursor.execute("DELETE FROM authors")
         logger.info(f"Successfully deleted {deleted_rows} entries from quotes table")
         
     except sqlite3.Error as e:
@@ -40,6 +38,3 @@ def clear_database():
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
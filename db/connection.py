@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default location of the database, can be overridden with QUOTES_DB_PATH
+DEFAULT_DB_PATH = "quotes.db"
+
+# Pragmas applied to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Size of the per-connection prepared statement cache
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_lock = threading.Lock()
+_open_connections: list[sqlite3.Connection] = []
+_initialized_paths: set[str] = set()
+
+
+def get_db_path() -> str:
+    """
+    Returns the path of the quotes database.
+    
+    Returns:
+        str: Value of the QUOTES_DB_PATH environment variable, or "quotes.db"
+    """
+    return os.getenv("QUOTES_DB_PATH", DEFAULT_DB_PATH)
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Opens a new tuned connection and makes sure the schema exists.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        cached_statements=CACHED_STATEMENTS,
+        # Each connection is used by a single thread, but may be closed at exit from another
+        check_same_thread=False,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    with _lock:
+        _open_connections.append(conn)
+        needs_schema = db_path not in _initialized_paths
+        _initialized_paths.add(db_path)
+
+    if needs_schema:
+        from db.db_init import init_schema
+        init_schema(conn)
+
+    logger.debug(f"Opened database connection to {db_path}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns the long-lived connection to the quotes database for the current thread.
+    
+    Connections are opened lazily, one per thread and database path, and stay
+    open for the lifetime of the process so callers never pay for connection
+    setup on the hot path.
+    
+    Returns:
+        sqlite3.Connection: Connection in WAL mode with the tuned pragmas applied
+    """
+    db_path = get_db_path()
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open_connection(db_path)
+    return conn
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Context manager running a block in a single transaction.
+    
+    Commits on success and rolls back if the block raises. The write lock is
+    taken up front (BEGIN IMMEDIATE), so a block that reads before it writes
+    waits for other processes through busy_timeout instead of failing with
+    "database is locked" when it upgrades to a writer.
+    
+    Yields:
+        sqlite3.Connection: The current thread's connection
+    """
+    conn = get_connection()
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        yield conn
+
+
+def close_connections() -> None:
+    """
+    Closes every connection opened by this process.
+    """
+    with _lock:
+        connections = list(_open_connections)
+        _open_connections.clear()
+        _initialized_paths.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            # Connection belongs to a thread that is already gone
+            pass
+    _local.__dict__.pop("connections", None)
+
+
+atexit.register(close_connections)
@@ -1,43 +1,163 @@
 import sqlite3
+import hashlib
 import logging
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
 from app.book import Book_quotes
-import os
-from db.db_init import init_database
+from app.messages import encode_payload, render_payload
+from app.metrics import DB_SECONDS, timed
+from db.connection import transaction
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def db_fill_in(book_quotes: Book_quotes) -> None:
+# Number of rows handed to executemany at a time
+INSERT_BATCH_SIZE = 5000
+
+def quote_hash(content: str, book: str | None, author: str | None) -> str:
     """
-    Fills the database with quotes from a Book_quotes instance.
+    Returns the deduplication key of a quote.
     
     Args:
-        book_quotes (Book_quotes): An instance of Book_quotes containing quotes to be added
+        content (str): The quote text
+        book (str | None): The title of the book
+        author (str | None): The author of the book
+        
+    Returns:
+        str: Hex SHA-1 digest of the stripped book, author and content
     """
-    db_path = "quotes.db"
-    if not os.path.exists(db_path):
-        init_database()
-    conn = None
+    key = '\x1f'.join(((book or '').strip(), (author or '').strip(), content.strip()))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def quote_payload(content: str) -> str:
+    """
+    Returns the stored payload of a quote: its text escaped and split into messages for Telegram.
     
-    try:
-        # Connect to database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    Args:
+        content (str): The quote text
+        
+    Returns:
+        str: The MarkdownV2 message texts, see app.messages.render_payload and encode_payload
+    """
+    return encode_payload(render_payload(content))
+
+def _name_id(cursor: sqlite3.Cursor, table: str, column: str, name: str | None) -> int | None:
+    """Returns the id of a name in the books or authors table, adding the name if it is new."""
+    if name is None:
+        return None
+    cursor.execute(f'INSERT INTO {table} ({column}) VALUES (?) ON CONFLICT ({column}) DO NOTHING', (name,))
+    cursor.execute(f'SELECT id FROM {table} WHERE {column} = ?', (name,))
+    return cursor.fetchone()[0]
+
+def book_id(cursor: sqlite3.Cursor, title: str | None) -> int | None:
+    """
+    Returns the id of a book title, adding it to the books table if it is new.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the transaction the quote is written in
+        title (str | None): The title of the book
+        
+    Returns:
+        int | None: Id of the book, None for a quote without a book
+    """
+    return _name_id(cursor, 'books', 'title', title)
+
+def author_id(cursor: sqlite3.Cursor, name: str | None) -> int | None:
+    """
+    Returns the id of an author, adding them to the authors table if they are new.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the transaction the quote is written in
+        name (str | None): The name of the author
+        
+    Returns:
+        int | None: Id of the author, None for a quote without an author
+    """
+    return _name_id(cursor, 'authors', 'name', name)
+
+@dataclass
+class ImportResult:
+    """
+    Outcome of adding quotes to the database.
+    
+    Attributes:
+        book (str): The title of the book
+        author (str): The author of the book
+        inserted (int): Number of quotes added
+        skipped (int): Number of quotes already in the database
+    """
+    book: str
+    author: str
+    inserted: int
+    skipped: int = 0
+
+def _insert_quotes(
+    cursor: sqlite3.Cursor,
+    book: str | None,
+    author: str | None,
+    ids: tuple[int | None, int | None],
+    quotes: list[str],
+    value: int,
+    current_date: datetime,
+) -> int:
+    """Inserts quotes of one book with executemany and returns how many were new."""
+    cursor.executemany('''
+        INSERT INTO quotes (content, book_id, author_id, entry_date, value, last_seen, content_hash, payload, book_sort)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (content_hash) DO NOTHING
+    ''', [
+        (
+            quote, *ids, current_date, value, current_date,
+            quote_hash(quote, book, author), quote_payload(quote), book,
+        )
+        for quote in quotes
+    ])
+    return cursor.rowcount
+
+@timed(DB_SECONDS, function='db_fill_in_stream')
+def db_fill_in_stream(book: str, author: str, quotes: Iterable[str], value: int = 5) -> ImportResult:
+    """
+    Adds quotes from any iterable to the database in a single transaction.
+    
+    The quotes are consumed lazily and inserted with executemany in batches,
+    so arbitrarily large imports run in constant memory. Quotes whose content
+    hash is already stored are skipped, so re-importing a book is a no-op.
+    Each quote is stored with its rendered message payload, so sending it
+    later needs no escaping or length checks.
+    
+    Args:
+        book (str): The title of the book
+        author (str): The author of the book
+        quotes (Iterable[str]): Quotes to be added, e.g. a generator over a file
+        value (int): Rating value of the quotes, defaults to 5
         
+    Returns:
+        ImportResult: Book metadata and the number of quotes added and skipped
+    """
+    try:
         # Get current date for entry_date and last_seen
         current_date = datetime.now()
+        quotes = iter(quotes)
+        inserted = 0
+        total = 0
         
-        # Insert each quote from the content list
-        for quote in book_quotes.content:
-            cursor.execute('''
-                INSERT INTO quotes (content, book, author, entry_date, value, last_seen)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (quote, book_quotes.book, book_quotes.author, current_date, book_quotes.value, current_date))
+        with transaction() as conn:
+            cursor = conn.cursor()
+            # Every quote of the import shares one book and author row
+            ids = (book_id(cursor, book), author_id(cursor, author))
+            while True:
+                batch = list(islice(quotes, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                inserted += _insert_quotes(cursor, book, author, ids, batch, value, current_date)
+                total += len(batch)
             
-        conn.commit()
-        logger.info(f"Successfully added {len(book_quotes.content)} quotes from '{book_quotes.book}' to database")
+        skipped = total - inserted
+        logger.info(f"Successfully added {inserted} quotes from '{book}' to database, skipped {skipped} duplicates")
+        return ImportResult(book=book, author=author, inserted=inserted, skipped=skipped)
         
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
@@ -45,7 +165,95 @@ def db_fill_in(book_quotes: Book_quotes) -> None:
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
+def _grouped_batches(
+    rows: Iterable[tuple[str | None, str | None, str]],
+) -> Iterator[dict[tuple[str | None, str | None], list[str]]]:
+    """Groups rows by (book, author), yielding the groups every INSERT_BATCH_SIZE rows."""
+    pending: dict[tuple[str | None, str | None], list[str]] = {}
+    buffered = 0
+    for book, author, quote in rows:
+        pending.setdefault((book, author), []).append(quote)
+        buffered += 1
+        if buffered >= INSERT_BATCH_SIZE:
+            yield pending
+            pending = {}
+            buffered = 0
+    if pending:
+        yield pending
+
+@timed(DB_SECONDS, function='db_fill_in_rows')
+def db_fill_in_rows(
+    rows: Iterable[tuple[str | None, str | None, str]],
+    value: int = 5,
+    single_transaction: bool = True,
+) -> list[ImportResult]:
+    """
+    Adds quotes of many books from one stream of rows.
+    
+    Rows are grouped by (book, author) as they arrive: each group resolves
+    its book and author ids once and buffers its quotes, and every buffered
+    quote is written with one executemany per group whenever INSERT_BATCH_SIZE
+    rows are pending. Memory use therefore stays bounded however long the
+    stream is and however its books are interleaved.
+    
+    Args:
+        rows (Iterable[tuple]): (book, author, quote) rows, book and author may be None
+        value (int): Rating value of the quotes, defaults to 5
+        single_transaction (bool): Write everything in one transaction, all or
+            nothing. When False every batch is committed on its own and the
+            rows are read without holding the write lock, so other writers,
+            such as the bot's votes, get in between the batches of a large
+            import. A failed import then keeps its committed batches, importing
+            it again only adds the rest.
+        
+    Returns:
+        list[ImportResult]: One result per (book, author) pair, in order of first appearance
+    """
+    try:
+        current_date = datetime.now()
+        results: dict[tuple[str | None, str | None], ImportResult] = {}
+        ids: dict[tuple[str | None, str | None], tuple[int | None, int | None]] = {}
+        
+        def write(cursor: sqlite3.Cursor, pending: dict[tuple[str | None, str | None], list[str]]) -> None:
+            for key, quotes in pending.items():
+                if key not in ids:
+                    ids[key] = (book_id(cursor, key[0]), author_id(cursor, key[1]))
+                    results[key] = ImportResult(book=key[0], author=key[1], inserted=0)
+                inserted = _insert_quotes(cursor, *key, ids[key], quotes, value, current_date)
+                results[key].inserted += inserted
+                results[key].skipped += len(quotes) - inserted
+        
+        if single_transaction:
+            with transaction() as conn:
+                cursor = conn.cursor()
+                for pending in _grouped_batches(rows):
+                    write(cursor, pending)
+        else:
+            for pending in _grouped_batches(rows):
+                with transaction() as conn:
+                    write(conn.cursor(), pending)
+        
+        inserted = sum(result.inserted for result in results.values())
+        skipped = sum(result.skipped for result in results.values())
+        logger.info(f"Successfully added {inserted} quotes from {len(results)} books to database, skipped {skipped} duplicates")
+        return list(results.values())
+        
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise
+
+def db_fill_in(book_quotes: Book_quotes) -> ImportResult:
+    """
+    Fills the database with quotes from a Book_quotes instance.
+    
+    Args:
+        book_quotes (Book_quotes): An instance of Book_quotes containing quotes to be added
+        
+    Returns:
+        ImportResult: Book metadata and the number of quotes added and skipped
+    """
+    return db_fill_in_stream(book_quotes.book, book_quotes.author, book_quotes.content, book_quotes.value)
@@ -2,54 +2,127 @@ import sqlite3
 import os
 import logging
 from datetime import datetime
+from db.connection import get_connection, get_db_path
+from db.migrations import migrate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump the liked set version on every write that changes the best quotes PDF
+BEST_QUOTES_TRIGGERS = {
+    'trg_quotes_best_insert': '''
+        CREATE TRIGGER trg_quotes_best_insert AFTER INSERT ON quotes
+        WHEN NEW.score > 0
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'best_quotes_version';
+        END
+    ''',
+    'trg_quotes_best_update': '''
+        CREATE TRIGGER trg_quotes_best_update AFTER UPDATE OF score, content, book_id, author_id ON quotes
+        WHEN (OLD.score > 0 OR NEW.score > 0)
+            AND (OLD.score IS NOT NEW.score OR OLD.content IS NOT NEW.content
+                 OR OLD.book_id IS NOT NEW.book_id OR OLD.author_id IS NOT NEW.author_id)
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'best_quotes_version';
+        END
+    ''',
+    'trg_quotes_best_delete': '''
+        CREATE TRIGGER trg_quotes_best_delete AFTER DELETE ON quotes
+        WHEN OLD.score > 0
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'best_quotes_version';
+        END
+    ''',
+}
+
+# Keep the full-text index in step with every write to quotes. Book and author
+# names are looked up by id, rows of books and authors are never changed in place.
+SEARCH_TRIGGERS = {
+    'trg_quotes_fts_insert': '''
+        CREATE TRIGGER trg_quotes_fts_insert AFTER INSERT ON quotes
+        BEGIN
+            INSERT INTO quotes_fts (rowid, content, book, author)
+            VALUES (
+                NEW.id, NEW.content,
+                (SELECT title FROM books WHERE id = NEW.book_id),
+                (SELECT name FROM authors WHERE id = NEW.author_id)
+            );
+        END
+    ''',
+    'trg_quotes_fts_update': '''
+        CREATE TRIGGER trg_quotes_fts_update AFTER UPDATE OF content, book_id, author_id ON quotes
+        BEGIN
+            INSERT INTO quotes_fts (quotes_fts, rowid, content, book, author)
+            VALUES (
+                'delete', OLD.id, OLD.content,
+                (SELECT title FROM books WHERE id = OLD.book_id),
+                (SELECT name FROM authors WHERE id = OLD.author_id)
+            );
+            INSERT INTO quotes_fts (rowid, content, book, author)
+            VALUES (
+                NEW.id, NEW.content,
+                (SELECT title FROM books WHERE id = NEW.book_id),
+                (SELECT name FROM authors WHERE id = NEW.author_id)
+            );
+        END
+    ''',
+    'trg_quotes_fts_delete': '''
+        CREATE TRIGGER trg_quotes_fts_delete AFTER DELETE ON quotes
+        BEGIN
+            INSERT INTO quotes_fts (quotes_fts, rowid, content, book, author)
+            VALUES (
+                'delete', OLD.id, OLD.content,
+                (SELECT title FROM books WHERE id = OLD.book_id),
+                (SELECT name FROM authors WHERE id = OLD.author_id)
+            );
+        END
+    ''',
+}
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    """
+    Brings the database to the current schema and recreates its triggers.
+    
+    Pending migrations from db.migrations are applied first. Safe to run
+    against an existing database, so it is applied to every newly opened
+    connection path.
+    
+    Args:
+        conn (sqlite3.Connection): Connection to the database to initialize
+    """
+    migrate(conn)
+    
+    # Triggers are recreated so that changed definitions reach existing databases,
+    # inside one transaction so other processes never write while they are missing
+    conn.execute('BEGIN IMMEDIATE')
+    with conn:
+        for name, sql in {**BEST_QUOTES_TRIGGERS, **SEARCH_TRIGGERS}.items():
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+            conn.execute(sql)
+
 def init_database():
     """
     Initialize the SQLite database if it doesn't exist.
-    Creates the quotes table with specified columns if it doesn't exist.
+    Creates the database file if needed and upgrades it to the current
+    schema version, see db.migrations.
     """
-    db_path = "quotes.db"
-    conn = None
+    db_path = get_db_path()
     
     try:
         # Check if database exists
         if not os.path.exists(db_path):
             logger.info(f"Creating new database at {db_path}")
-            
-            # Connect to database (this will create it if it doesn't exist)
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Create quotes table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS quotes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    content TEXT NOT NULL,
-                    book TEXT,
-                    author TEXT,
-                    entry_date DATETIME,
-                    value INTEGER CHECK (value >= 1 AND value <= 10),
-                    last_seen DATETIME
-                )
-            ''')
-            
-            conn.commit()
-            logger.info("Database and table created successfully")
-            
         else:
             logger.info(f"Database already exists at {db_path}")
             
+        # Opening the connection creates the file and the schema if needed
+        init_schema(get_connection())
+        logger.info("Database and table are ready")
+            
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
-
@@ -2,11 +2,18 @@ import sqlite3
 import logging
 from datetime import datetime
 from typing import Union, Any
+from app.metrics import DB_SECONDS, LogSampler, timed
+from db.connection import transaction
+from db.db_fill_in import author_id, book_id, quote_hash, quote_payload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Successful updates are logged once in every LOG_SAMPLE_EVERY, broadcasts make many of them
+_update_log = LogSampler()
+
+@timed(DB_SECONDS, function='modify_cell')
 def modify_cell(id: int, column: str, new_value: Any) -> None:
     """
     Modifies a specific cell in the quotes database.
@@ -18,9 +25,14 @@ def modify_cell(id: int, column: str, new_value: Any) -> None:
             - content, book, author: str
             - entry_date, last_seen: datetime
             - value: int (1-10)
+            Book titles and author names are stored in their own tables, the
+            quote is pointed at the matching row, which is added if it is new.
+            Changing the content renders the stored payload again, and
+            changing the content, book or author recomputes the content hash.
         
     Raises:
         ValueError: If the column name is invalid or value type doesn't match column type
+        sqlite3.IntegrityError: If the edited quote duplicates another stored quote
         sqlite3.Error: If there's a database error
     """
     # Dictionary mapping columns to their expected types and validation rules
@@ -49,27 +61,41 @@ def modify_cell(id: int, column: str, new_value: Any) -> None:
         if column == 'value' and not (column_types[column]['min'] <= new_value <= column_types[column]['max']):
             raise ValueError(f"Value must be between {column_types[column]['min']} and {column_types[column]['max']}")
     
-    db_path = "quotes.db"
-    conn = None
-    
     try:
-        # Connect to database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Update the specified cell
-        cursor.execute(f'''
-            UPDATE quotes 
-            SET {column} = ? 
-            WHERE id = ?
-        ''', (new_value, id))
+        with transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Book and author are references to the books and authors tables,
+            # the title is kept as well as the best quotes sort key
+            assignments = {column: new_value}
+            if column == 'book':
+                assignments = {'book_id': book_id(cursor, new_value), 'book_sort': new_value}
+            elif column == 'author':
+                assignments = {'author_id': author_id(cursor, new_value)}
+
+            # The deduplication hash covers the text, book and author, the
+            # escaped message texts only the text
+            if column in ('content', 'book', 'author'):
+                cursor.execute('SELECT content, book, author FROM quotes_view WHERE id = ?', (id,))
+                row = cursor.fetchone()
+                if row is not None:
+                    quote = {**dict(zip(('content', 'book', 'author'), row)), column: new_value}
+                    assignments['content_hash'] = quote_hash(quote['content'], quote['book'], quote['author'])
+                if column == 'content':
+                    assignments['payload'] = quote_payload(new_value)
+
+            # Update the specified cell
+            cursor.execute(f'''
+                UPDATE quotes
+                SET {', '.join(f'{name} = ?' for name in assignments)}
+                WHERE id = ?
+            ''', (*assignments.values(), id))
         
         # Check if any row was affected
         if cursor.rowcount == 0:
             logger.warning(f"No row found with id {id}")
-        else:
-            conn.commit()
-            logger.info(f"Successfully updated {column} for id {id}")
+        elif _update_log.sample():
+            logger.info(f"Successfully updated {column} for id {id} (1 of every {_update_log.every} updates is logged)")
             
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
@@ -77,8 +103,5 @@ def modify_cell(id: int, column: str, new_value: Any) -> None:
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
 
@@ -0,0 +1,187 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Iterator
+from db.connection import get_connection, transaction
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the cursor at a time when streaming best quotes
+FETCH_SIZE = 500
+
+# Ranking of liked quotes, by score and then alphabetically by book, in the
+# order of idx_quotes_best
+BEST_QUOTES_ORDER = "q.score DESC, q.book_sort, q.id"
+
+def iter_best_quotes(limit: int | None = None) -> Iterator[tuple[str, str | None, str | None]]:
+    """
+    Streams liked quotes from the best ranked down.
+    
+    Rows are read from the cursor in small batches, so the memory used by
+    Python does not depend on how many quotes are liked.
+    
+    Args:
+        limit (int | None): Maximum number of quotes, or None for all of them
+        
+    Yields:
+        tuple: content, book and author of each quote
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(f'''
+            SELECT q.content, b.title, a.name FROM quotes q
+            LEFT JOIN books b ON b.id = q.book_id
+            LEFT JOIN authors a ON a.id = q.author_id
+            WHERE q.score > 0
+            ORDER BY {BEST_QUOTES_ORDER}
+            LIMIT ?
+        ''', (-1 if limit is None else limit,))
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            yield from rows
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+def get_best_quotes_page(page: int, page_size: int = 20) -> list[dict]:
+    """
+    Returns one page of the liked quotes ranking.
+    
+    The page is ranked from idx_quotes_best alone, only its own rows are
+    then read from the quotes table.
+    
+    Args:
+        page (int): Page number, starting from 0
+        page_size (int): Number of quotes per page
+        
+    Returns:
+        list[dict]: Quotes with id, content, book, author, likes, dislikes and score
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(f'''
+            SELECT v.id, v.content, v.book, v.author, v.likes, v.dislikes, v.score
+            FROM (
+                SELECT q.id, q.score, q.book_sort FROM quotes q
+                WHERE q.score > 0
+                ORDER BY {BEST_QUOTES_ORDER}
+                LIMIT ? OFFSET ?
+            ) AS best
+            JOIN quotes_view v ON v.id = best.id
+            ORDER BY best.score DESC, best.book_sort COLLATE NOCASE, best.id
+        ''', (page_size, page * page_size))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+class RatingBuffer:
+    """
+    Write-behind buffer for like/dislike votes.
+    
+    Votes are kept in memory per rated message and written with the
+    message_ratings rows and one batched UPDATE of the counters in a single
+    transaction per flush, so heavy voting does not turn into one commit per
+    click. The score column (likes minus dislikes) is kept in step with the
+    counters.
+    """
+
+    def __init__(self, on_flush: Callable[[dict[int, list[int]]], None] | None = None) -> None:
+        """
+        Args:
+            on_flush (Callable | None): Called after each successful flush with the
+                written votes as {quote_id: [likes, dislikes]}
+        """
+        self._pending: dict[tuple[int, int], tuple[int, str, datetime]] = {}
+        self._lock = threading.Lock()
+        self._on_flush = on_flush
+
+    def add(self, message_id: int, user_id: int, quote_id: int, action: str) -> bool:
+        """
+        Buffers one vote.
+        
+        Args:
+            message_id (int): Telegram message id the rating buttons belong to
+            user_id (int): Telegram user id
+            quote_id (int): Rated quote id
+            action (str): 'like' or 'dislike'
+            
+        Returns:
+            bool: False if the user already has a vote for this message waiting
+            
+        Raises:
+            ValueError: If the action is unknown
+        """
+        if action not in ('like', 'dislike'):
+            raise ValueError(f"Unknown rating action: {action}")
+        with self._lock:
+            if (message_id, user_id) in self._pending:
+                return False
+            self._pending[(message_id, user_id)] = (quote_id, action, datetime.now())
+            return True
+
+    def flush(self) -> int:
+        """
+        Writes all buffered votes in a single transaction.
+        
+        Each vote is recorded in message_ratings first, and only the votes
+        whose row was new are counted, so a message rated again after a
+        restart or after its entry left the bot's cache is not counted twice.
+        On failure the votes are put back so the next flush retries them.
+        
+        Returns:
+            int: Number of quotes updated
+            
+        Raises:
+            sqlite3.Error: If there's a database error
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        counted: dict[int, list[int]] = {}
+        try:
+            with transaction() as conn:
+                for (message_id, user_id), (quote_id, action, rated_at) in pending.items():
+                    cursor = conn.execute('''
+                        INSERT OR IGNORE INTO message_ratings (message_id, user_id, quote_id, action, rated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (message_id, user_id, quote_id, action, rated_at))
+                    if cursor.rowcount == 1:
+                        counts = counted.setdefault(quote_id, [0, 0])
+                        counts[0 if action == 'like' else 1] += 1
+                conn.executemany('''
+                    UPDATE quotes SET
+                        likes = likes + ?,
+                        dislikes = dislikes + ?,
+                        score = score + ? - ?
+                    WHERE id = ?
+                ''', [(likes, dislikes, likes, dislikes, quote_id) for quote_id, (likes, dislikes) in counted.items()])
+        except sqlite3.Error as e:
+            self._restore(pending)
+            logger.error(f"Database error: {e}")
+            raise
+
+        if counted and self._on_flush is not None:
+            self._on_flush(counted)
+        logger.debug(f"Flushed {len(pending)} votes for {len(counted)} quotes")
+        return len(counted)
+
+    def _restore(self, pending: dict[tuple[int, int], tuple[int, str, datetime]]) -> None:
+        """Puts votes from a failed flush back into the buffer."""
+        with self._lock:
+            for key, vote in pending.items():
+                self._pending.setdefault(key, vote)
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,102 @@
+import re
+import sqlite3
+import logging
+from dataclasses import dataclass
+from app.metrics import DB_SECONDS, timed
+from db.connection import get_connection
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Relevance weights of the content, book and author columns for bm25()
+SEARCH_WEIGHTS = (1.0, 0.5, 0.5)
+
+# Words of a query kept, the rest is ignored
+MAX_QUERY_TERMS = 10
+
+# Shortest last word matched as a prefix, shorter prefixes match too many quotes to rank quickly
+MIN_PREFIX_LENGTH = 3
+
+@dataclass
+class SearchPage:
+    """
+    One page of search results.
+
+    Attributes:
+        quotes (list[dict]): Quotes with id, content, book and author, best match first
+        page (int): Page number, starting from 0
+        has_more (bool): Whether there is a next page
+    """
+    quotes: list[dict]
+    page: int
+    has_more: bool
+
+def build_match_query(query: str) -> str | None:
+    """
+    Turns free text into an FTS5 MATCH expression.
+
+    Every word must occur in the quote, its book or its author, and the last
+    word, if it has at least MIN_PREFIX_LENGTH characters, also matches as a
+    prefix so results show up while it is being typed.
+    Words are quoted, so FTS5 operators and punctuation in the input are
+    treated as plain text.
+
+    Args:
+        query (str): Text typed by the user
+
+    Returns:
+        str | None: The MATCH expression, or None if the query has no words
+    """
+    terms = re.findall(r'\w+', query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    match = ' '.join(f'"{term}"' for term in terms)
+    return match + '*' if len(terms[-1]) >= MIN_PREFIX_LENGTH else match
+
+@timed(DB_SECONDS, function='search_quotes')
+def search_quotes(query: str, page: int = 0, page_size: int = 10) -> SearchPage:
+    """
+    Finds quotes whose text, book or author contain every word of the query.
+
+    Results are ranked by bm25 relevance, matches in the quote text weighing
+    more than matches in the book title or author name. The cost grows with
+    the number of matching quotes, so broad single-word queries are the slowest.
+
+    Args:
+        query (str): Text typed by the user
+        page (int): Page number, starting from 0
+        page_size (int): Number of quotes per page
+
+    Returns:
+        SearchPage: The quotes on the requested page
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    match = build_match_query(query)
+    if match is None:
+        return SearchPage([], page, False)
+
+    try:
+        cursor = get_connection().cursor()
+        # Ranked inside the index so only the rows of this page are joined with their names,
+        # one extra row tells whether another page follows
+        cursor.execute('''
+            SELECT quotes_view.id, quotes_view.content, quotes_view.book, quotes_view.author
+            FROM (
+                SELECT rowid, bm25(quotes_fts, ?, ?, ?) AS relevance
+                FROM quotes_fts
+                WHERE quotes_fts MATCH ?
+                ORDER BY relevance
+                LIMIT ? OFFSET ?
+            ) AS hits
+            JOIN quotes_view ON quotes_view.id = hits.rowid
+            ORDER BY hits.relevance
+        ''', (*SEARCH_WEIGHTS, match, page_size + 1, page * page_size))
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+    return SearchPage(rows[:page_size], page, len(rows) > page_size)
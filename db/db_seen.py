@@ -0,0 +1,176 @@
+import sqlite3
+import logging
+from typing import Iterable
+from db.connection import get_connection, transaction
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Quote ids covered by one stored block
+CHUNK_BITS = 8192
+CHUNK_BYTES = CHUNK_BITS // 8
+
+# Upper bound on bound parameters per IN (...) query
+MAX_QUERY_USERS = 500
+
+class SeenSet:
+    """
+    The quotes one user has already received.
+
+    Quote ids are split into blocks of CHUNK_BITS, and only blocks holding at
+    least one seen quote are stored. As in a roaring bitmap, a block is saved
+    as a sorted array of 16-bit offsets while that is smaller than a plain
+    bitmap, so a subscriber who has seen a few hundred quotes costs a few
+    hundred bytes whatever the size of the catalogue.
+    """
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.cleared = False
+        self._chunks: dict[int, bytearray] = {}
+        self._dirty: set[int] = set()
+
+    def __contains__(self, quote_id: int) -> bool:
+        chunk = self._chunks.get(quote_id // CHUNK_BITS)
+        if chunk is None:
+            return False
+        offset = quote_id % CHUNK_BITS
+        return bool(chunk[offset >> 3] & (1 << (offset & 7)))
+
+    def __len__(self) -> int:
+        return sum(int.from_bytes(chunk).bit_count() for chunk in self._chunks.values())
+
+    def add(self, quote_id: int) -> None:
+        index = quote_id // CHUNK_BITS
+        chunk = self._chunks.get(index)
+        if chunk is None:
+            chunk = self._chunks[index] = bytearray(CHUNK_BYTES)
+        offset = quote_id % CHUNK_BITS
+        chunk[offset >> 3] |= 1 << (offset & 7)
+        self._dirty.add(index)
+
+    def clear(self) -> None:
+        """Forgets every seen quote, starting a new pass over the catalogue."""
+        self._chunks.clear()
+        self._dirty.clear()
+        self.cleared = True
+
+    def load_chunk(self, index: int, blob: bytes) -> None:
+        self._chunks[index] = _decode(blob)
+
+    def merge_chunk(self, index: int, blob: bytes) -> None:
+        """Adds the quotes of a stored block to a block changed in memory."""
+        merged = int.from_bytes(self._chunks[index]) | int.from_bytes(_decode(blob))
+        self._chunks[index][:] = merged.to_bytes(CHUNK_BYTES)
+
+    def dirty_indexes(self) -> list[int]:
+        return sorted(self._dirty)
+
+    def dirty_chunks(self) -> list[tuple[int, bytes]]:
+        """Returns the encoded blocks changed since loading."""
+        return [(index, _encode(self._chunks[index])) for index in self.dirty_indexes()]
+
+def _encode(chunk: bytearray) -> bytes:
+    """Packs a block as 16-bit offsets when sparse, as the raw bitmap otherwise."""
+    if int.from_bytes(chunk).bit_count() * 2 >= CHUNK_BYTES:
+        return bytes(chunk)
+    offsets = bytearray()
+    for byte_index, byte in enumerate(chunk):
+        while byte:
+            low = byte & -byte
+            offsets += ((byte_index << 3) + low.bit_length() - 1).to_bytes(2, 'little')
+            byte ^= low
+    return bytes(offsets)
+
+def _decode(blob: bytes) -> bytearray:
+    if len(blob) == CHUNK_BYTES:
+        return bytearray(blob)
+    chunk = bytearray(CHUNK_BYTES)
+    for start in range(0, len(blob), 2):
+        offset = int.from_bytes(blob[start:start + 2], 'little')
+        chunk[offset >> 3] |= 1 << (offset & 7)
+    return chunk
+
+def load_seen(user_ids: Iterable[int]) -> dict[int, SeenSet]:
+    """
+    Reads the seen quotes of several users.
+
+    Args:
+        user_ids (Iterable[int]): Telegram user ids
+
+    Returns:
+        dict[int, SeenSet]: Mapping of every requested user id to its seen quotes
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    seen = {user_id: SeenSet(user_id) for user_id in user_ids}
+    ids = list(seen)
+    try:
+        conn = get_connection()
+        for start in range(0, len(ids), MAX_QUERY_USERS):
+            chunk = ids[start:start + MAX_QUERY_USERS]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = conn.execute(f'''
+                SELECT user_id, chunk, bits FROM user_seen WHERE user_id IN ({placeholders})
+            ''', chunk)
+            for user_id, index, bits in cursor:
+                seen[user_id].load_chunk(index, bits)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+    return seen
+
+def save_seen(seen_sets: Iterable[SeenSet]) -> None:
+    """
+    Writes the changed blocks of several users in one transaction.
+
+    Args:
+        seen_sets (Iterable[SeenSet]): Seen quotes returned by load_seen and updated since,
+            merged with the stored blocks unless the set was cleared
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    seen_sets = list(seen_sets)
+    try:
+        with transaction() as conn:
+            conn.executemany('DELETE FROM user_seen WHERE user_id = ?',
+                             [(seen.user_id,) for seen in seen_sets if seen.cleared])
+            # Keep quotes recorded by other writers since these sets were loaded
+            for seen in seen_sets:
+                if seen.cleared:
+                    continue
+                for index in seen.dirty_indexes():
+                    row = conn.execute(
+                        'SELECT bits FROM user_seen WHERE user_id = ? AND chunk = ?',
+                        (seen.user_id, index),
+                    ).fetchone()
+                    if row:
+                        seen.merge_chunk(index, row[0])
+            conn.executemany('''
+                INSERT INTO user_seen (user_id, chunk, bits) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, chunk) DO UPDATE SET bits = excluded.bits
+            ''', [(seen.user_id, index, bits) for seen in seen_sets for index, bits in seen.dirty_chunks()])
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+def mark_seen(pairs: Iterable[tuple[int, int]]) -> None:
+    """
+    Records quotes sent to users without loading their whole history first.
+
+    Args:
+        pairs (Iterable[tuple[int, int]]): (user_id, quote_id) pairs
+
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    seen = {}
+    for user_id, quote_id in pairs:
+        if user_id not in seen:
+            seen[user_id] = SeenSet(user_id)
+        seen[user_id].add(quote_id)
+    if seen:
+        save_seen(seen.values())
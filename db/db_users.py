@@ -0,0 +1,88 @@
+import sqlite3
+import logging
+from datetime import datetime
+from db.connection import get_connection, transaction
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Slot stored for users who receive a quote every minute
+EVERY_MINUTE_SLOT = '*'
+
+def save_subscription(user_id: int, period: str, times: list[str] | None) -> None:
+    """
+    Stores or replaces the quote schedule of a user.
+    
+    Args:
+        user_id (int): Telegram user id
+        period (str): Key of the chosen option in PERIODS
+        times (list[str] | None): Slots in "HH:MM" format, or None for every minute
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    slots = [EVERY_MINUTE_SLOT] if times is None else times
+    try:
+        with transaction() as conn:
+            conn.execute('''
+                INSERT INTO subscriptions (user_id, period, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    period = excluded.period,
+                    updated_at = excluded.updated_at
+            ''', (user_id, period, datetime.now()))
+            conn.execute('DELETE FROM subscription_slots WHERE user_id = ?', (user_id,))
+            conn.executemany('''
+                INSERT INTO subscription_slots (user_id, slot) VALUES (?, ?)
+            ''', [(user_id, slot) for slot in slots])
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+def delete_subscription(user_id: int) -> None:
+    """
+    Removes the quote schedule of a user.
+    
+    Args:
+        user_id (int): Telegram user id
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    try:
+        with transaction() as conn:
+            conn.execute('DELETE FROM subscription_slots WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM subscriptions WHERE user_id = ?', (user_id,))
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+def load_subscriptions() -> dict[int, tuple[str, list[str] | None]]:
+    """
+    Reads every stored schedule with its slots in one query.
+    
+    Returns:
+        dict[int, tuple]: Mapping of user id to the key of the chosen option in
+            PERIODS and the slots in "HH:MM" format, None for every minute
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    try:
+        cursor = get_connection().execute('''
+            SELECT s.user_id, s.period, sl.slot
+            FROM subscriptions s
+            JOIN subscription_slots sl ON sl.user_id = s.user_id
+            ORDER BY s.user_id, sl.slot
+        ''')
+        subscriptions: dict[int, tuple[str, list[str] | None]] = {}
+        for user_id, period, slot in cursor:
+            if slot == EVERY_MINUTE_SLOT:
+                subscriptions[user_id] = (period, None)
+            else:
+                subscriptions.setdefault(user_id, (period, []))[1].append(slot)
+        return subscriptions
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise
@@ -0,0 +1,459 @@
+"""
+Versioned schema migrations.
+
+The number of migrations applied to a database is kept in its PRAGMA
+user_version. Each migration runs in its own write transaction together
+with the version bump, so a database is always at exactly one version and
+an interrupted upgrade resumes where it stopped. Migrations are never
+edited once released: a schema change is a new function at the end of
+MIGRATIONS.
+"""
+import re
+import sqlite3
+import hashlib
+import logging
+from typing import Callable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of rows hashed or rendered at a time when upgrading an existing database
+BACKFILL_BATCH_SIZE = 10000
+
+# The helpers below are frozen copies of the hashing and rendering the
+# migrations were released with (db.db_fill_in.quote_hash and
+# app.messages.render_payload). Released migrations must give the same
+# result whatever the importing code turns into later, and must not pull
+# the bot and its telegram dependency into a schema upgrade.
+
+# Longest message text Telegram accepted when payloads were introduced
+_PAYLOAD_MAX_LENGTH = 4096
+
+# Separator of the message parts in a stored payload
+_PAYLOAD_PART_SEPARATOR = "\x1e"
+
+# Characters escaped by MarkdownV2
+_MARKDOWN_V2_SPECIAL = re.compile("([" + re.escape(r"\_*[]()~`>#+-=|{}.!") + "])")
+
+def _quote_hash(content: str, book: str | None, author: str | None) -> str:
+    """Hex SHA-1 digest of the stripped book, author and content, the deduplication key of a quote."""
+    key = '\x1f'.join(((book or '').strip(), (author or '').strip(), content.strip()))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _escape_markdown_v2(text: str) -> str:
+    """Escapes text for MarkdownV2."""
+    return _MARKDOWN_V2_SPECIAL.sub(r'\\\1', text)
+
+def _text_length(text: str) -> int:
+    """Length as Telegram counts it, in UTF-16 code units."""
+    return len(text.encode('utf-16-le')) // 2
+
+def _split_escaped(text: str, limit: int) -> list[str]:
+    """Escapes text for MarkdownV2 in parts of at most limit UTF-16 code units, split at whitespace."""
+    parts = []
+    current, length = [], 0
+    for word in re.findall(r'\S+\s*|\s+', text):
+        pieces = [_escape_markdown_v2(word)]
+        if _text_length(pieces[0]) > limit:
+            pieces = [_escape_markdown_v2(char) for char in word]
+        for piece in pieces:
+            size = _text_length(piece)
+            if current and length + size > limit:
+                parts.append("".join(current).rstrip())
+                current, length = [], 0
+            current.append(piece)
+            length += size
+    if current:
+        parts.append("".join(current).rstrip())
+    return [part for part in parts if part]
+
+def _quote_payload(content: str) -> str:
+    """The stored payload of a quote: its text escaped and split into messages for Telegram."""
+    content = content.replace(_PAYLOAD_PART_SEPARATOR, " ")
+    text = _escape_markdown_v2(content)
+    if _text_length(text) <= _PAYLOAD_MAX_LENGTH:
+        parts = [text]
+    else:
+        parts = _split_escaped(content, _PAYLOAD_MAX_LENGTH)
+    return _PAYLOAD_PART_SEPARATOR.join(parts)
+
+def _column_names(cursor: sqlite3.Cursor, table: str) -> set[str]:
+    """Returns the column names of a table."""
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row[1] for row in cursor.fetchall()}
+
+def _backfill_content_hashes(cursor: sqlite3.Cursor) -> None:
+    """
+    Computes content_hash for rows stored before deduplication existed.
+
+    Rows that duplicate an earlier row keep a NULL hash, so the unique index
+    can be created without deleting anything.
+    """
+    seen = set()
+    last_id = 0
+    while True:
+        cursor.execute('''
+            SELECT id, content, book, author FROM quotes
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, BACKFILL_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for id, content, book, author in rows:
+            digest = _quote_hash(content, book, author)
+            if digest not in seen:
+                seen.add(digest)
+                updates.append((digest, id))
+        cursor.executemany('UPDATE quotes SET content_hash = ? WHERE id = ?', updates)
+        last_id = rows[-1][0]
+    logger.info(f"Computed content hashes for {len(seen)} quotes")
+
+def _baseline(cursor: sqlite3.Cursor) -> None:
+    """
+    Brings an unversioned database to the schema used before migrations existed.
+
+    Unversioned databases come from every earlier release, from the bare
+    quotes table onwards, so each step checks what is already there. The
+    full-text index is left to the next migration, which builds it over the
+    normalized tables.
+    """
+    # Create quotes table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            book TEXT,
+            author TEXT,
+            entry_date DATETIME,
+            value INTEGER CHECK (value >= 1 AND value <= 10),
+            last_seen DATETIME,
+            content_hash TEXT,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0,
+            score INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Databases created before deduplication lack the content_hash column
+    if 'content_hash' not in _column_names(cursor, 'quotes'):
+        cursor.execute('ALTER TABLE quotes ADD COLUMN content_hash TEXT')
+        _backfill_content_hashes(cursor)
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_quotes_content_hash ON quotes (content_hash)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quotes_last_seen ON quotes (last_seen)
+    ''')
+
+    # Databases created before rating counters carry the last vote in value
+    if 'score' not in _column_names(cursor, 'quotes'):
+        cursor.execute('ALTER TABLE quotes ADD COLUMN likes INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('ALTER TABLE quotes ADD COLUMN dislikes INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('ALTER TABLE quotes ADD COLUMN score INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('''
+            UPDATE quotes SET
+                likes = (value = 10),
+                dislikes = (value = 1),
+                score = (value = 10) - (value = 1)
+            WHERE value IN (1, 10)
+        ''')
+
+    # Ranking of liked quotes, matches the ORDER BY of the best quotes queries
+    cursor.execute('DROP INDEX IF EXISTS idx_quotes_score')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quotes_best
+        ON quotes (score DESC, book COLLATE NOCASE, id)
+        WHERE score > 0
+    ''')
+
+    # Small key/value table for counters such as the liked set version
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('best_quotes_version', 0)
+    ''')
+
+    # Quote schedules of subscribed users, one row per user and slot
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            user_id INTEGER PRIMARY KEY,
+            period TEXT NOT NULL,
+            updated_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscription_slots (
+            user_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            PRIMARY KEY (user_id, slot)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subscription_slots_slot ON subscription_slots (slot)
+    ''')
+
+    # Who rated which sent message, so each message can be rated once per user
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_ratings (
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            quote_id INTEGER,
+            action TEXT NOT NULL,
+            rated_at DATETIME,
+            PRIMARY KEY (message_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Quotes each user has already received, as one bitmap blob per block of quote ids
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_seen (
+            user_id INTEGER NOT NULL,
+            chunk INTEGER NOT NULL,
+            bits BLOB NOT NULL,
+            PRIMARY KEY (user_id, chunk)
+        ) WITHOUT ROWID
+    ''')
+
+def _normalize_books_and_authors(cursor: sqlite3.Cursor) -> None:
+    """
+    Moves book titles and author names into their own tables, referenced by id.
+
+    The quotes table is rebuilt with book_id and author_id in place of the
+    repeated strings, keeping ids and the AUTOINCREMENT counter. Readers use
+    the quotes_view view, which joins the names back in, and the full-text
+    index is rebuilt over that view.
+    """
+    cursor.execute('''
+        CREATE TABLE books (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE authors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO books (title)
+        SELECT DISTINCT book FROM quotes WHERE book IS NOT NULL
+    ''')
+    cursor.execute('''
+        INSERT INTO authors (name)
+        SELECT DISTINCT author FROM quotes WHERE author IS NOT NULL
+    ''')
+
+    # The index is rebuilt over the view once the new quotes table is in place
+    cursor.execute('DROP TABLE IF EXISTS quotes_fts')
+
+    cursor.execute('''
+        CREATE TABLE quotes_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            book_id INTEGER REFERENCES books (id),
+            author_id INTEGER REFERENCES authors (id),
+            entry_date DATETIME,
+            value INTEGER CHECK (value >= 1 AND value <= 10),
+            last_seen DATETIME,
+            content_hash TEXT,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0,
+            score INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO quotes_new (
+            id, content, book_id, author_id, entry_date, value, last_seen,
+            content_hash, likes, dislikes, score
+        )
+        SELECT q.id, q.content, b.id, a.id, q.entry_date, q.value, q.last_seen,
+            q.content_hash, q.likes, q.dislikes, q.score
+        FROM quotes q
+        LEFT JOIN books b ON b.title = q.book
+        LEFT JOIN authors a ON a.name = q.author
+        ORDER BY q.id
+    ''')
+
+    # Ids of deleted quotes must not be handed out again, seen bitmaps and ratings refer to them
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'quotes'")
+    row = cursor.fetchone()
+    cursor.execute('DROP TABLE quotes')
+    cursor.execute('ALTER TABLE quotes_new RENAME TO quotes')
+    if row is not None:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'quotes'")
+        cursor.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            VALUES ('quotes', MAX(?, (SELECT COALESCE(MAX(id), 0) FROM quotes)))
+        ''', (row[0],))
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_quotes_content_hash ON quotes (content_hash)
+    ''')
+    cursor.execute('''
+        CREATE INDEX idx_quotes_last_seen ON quotes (last_seen)
+    ''')
+    # Liked quotes by score, the alphabetical order of books is sorted per score
+    cursor.execute('''
+        CREATE INDEX idx_quotes_best
+        ON quotes (score DESC, book_id, id)
+        WHERE score > 0
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW quotes_view AS
+        SELECT
+            q.id, q.content, b.title AS book, a.name AS author,
+            q.entry_date, q.value, q.last_seen, q.content_hash,
+            q.likes, q.dislikes, q.score, q.book_id, q.author_id
+        FROM quotes q
+        LEFT JOIN books b ON b.id = q.book_id
+        LEFT JOIN authors a ON a.id = q.author_id
+    ''')
+
+    # Full-text index over the quotes with their book and author names
+    cursor.execute('''
+        CREATE VIRTUAL TABLE quotes_fts USING fts5 (
+            content, book, author,
+            content = 'quotes_view', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('rebuild')")
+
+def _add_quote_payloads(cursor: sqlite3.Cursor) -> None:
+    """
+    Stores the escaped message texts of every quote in a payload column.
+
+    The payload is what app.messages.render_payload returned when this
+    migration was released (see _quote_payload), so sends need
+    no escaping, and quotes too long for one message are already split.
+    It holds the quote text only, the book and author stay normalized.
+    """
+    cursor.execute('ALTER TABLE quotes ADD COLUMN payload TEXT')
+
+    last_id = 0
+    rendered = 0
+    while True:
+        cursor.execute('''
+            SELECT id, content FROM quotes
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, BACKFILL_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            'UPDATE quotes SET payload = ? WHERE id = ?',
+            [(_quote_payload(content), id) for id, content in rows],
+        )
+        rendered += len(rows)
+        last_id = rows[-1][0]
+    logger.info(f"Rendered message payloads for {rendered} quotes")
+
+    # The view lists its columns, recreate it to expose the new one
+    cursor.execute('DROP VIEW quotes_view')
+    cursor.execute('''
+        CREATE VIEW quotes_view AS
+        SELECT
+            q.id, q.content, b.title AS book, a.name AS author,
+            q.entry_date, q.value, q.last_seen, q.content_hash,
+            q.likes, q.dislikes, q.score, q.book_id, q.author_id, q.payload
+        FROM quotes q
+        LEFT JOIN books b ON b.id = q.book_id
+        LEFT JOIN authors a ON a.id = q.author_id
+    ''')
+
+def _drop_subscription_slot_index(cursor: sqlite3.Cursor) -> None:
+    """
+    Drops the index on subscription_slots.slot.
+
+    Schedules are read back whole at startup and deleted per user, both
+    served by the (user_id, slot) primary key, so the index was only ever written.
+    """
+    cursor.execute('DROP INDEX IF EXISTS idx_subscription_slots_slot')
+
+def _add_book_sort_keys(cursor: sqlite3.Cursor) -> None:
+    """
+    Stores the book title of every quote in a book_sort column, the tiebreak of the best quotes ranking.
+
+    Liked quotes are ranked by score and then alphabetically by book. With
+    only book_id on the quote, every liked quote was sorted by its title
+    for each page, now idx_quotes_best yields the ranking as it is. The
+    column is written together with book_id.
+    """
+    cursor.execute('ALTER TABLE quotes ADD COLUMN book_sort TEXT COLLATE NOCASE')
+    cursor.execute('''
+        UPDATE quotes SET book_sort = (SELECT title FROM books WHERE id = quotes.book_id)
+        WHERE book_id IS NOT NULL
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_quotes_best')
+    cursor.execute('''
+        CREATE INDEX idx_quotes_best
+        ON quotes (score DESC, book_sort, id)
+        WHERE score > 0
+    ''')
+
+# Schema changes in the order they are applied, never reorder or edit released ones
+MIGRATIONS: list[Callable[[sqlite3.Cursor], None]] = [
+    _baseline,
+    _normalize_books_and_authors,
+    _add_quote_payloads,
+    _drop_subscription_slot_index,
+    _add_book_sort_keys,
+]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Returns the number of migrations applied to the database.
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Applies the migrations the database has not had yet.
+
+    Each migration takes the write lock and re-reads the version first, so
+    several processes starting at once apply every migration exactly once.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database to upgrade
+
+    Returns:
+        int: The schema version after the upgrade
+
+    Raises:
+        sqlite3.Error: If a migration fails, the database stays at the last completed version,
+            as it does when the upgrade is interrupted
+    """
+    version = schema_version(conn)
+    if version > len(MIGRATIONS):
+        logger.warning(f"Database schema version {version} is newer than this code ({len(MIGRATIONS)})")
+
+    while version < len(MIGRATIONS):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                break
+            migration = MIGRATIONS[version]
+            logger.info(f"Migrating database to version {version + 1}: {migration.__name__.strip('_')}")
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except BaseException as e:
+            # Interrupts included, the transaction must not stay open on the shared connection
+            conn.rollback()
+            if isinstance(e, sqlite3.Error):
+                logger.error(f"Database error: {e}")
+            raise
+        version += 1
+    return version
@@ -1,4 +1,20 @@
-from app.bot import main
+import argparse
+
+from app.bot import BOT_MODES, DEFAULT_BOT_MODE, main
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the quotes bot")
+    parser.add_argument(
+        "--mode",
+        choices=BOT_MODES,
+        default=DEFAULT_BOT_MODE,
+        help="receive updates by long polling, through a webhook, or through a webhook "
+             "dispatching to several worker processes (default: BOT_MODE or polling)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of worker processes in sharded mode (default: BOT_WORKERS or 2)",
+    )
+    args = parser.parse_args()
+    main(args.mode, args.workers)
@@ -0,0 +1,110 @@
+"""
+Benchmark: import throughput of large CSV files.
+
+Writes a synthetic CSV file (two million rows over a few thousand books by
+default) and imports it into an empty database both ways the bot does:
+in one transaction, as the command line import does, and in committed
+batches, as an uploaded file is. Each import runs in a fresh process:
+
+    python -m tests.bench_csv_import
+    python -m tests.bench_csv_import --rows 5000000 --modes command-line
+
+The importing process's peak RSS is reported too. It counts the pages of
+the database file SQLite reads through mmap (see PRAGMAS in
+db/connection.py), so the anonymous memory still in use at the end, which
+should not grow with the size of the file, is shown next to it.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+from tests.bench_pdf import peak_rss_kb
+
+# Rows written by default
+ROWS = 2_000_000
+
+# Distinct (source, author) pairs, the rows of each are spread over the whole file
+BOOKS = 3000
+
+# Import paths that can be measured
+MODES = ("command-line", "upload")
+
+
+def write_csv(path: str, rows: int) -> None:
+    """Writes rows of quotes of varying length, with commas, quotes and line breaks to escape."""
+    rng = random.Random(1)
+    words = "time patience river light, \"quoted\" silence\nmorning stone road letter".split(" ")
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write("source,author,quote\n")
+        for number in range(rows):
+            book = rng.randrange(BOOKS)
+            text = " ".join(rng.choices(words, k=rng.randint(8, 40))).replace('"', '""')
+            file.write(f'Book {book},Author {book % 700},"Quote {number}: {text}"\n')
+
+
+def rss_anon_kb() -> int | None:
+    """Returns the anonymous resident memory of this process in kilobytes, None where unknown."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _import(db_path: str, csv_path: str, mode: str, results: multiprocessing.Queue) -> None:
+    """Runs in a fresh process: imports the file and reports the time, rows and memory."""
+    os.environ["QUOTES_DB_PATH"] = db_path
+    logging.basicConfig(level=logging.WARNING, force=True)
+    from app.make_quotes_from_csv import import_csv_file, import_csv_files
+
+    started = time.perf_counter()
+    imported = import_csv_files([csv_path]) if mode == "command-line" else import_csv_file(csv_path)
+    elapsed = time.perf_counter() - started
+    results.put((elapsed, sum(result.inserted for result in imported), len(imported), peak_rss_kb(), rss_anon_kb()))
+
+
+def measure(csv_path: str, mode: str, directory: str) -> tuple[float, int, int, int, int | None]:
+    """Imports the file into a new database in a new process."""
+    context = multiprocessing.get_context("spawn")
+    db_path = os.path.join(directory, f"{mode}.db")
+    results = context.Queue()
+    process = context.Process(target=_import, args=(db_path, csv_path, mode, results))
+    process.start()
+    result = results.get()
+    process.join()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure import throughput of large CSV files.")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Rows in the generated file (default: {ROWS})")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma separated import paths out of {', '.join(MODES)}")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "quotes.csv")
+        started = time.perf_counter()
+        write_csv(csv_path, args.rows)
+        size = os.path.getsize(csv_path) / 1024 / 1024
+        print(f"Wrote {args.rows} rows ({size:.0f} MB) in {time.perf_counter() - started:.1f}s")
+
+        print(f"{'import':<14} {'seconds':>9} {'rows/s':>9} {'MB/s':>7} {'books':>7} {'peak MB':>8} {'anon MB':>8}")
+        for mode in args.modes.split(","):
+            elapsed, inserted, books, peak, anon = measure(csv_path, mode, directory)
+            assert inserted == args.rows, f"{mode} import added {inserted} of {args.rows} rows"
+            anon = "-" if anon is None else f"{anon / 1024:.1f}"
+            print(f"{mode:<14} {elapsed:>9.1f} {inserted / elapsed:>9.0f} {size / elapsed:>7.2f} {books:>7} {peak / 1024:>8.1f} {anon:>8}")
+
+
+if __name__ == "__main__":
+    main()
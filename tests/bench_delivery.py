@@ -0,0 +1,106 @@
+"""
+Benchmark: database cost of delivering one quote.
+
+Compares the original delivery, which opened a connection to pick a quote
+and another one to commit its new last_seen, with the shared long-lived
+connections the bot uses now, on one temporary database:
+
+    python -m tests.bench_delivery
+    python -m tests.bench_delivery --rows 1000000 --deliveries 2000
+
+The per-call connection rows are measured once with the original
+COUNT(*) plus OFFSET pick and once with a primary key lookup, so the cost of
+the connections themselves can be told apart from the cost of the query.
+"""
+import os
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Quotes seeded by default
+ROWS = 100_000
+
+# Users served per scheduled run when measuring batched deliveries
+BATCH_USERS = 100
+
+
+def _per_call_delivery(db_path: str, pick_sql: str, pick_params) -> None:
+    """One delivery the original way: a connection to pick, another to update and commit."""
+    current_time = datetime.now()
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        row = cursor.execute(pick_sql, pick_params(cursor, current_time)).fetchone()
+    finally:
+        conn.close()
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE quotes SET last_seen = ? WHERE id = ?", (current_time + timedelta(hours=168), row[0]))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _count_offset_params(cursor: sqlite3.Cursor, current_time: datetime) -> tuple:
+    count = cursor.execute("SELECT COUNT(*) FROM quotes WHERE last_seen < ?", (current_time,)).fetchone()[0]
+    return current_time, random.randint(0, count - 1)
+
+
+def _id_params(cursor: sqlite3.Cursor, current_time: datetime) -> tuple:
+    max_id = cursor.execute("SELECT MAX(id) FROM quotes").fetchone()[0]
+    return (random.randint(1, max_id),)
+
+
+def timed_calls(func, calls: int) -> float:
+    """Returns the mean seconds per call of func over calls calls."""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure the database cost of one quote delivery.")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Quotes to seed (default: {ROWS})")
+    parser.add_argument("--deliveries", type=int, default=1000, help="Timed deliveries per variant (default: 1000)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "bench.db")
+        os.environ["QUOTES_DB_PATH"] = db_path
+        from app.get_random_line import pick_unseen_quotes, reserve_random_quotes
+        from db.connection import close_connections
+        from db.db_fill_in import db_fill_in_rows
+
+        db_fill_in_rows((f"Book {i % 1000}", f"Author {i % 300}", f"Delivered quote {i}") for i in range(args.rows))
+        users = iter(range(1, 10**9))
+
+        variants = {
+            "per-call connections, COUNT + OFFSET (original)": lambda: _per_call_delivery(
+                db_path, "SELECT id, content FROM quotes WHERE last_seen < ? LIMIT 1 OFFSET ?", _count_offset_params,
+            ),
+            "per-call connections, id lookup": lambda: _per_call_delivery(
+                db_path, "SELECT id, content FROM quotes WHERE id = ?", _id_params,
+            ),
+            "shared connection, reserve_random_quotes(1)": lambda: reserve_random_quotes(1),
+            "shared connection, pick_unseen_quotes, 1 user": lambda: pick_unseen_quotes([next(users)]),
+        }
+        print(f"{'delivery':<52} {'ms each':>9}")
+        for name, deliver in variants.items():
+            deliver()
+            print(f"{name:<52} {timed_calls(deliver, args.deliveries) * 1000:>9.3f}")
+
+        batches = max(1, args.deliveries // BATCH_USERS)
+        batch = lambda: pick_unseen_quotes([next(users) for _ in range(BATCH_USERS)])
+        per_user = timed_calls(batch, batches) / BATCH_USERS
+        print(f"{f'shared connection, pick_unseen_quotes, {BATCH_USERS} users':<52} {per_user * 1000:>9.3f}")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
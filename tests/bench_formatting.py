@@ -0,0 +1,117 @@
+"""
+Micro-benchmark: cost of formatting one quote message.
+
+Times, per message, the formatting the original bot did on every send,
+escaping on every send without caches, and render_quote with a stored
+payload on a cache miss and on a hit. Also reports the memory held by a
+broadcast of rendered messages, as queued for sending:
+
+    python -m tests.bench_formatting
+    python -m tests.bench_formatting --quotes 2000 --repeat 20
+
+No database is needed, the quotes are built in memory.
+"""
+import time
+import random
+import argparse
+import tracemalloc
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from app import messages
+from app.messages import encode_payload, decode_payload, format_quote, rating_keyboard, render_payload, render_quote
+
+# Distinct quotes formatted by default
+QUOTES = 5000
+
+# Books the quotes are spread over
+BOOKS = 200
+
+
+def make_quotes(count: int) -> list[dict]:
+    """Quotes with MarkdownV2 special characters, stored payloads and hashes, as read from the database."""
+    rng = random.Random(1)
+    words = "time patience (river) light_ *silence* morning-stone road. letter! [note] #1 ~ wait".split()
+    quotes = []
+    for id in range(1, count + 1):
+        content = " ".join(rng.choices(words, k=rng.randint(10, 60)))
+        book = rng.randrange(BOOKS)
+        quotes.append({
+            'id': id,
+            'content': content,
+            'book': f"Book {book}: a (long) title",
+            'author': f"Author {book % 50}",
+            'payload': decode_payload(encode_payload(render_payload(content))),
+            'content_hash': f"{id:040x}",
+        })
+    return quotes
+
+
+def original_format(quote: dict) -> tuple[str, InlineKeyboardMarkup]:
+    """The formatting the bot originally did on every send, unescaped Markdown and a new keyboard."""
+    message = f"{quote['content']}\n\n*{quote['book']}*\n_{quote['author']}_"
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("👍 Like", callback_data=f"like_{quote['id']}"),
+        InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{quote['id']}"),
+    ]])
+    return message, keyboard
+
+
+def uncached_format(quote: dict) -> tuple[str, InlineKeyboardMarkup]:
+    """Escaping and a new keyboard on every send, without the render or signature caches."""
+    messages.format_source.cache_clear()
+    return format_quote(quote), rating_keyboard(quote['id'])
+
+
+def cold_render(quote: dict) -> tuple[list[str], InlineKeyboardMarkup]:
+    """render_quote on a render cache miss, the stored payload is reused."""
+    messages._rendered.pop((quote['id'], quote['content_hash']))
+    return render_quote(quote)
+
+
+def per_message(func, quotes: list[dict], repeat: int) -> float:
+    """Returns the mean seconds per call of func over every quote, repeat times."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for quote in quotes:
+            func(quote)
+    return (time.perf_counter() - started) / (repeat * len(quotes))
+
+
+def held_memory(func, quotes: list[dict]) -> float:
+    """Returns the bytes per message allocated and kept by rendering every quote once."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rendered = [func(quote) for quote in quotes]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del rendered
+    return held / len(quotes)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure the cost of formatting one quote message.")
+    parser.add_argument("--quotes", type=int, default=QUOTES, help=f"Distinct quotes (default: {QUOTES})")
+    parser.add_argument("--repeat", type=int, default=10, help="Passes over the quotes (default: 10)")
+    args = parser.parse_args(argv)
+
+    quotes = make_quotes(args.quotes)
+    messages._rendered = messages.TTLCache(maxsize=max(args.quotes, messages.RENDER_CACHE_SIZE), ttl=3600)
+    for quote in quotes:
+        render_quote(quote)
+
+    variants = {
+        "original f-string, new keyboard": original_format,
+        "escaped on every send, no caches": uncached_format,
+        "render_quote, cache miss": cold_render,
+        "render_quote, cache hit": render_quote,
+    }
+    print(f"{'formatting':<34} {'µs/message':>11} {'bytes kept':>11}")
+    for name, func in variants.items():
+        seconds = per_message(func, quotes, args.repeat)
+        held = held_memory(func, quotes)
+        print(f"{name:<34} {seconds * 1e6:>11.2f} {held:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
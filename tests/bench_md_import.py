@@ -0,0 +1,95 @@
+"""
+Benchmark: import throughput and memory of large markdown exports.
+
+Writes a synthetic export in the reading-app format (a million quotes,
+a few hundred megabytes by default) and imports it into an empty database
+in a fresh process, streamed as uploaded files are, and optionally also
+parsed into a list first as parse_md_to_quotes does:
+
+    python -m tests.bench_md_import
+    python -m tests.bench_md_import --quotes 200000 --modes stream,list
+
+The streamed import's anonymous memory should stay flat however large the
+file is, the list import's grows with it. Peak RSS also counts the database
+pages SQLite reads through mmap, as in tests/bench_csv_import.py.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+from tests.bench_pdf import peak_rss_kb
+from tests.bench_csv_import import rss_anon_kb
+
+# Quotes written by default
+QUOTES = 1_000_000
+
+# Import paths that can be measured
+MODES = ("stream", "list")
+
+
+def write_md(path: str, quotes: int) -> None:
+    """Writes an export with a metadata section, a heading section and quotes of varying length."""
+    rng = random.Random(1)
+    words = "время терпение река свет тишина утро камень дорога письмо time patience river light".split()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("---\nНазвание: Большая книга\nАвтор: Автор\n---\n# Цитаты\n")
+        for number in range(quotes):
+            paragraphs = (" ".join(rng.choices(words, k=rng.randint(10, 30))) for _ in range(rng.randint(1, 3)))
+            file.write(f"---\nЦитата {number}. " + "\n\n".join(paragraphs) + "\n")
+
+
+def _import(db_path: str, md_path: str, mode: str, results: multiprocessing.Queue) -> None:
+    """Runs in a fresh process: imports the file and reports the time, quotes and memory."""
+    os.environ["QUOTES_DB_PATH"] = db_path
+    logging.basicConfig(level=logging.WARNING, force=True)
+    from app.quotes_from_md import import_md_file, parse_md_to_quotes
+    from db.db_fill_in import db_fill_in
+
+    started = time.perf_counter()
+    result = import_md_file(md_path) if mode == "stream" else db_fill_in(parse_md_to_quotes(md_path))
+    elapsed = time.perf_counter() - started
+    results.put((elapsed, result.inserted, peak_rss_kb(), rss_anon_kb()))
+
+
+def measure(md_path: str, mode: str, directory: str) -> tuple[float, int, int, int | None]:
+    """Imports the file into a new database in a new process."""
+    context = multiprocessing.get_context("spawn")
+    db_path = os.path.join(directory, f"{mode}.db")
+    results = context.Queue()
+    process = context.Process(target=_import, args=(db_path, md_path, mode, results))
+    process.start()
+    result = results.get()
+    process.join()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure import throughput of large markdown exports.")
+    parser.add_argument("--quotes", type=int, default=QUOTES, help=f"Quotes in the generated file (default: {QUOTES})")
+    parser.add_argument("--modes", default="stream", help=f"Comma separated import paths out of {', '.join(MODES)} (default: stream)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        md_path = os.path.join(directory, "export.md")
+        started = time.perf_counter()
+        write_md(md_path, args.quotes)
+        size = os.path.getsize(md_path) / 1024 / 1024
+        print(f"Wrote {args.quotes} quotes ({size:.0f} MB) in {time.perf_counter() - started:.1f}s")
+
+        print(f"{'import':<8} {'seconds':>9} {'quotes/s':>9} {'MB/s':>7} {'peak MB':>8} {'anon MB':>8}")
+        for mode in args.modes.split(","):
+            elapsed, inserted, peak, anon = measure(md_path, mode, directory)
+            assert inserted == args.quotes, f"{mode} import added {inserted} of {args.quotes} quotes"
+            anon = "-" if anon is None else f"{anon / 1024:.1f}"
+            print(f"{mode:<8} {elapsed:>9.1f} {inserted / elapsed:>9.0f} {size / elapsed:>7.2f} {peak / 1024:>8.1f} {anon:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: peak memory and wall time of building the best quotes PDF.
+
+Each size is built in a fresh process from a temporary database in which
+every quote is liked, so the peak RSS reported is that build's alone:
+
+    python -m tests.bench_pdf                        # 1k, 10k and 100k quotes
+    python -m tests.bench_pdf --sizes 1000,5000 --max-pages 0
+
+The wall time grows linearly with the number of quotes. The peak RSS also
+counts SQLite's page cache and the memory-mapped pages of the database
+file (see PRAGMAS in db/connection.py), which grow with the file and can
+be reclaimed by the kernel, on top of the small window of flowables the
+streaming build holds.
+"""
+import os
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+# Sizes measured by default
+SIZES = (1000, 10000, 100000)
+
+
+def seed_database(db_path: str, size: int) -> None:
+    """Fills a new database with size liked quotes of varying length."""
+    os.environ["QUOTES_DB_PATH"] = db_path
+    from db.connection import close_connections, transaction
+    from db.db_fill_in import db_fill_in_rows
+
+    db_fill_in_rows(
+        (f"Book {i % 200}", f"Author {i % 50}", f"Benchmark quote {i} " + "about patience and time " * (1 + i % 8))
+        for i in range(size)
+    )
+    with transaction() as conn:
+        conn.execute("UPDATE quotes SET score = 1 + id % 5")
+    close_connections()
+
+
+def peak_rss_kb() -> int:
+    """
+    Returns the peak resident set size of this process in kilobytes.
+
+    Read from VmHWM on Linux, since ru_maxrss survives exec and would include
+    the parent's peak, with ru_maxrss as the fallback elsewhere.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _build(db_path: str, output_dir: str, size: int, max_pages: int | None, results: multiprocessing.Queue) -> None:
+    """Runs in a fresh process: builds the volumes and reports the time, RSS and volume count."""
+    os.environ["QUOTES_DB_PATH"] = db_path
+    from app.make_pdf import make_pdf_volumes
+
+    before = peak_rss_kb()
+    started = time.perf_counter()
+    paths = make_pdf_volumes(os.path.join(output_dir, "best_quotes.pdf"), limit=size, max_pages=max_pages)
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_kb()
+    results.put((elapsed, before, peak, len(paths or [])))
+
+
+def measure(size: int, max_pages: int | None) -> tuple[float, int, int, int]:
+    """Seeds a database with size quotes and builds its PDF in a new process."""
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "bench.db")
+        seed_database(db_path, size)
+        results = context.Queue()
+        process = context.Process(target=_build, args=(db_path, directory, size, max_pages, results))
+        process.start()
+        result = results.get()
+        process.join()
+    return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure peak RSS and wall time of the best quotes PDF build.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma separated numbers of liked quotes")
+    parser.add_argument(
+        "--max-pages", type=int, default=None,
+        help="Pages per volume, 0 for a single document (default: MAX_PDF_PAGES)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    from app.make_pdf import MAX_PAGES_PER_VOLUME
+    max_pages = MAX_PAGES_PER_VOLUME if args.max_pages is None else (args.max_pages or None)
+
+    print(f"{'quotes':>8} {'seconds':>9} {'quotes/s':>9} {'start MB':>9} {'peak MB':>8} {'volumes':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        elapsed, before, peak, volumes = measure(size, max_pages)
+        print(f"{size:>8} {elapsed:>9.2f} {size / elapsed:>9.0f} {before / 1024:>9.1f} {peak / 1024:>8.1f} {volumes:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: latency of picking a random quote as the table grows.
+
+Grows one temporary database through the given sizes and, at each size,
+times the pickers behind the random button and the scheduled sends, next
+to the original COUNT(*) plus LIMIT 1 OFFSET n query they replaced:
+
+    python -m tests.bench_random_quote
+    python -m tests.bench_random_quote --sizes 1000,10000,100000 --picks 200
+
+The pickers should take about the same time at every size, the original
+query grows linearly with the table.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+# Table sizes measured by default
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def grow_database(start: int, stop: int) -> None:
+    """Adds quotes start to stop - 1."""
+    from db.db_fill_in import db_fill_in_rows
+
+    db_fill_in_rows((f"Book {i % 1000}", f"Author {i % 300}", f"Random quote {i}") for i in range(start, stop))
+
+
+def count_offset_pick() -> tuple | None:
+    """The original selection: counts the eligible quotes, then skips to a random one of them."""
+    from db.connection import get_connection
+
+    cursor = get_connection().cursor()
+    current_time = datetime.now()
+    cursor.execute("SELECT COUNT(*) FROM quotes WHERE last_seen < ?", (current_time,))
+    count = cursor.fetchone()[0]
+    if count == 0:
+        return None
+    cursor.execute(
+        "SELECT id, content FROM quotes WHERE last_seen < ? LIMIT 1 OFFSET ?",
+        (current_time, random.randint(0, count - 1)),
+    )
+    return cursor.fetchone()
+
+
+def timed_calls(func, calls: int) -> float:
+    """Returns the mean seconds per call of func over calls calls."""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure random quote latency against table size.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma separated table sizes, ascending")
+    parser.add_argument("--picks", type=int, default=500, help="Timed picks per picker and size (default: 500)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["QUOTES_DB_PATH"] = os.path.join(directory, "bench.db")
+        from app import get_random_line
+        from app.get_random_line import draw_quotes, get_random_quote, pick_unseen_quotes
+        from db.connection import close_connections
+
+        pickers = {
+            "get_random_quote, weighted": ("weighted", get_random_quote),
+            "get_random_quote, uniform": ("uniform", get_random_quote),
+            "draw_quotes(1), weighted": ("weighted", lambda: draw_quotes(1)),
+            "pick_unseen_quotes, weighted": ("weighted", lambda: pick_unseen_quotes([random.randint(1, 10**9)])),
+            "COUNT + OFFSET (original)": ("uniform", count_offset_pick),
+        }
+        sizes = [int(size) for size in args.sizes.split(",")]
+        print(f"{'picker':<30}" + "".join(f"{size:>12}" for size in sizes) + "  (ms per pick)")
+        timings = {name: [] for name in pickers}
+        seeded = 0
+        for size in sizes:
+            grow_database(seeded, size)
+            seeded = size
+            # Loaded again for the grown table, outside the timings
+            get_random_line._sampler = None
+            get_random_line.QUOTE_SELECTION = "weighted"
+            get_random_line._get_sampler()
+            sampler = get_random_line._sampler
+            for name, (selection, pick) in pickers.items():
+                get_random_line.QUOTE_SELECTION = selection
+                get_random_line._sampler = sampler if selection == "weighted" else None
+                pick()
+                timings[name].append(timed_calls(pick, args.picks))
+        for name, seconds in timings.items():
+            print(f"{name:<30}" + "".join(f"{value * 1000:>12.3f}" for value in seconds))
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
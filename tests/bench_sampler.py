@@ -0,0 +1,91 @@
+"""
+Benchmark: weighted quote draws on a large catalogue.
+
+Seeds a temporary database (a million quotes by default) with random
+ratings, then times loading the weighted sampler, raw draws from its
+Fenwick tree, rating updates and the database-backed pickers in both
+selection modes:
+
+    python -m tests.bench_sampler
+    python -m tests.bench_sampler --rows 100000 --draws 50000
+
+The per-draw cost should stay in microseconds however many rows there are,
+only the load grows with the table.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+# Rows seeded by default
+ROWS = 1_000_000
+
+
+def seed_database(db_path: str, rows: int) -> None:
+    """Fills a new database with rows quotes, about a tenth of them rated."""
+    os.environ["QUOTES_DB_PATH"] = db_path
+    from db.connection import transaction
+    from db.db_fill_in import db_fill_in_rows
+
+    db_fill_in_rows((f"Book {i % 1000}", f"Author {i % 300}", f"Sampler quote {i}") for i in range(rows))
+    with transaction() as conn:
+        conn.execute("UPDATE quotes SET score = (id * 7919) % 11 - 5 WHERE id % 10 = 0")
+
+
+def timed_calls(func, calls: int) -> float:
+    """Returns the mean seconds per call of func over calls calls."""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<40} {seconds * 1e6:>12.1f} µs")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure weighted quote draws on a large catalogue.")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Quotes to seed (default: {ROWS})")
+    parser.add_argument("--draws", type=int, default=100000, help="Raw sampler draws to time (default: 100000)")
+    parser.add_argument("--picks", type=int, default=500, help="Database-backed picks to time (default: 500)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        seed_database(os.path.join(directory, "bench.db"), args.rows)
+        print(f"Seeded {args.rows} quotes in {time.perf_counter() - started:.1f}s")
+
+        from app import get_random_line
+        from app.get_random_line import draw_quotes, pick_unseen_quotes, reserve_random_quotes
+        from app.weighted_sampler import WeightedQuoteSampler
+        from db.connection import close_connections, get_connection
+
+        sampler = WeightedQuoteSampler()
+        started = time.perf_counter()
+        sampler.load(get_connection().cursor())
+        print(f"Loaded the sampler in {time.perf_counter() - started:.2f}s")
+
+        # Hidden until now, so every drawn quote is eligible again for the next draw
+        now = datetime.now()
+        report("sampler.draw(1)", timed_calls(lambda: sampler.draw(1, now, now), args.draws))
+        report("sampler.sample(8)", timed_calls(lambda: sampler.sample(8), args.draws // 8))
+        deltas = {random.randint(1, args.rows): [1, 0] for _ in range(1000)}
+        report("apply_rating_deltas, per quote", timed_calls(lambda: sampler.apply_rating_deltas(deltas), 10) / len(deltas))
+
+        for selection in ("weighted", "uniform"):
+            get_random_line.QUOTE_SELECTION = selection
+            get_random_line._sampler = sampler if selection == "weighted" else None
+            report(f"reserve_random_quotes(1), {selection}", timed_calls(lambda: reserve_random_quotes(1), args.picks))
+            report(f"draw_quotes(64), {selection}", timed_calls(lambda: draw_quotes(64), args.picks // 10))
+            user_ids = iter(range(1, args.picks + 1))
+            report(f"pick_unseen_quotes, {selection}", timed_calls(lambda: pick_unseen_quotes([next(user_ids)]), args.picks))
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: /search query latency on a large catalogue.
+
+Seeds a temporary database (a million quotes by default) with text drawn
+from a synthetic vocabulary whose word frequencies fall off like natural
+language, then times search_quotes for queries of different selectivity:
+
+    python -m tests.bench_search
+    python -m tests.bench_search --rows 100000 --queries 200
+
+The cost follows the number of matching quotes, since all of them are
+ranked: rare words and names take about a millisecond on a million quotes,
+while a single very common word matching a fifth of the catalogue takes
+most of a second.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+# Rows seeded by default
+ROWS = 1_000_000
+
+# Distinct words of the synthetic vocabulary
+VOCABULARY = 20000
+
+# Words per synthetic quote
+QUOTE_WORDS = (6, 20)
+
+# Distinct books and authors, named with words outside the vocabulary
+BOOKS = 5000
+AUTHORS = 1500
+
+
+def _word(rank: int) -> str:
+    """Spells a vocabulary rank as a pronounceable, unique word."""
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    letters = []
+    rank += 1
+    while rank:
+        rank, consonant = divmod(rank, len(consonants))
+        rank, vowel = divmod(rank, len(vowels))
+        letters.append(consonants[consonant] + vowels[vowel])
+    return "".join(letters)
+
+
+def _book(number: int) -> str:
+    return f"The {_word(VOCABULARY + AUTHORS + number).title()}"
+
+
+def _author(number: int) -> str:
+    return _word(VOCABULARY + number).title()
+
+
+def _zipf_words(rng: random.Random, count: int) -> list[str]:
+    """Draws count words, the word of rank r about 1/r as often as the most common one."""
+    ranks = (int(VOCABULARY ** rng.random()) - 1 for _ in range(count))
+    return [_word(rank) for rank in ranks]
+
+
+def seed_database(db_path: str, rows: int) -> None:
+    os.environ["QUOTES_DB_PATH"] = db_path
+    from db.db_fill_in import db_fill_in_rows
+
+    rng = random.Random(1)
+    db_fill_in_rows(
+        (_book(i % BOOKS), _author(i % AUTHORS), " ".join(_zipf_words(rng, rng.randint(*QUOTE_WORDS))))
+        for i in range(rows)
+    )
+
+
+def query_sets() -> dict[str, list[str]]:
+    """Queries grouped by how many quotes they match."""
+    rng = random.Random(2)
+    return {
+        "rare word": [_word(rng.randint(5000, VOCABULARY - 1)) for _ in range(50)],
+        "two mid-frequency words": [f"{_word(rng.randint(50, 500))} {_word(rng.randint(50, 500))}" for _ in range(50)],
+        "author name": [_author(rng.randrange(AUTHORS)) for _ in range(50)],
+        "prefix of a rare word": [_word(rng.randint(5000, VOCABULARY - 1))[:4] for _ in range(50)],
+        "common word": [_word(rng.randint(0, 9)) for _ in range(10)],
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure /search query latency on a large catalogue.")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Quotes to seed (default: {ROWS})")
+    parser.add_argument("--queries", type=int, default=100, help="Timed runs per query group (default: 100)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        seed_database(os.path.join(directory, "bench.db"), args.rows)
+        print(f"Seeded {args.rows} quotes in {time.perf_counter() - started:.1f}s")
+
+        from db.connection import close_connections, get_connection
+        from db.db_search import build_match_query, search_quotes
+
+        print(f"{'query':<26} {'matches':>9} {'mean ms':>9} {'p99 ms':>9}")
+        for name, queries in query_sets().items():
+            # Matches of the group's first query, counting them also warms the page cache
+            matches = get_connection().execute(
+                "SELECT COUNT(*) FROM quotes_fts WHERE quotes_fts MATCH ?", (build_match_query(queries[0]),)
+            ).fetchone()[0]
+            timings = []
+            for number in range(args.queries):
+                query = queries[number % len(queries)]
+                started = time.perf_counter()
+                search_quotes(query, 0, 5)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            mean = sum(timings) / len(timings)
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            print(f"{name:<26} {matches:>9} {mean * 1000:>9.3f} {p99 * 1000:>9.3f}")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import pytest
+
+from app import get_random_line
+from db.connection import close_connections
+from tests.fake_telegram import FakeTelegram
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Points the connections at an empty database in a temporary directory."""
+    path = tmp_path / "quotes.db"
+    monkeypatch.setenv("QUOTES_DB_PATH", str(path))
+    # The weighted sampler is loaded once per process, from whichever database came first
+    monkeypatch.setattr(get_random_line, "_sampler", None)
+    yield str(path)
+    close_connections()
+
+
+@pytest.fixture
+def fake_telegram(monkeypatch):
+    """Starts a fake Bot API and points the bot at it."""
+    from app import bot
+    with FakeTelegram() as fake:
+        monkeypatch.setattr(bot, "TELEGRAM_API_URL", fake.url)
+        yield fake
@@ -0,0 +1,214 @@
+"""
+A local stand-in for the Telegram Bot API, for tests and load harnesses.
+
+The bot is pointed at it through TELEGRAM_API_URL. Every call is recorded
+with its parameters and the time it arrived, messages get made-up ids, and
+uploaded documents can be served for getFile. Calls can be made to fail with
+429 Too Many Requests to exercise RetryAfter handling.
+"""
+import json
+import time
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Quotes", "username": "quotes_test_bot"}
+
+# Methods answered with a message, the rest are answered with True
+MESSAGE_METHODS = {"sendMessage", "sendDocument", "editMessageText"}
+
+
+class _Server(ThreadingHTTPServer):
+    # Bursts of concurrent calls must not be refused by a short listen backlog
+    request_queue_size = 1024
+
+
+@dataclass
+class Call:
+    method: str
+    params: dict
+    at: float = field(default_factory=time.monotonic)
+
+
+def _parse_params(content_type: str, body: bytes) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_content()
+            for part in message.iter_parts()
+            if part.get_filename() is None
+        }
+    return dict(parse_qsl(body.decode()))
+
+
+class FakeTelegram:
+    """
+    Fake Bot API server on a free local port, running in a background thread.
+
+    Attributes:
+        url (str): Base URL to use as TELEGRAM_API_URL
+        calls (list[Call]): Every API call received, in order
+    """
+
+    def __init__(self) -> None:
+        self.calls: list[Call] = []
+        self._files: dict[str, bytes] = {}
+        self._failures: dict[str, list[int]] = {}
+        self._message_ids = itertools.count(1000)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeTelegram":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_file(self, file_id: str, content: bytes) -> None:
+        """Makes a document downloadable through getFile."""
+        self._files[file_id] = content
+
+    def fail_next(self, method: str, retry_after: int = 1, times: int = 1) -> None:
+        """Answers the next calls of a method with 429 Too Many Requests."""
+        with self._lock:
+            self._failures.setdefault(method, []).extend([retry_after] * times)
+
+    def calls_to(self, method: str, chat_id: int | None = None) -> list[Call]:
+        """Returns the recorded calls of a method, optionally only those to one chat."""
+        with self._lock:
+            calls = list(self.calls)
+        return [
+            call for call in calls
+            if call.method == method and (chat_id is None or str(call.params.get("chat_id")) == str(chat_id))
+        ]
+
+    async def wait_for(self, method: str, chat_id: int | None = None, count: int = 1, timeout: float = 10) -> list[Call]:
+        """Waits until at least count calls of a method were received and returns them."""
+        deadline = time.monotonic() + timeout
+        while len(calls := self.calls_to(method, chat_id)) < count:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Expected {count} {method} calls to {chat_id}, got {len(calls)}")
+            await asyncio.sleep(0.01)
+        return calls
+
+    def _answer(self, method: str, params: dict) -> tuple[int, dict]:
+        with self._lock:
+            self.calls.append(Call(method, params))
+            failures = self._failures.get(method)
+            retry_after = failures.pop(0) if failures else None
+        if retry_after is not None:
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "getFile":
+            file_id = params["file_id"]
+            return 200, {"ok": True, "result": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self._files.get(file_id, b"")),
+                "file_path": f"documents/{file_id}",
+            }}
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            return 200, {"ok": True, "result": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }}
+        return 200, {"ok": True, "result": True}
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API, instead of a connection per call
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, Nagle would hold the body back for the ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, answer = fake._answer(method, _parse_params(self.headers.get("Content-Type", ""), body))
+                self._reply(status, json.dumps(answer).encode(), "application/json")
+
+            def do_GET(self) -> None:
+                # /file/bot<token>/documents/<file_id>
+                content = fake._files.get(self.path.rsplit("/", 1)[-1])
+                if content is None:
+                    self.send_error(404)
+                    return
+                self._reply(200, content, "application/octet-stream")
+
+            def _reply(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def message_update(update_id: int, user_id: int, text: str | None = None, document: dict | None = None) -> dict:
+    """Builds a raw private-chat message update, a command if text starts with /."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if document is not None:
+        message["document"] = document
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+    """Builds a raw callback query update for a button under one of the bot's messages."""
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id),
+        "from": user(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": BOT_USER,
+            "text": "quote",
+        },
+    }}
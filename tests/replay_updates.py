@@ -0,0 +1,182 @@
+"""
+Load harness: replays updates against the bot's webhook and measures updates per second.
+
+By default the bot is started with main.py in its own process, in webhook
+or sharded mode, against the fake Bot API and a temporary database seeded
+with quotes:
+
+    python -m tests.replay_updates                       # synthetic mix of updates
+    python -m tests.replay_updates updates.jsonl         # recorded updates, one JSON object per line
+    python -m tests.replay_updates --mode sharded --workers 4
+
+Accepted is how fast the webhook takes the updates, handled is how long
+until the bot made its last Bot API call for them. With --url the updates
+are posted to a bot that is already running, and only the accepted rate is
+measured.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from tests.fake_telegram import FakeTelegram, callback_update, message_update
+
+SECRET = "replay-secret"
+
+# Seeded quotes for the started bot
+SEED_QUOTES = 10000
+
+# Seconds without Bot API calls after which the bot is taken to be done
+QUIET_PERIOD = 2
+
+# Seconds the bot gets to start
+STARTUP_TIMEOUT = 60
+
+
+def synthetic_updates(count: int, users: int) -> list[dict]:
+    """A mix of /start, random quote presses, searches and rating buttons from many users."""
+    from app.messages import RANDOM_QUOTE_BUTTON
+
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = random.randint(1, users)
+        kind = random.random()
+        if kind < 0.4:
+            updates.append(message_update(update_id, user_id, RANDOM_QUOTE_BUTTON))
+        elif kind < 0.6:
+            updates.append(message_update(update_id, user_id, "/search quote"))
+        elif kind < 0.8:
+            updates.append(callback_update(update_id, user_id, f"like_{random.randint(1, SEED_QUOTES)}", update_id))
+        else:
+            updates.append(message_update(update_id, user_id, "/start"))
+    return updates
+
+
+def load_updates(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def post_all(url: str, updates: list[dict], concurrency: int, secret: str = SECRET) -> float:
+    """Posts every update, concurrency at a time, and returns the seconds it took."""
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        async def worker() -> None:
+            while not queue.empty():
+                response = await client.post(url, json=queue.get_nowait(), headers=headers)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def wait_until_quiet(fake: FakeTelegram, since: float) -> float:
+    """Waits until the bot stops calling the Bot API and returns the time of its last call, at least since."""
+    while True:
+        last = max(since, fake.calls[-1].at if fake.calls else since)
+        if time.monotonic() - last > QUIET_PERIOD:
+            return last
+        await asyncio.sleep(0.1)
+
+
+def seed_database(db_path: str) -> None:
+    os.environ["QUOTES_DB_PATH"] = db_path
+    from db.connection import close_connections
+    from db.db_fill_in import db_fill_in_rows
+
+    db_fill_in_rows([(f"Book {i % 100}", f"Author {i % 30}", f"Replay quote {i}") for i in range(SEED_QUOTES)])
+    close_connections()
+
+
+def start_bot(fake: FakeTelegram, directory: str, mode: str, workers: int, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123:replay",
+        TELEGRAM_API_URL=fake.url,
+        QUOTES_DB_PATH=os.path.join(directory, "replay.db"),
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_SECRET=SECRET,
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(port),
+        # Replies go to the fake API, Telegram's global send limit does not apply
+        MAX_SENDS_PER_SECOND="100000",
+    )
+    log = open(os.path.join(directory, "bot.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "main.py", "--mode", mode, "--workers", str(workers)],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def replay_against_started_bot(updates: list[dict], args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory, FakeTelegram() as fake:
+        seed_database(os.path.join(directory, "replay.db"))
+        bot = start_bot(fake, directory, args.mode, args.workers, args.port)
+        try:
+            await fake.wait_for("setWebhook", timeout=STARTUP_TIMEOUT)
+            # Sharded workers start after the dispatcher has registered the webhook
+            await asyncio.sleep(5 if args.mode == "sharded" else 0.5)
+            calls_before = len(fake.calls)
+
+            started = time.monotonic()
+            accepted = await post_all(f"http://127.0.0.1:{args.port}/telegram", updates, args.concurrency)
+            handled = await wait_until_quiet(fake, time.monotonic()) - started
+        finally:
+            bot.send_signal(signal.SIGINT)
+            try:
+                bot.wait(30)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+            if bot.returncode not in (0, -signal.SIGINT):
+                with open(os.path.join(directory, "bot.log")) as log:
+                    print(log.read()[-3000:], file=sys.stderr)
+
+    count = len(updates)
+    print(f"{args.mode} mode, {args.workers if args.mode == 'sharded' else 1} bot process(es)")
+    print(f"{count} updates accepted in {accepted:.2f}s ({count / accepted:.0f} updates/s)")
+    print(f"{count} updates handled in {handled:.2f}s ({count / handled:.0f} updates/s)")
+    print(f"{len(fake.calls) - calls_before} Bot API calls made")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay updates against the bot's webhook.")
+    parser.add_argument("updates", nargs="?", help="JSON lines file of recorded updates (default: synthetic)")
+    parser.add_argument("--count", type=int, default=5000, help="Synthetic updates to send (default: 5000)")
+    parser.add_argument("--users", type=int, default=1000, help="Distinct users of synthetic updates (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight (default: 32)")
+    parser.add_argument("--mode", choices=("webhook", "sharded"), default="webhook", help="Mode the bot is started in")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes in sharded mode (default: 2)")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the started bot's webhook (default: 8765)")
+    parser.add_argument("--url", help="Webhook of a running bot instead of starting one")
+    parser.add_argument("--secret", default=SECRET, help="Secret token of the running bot")
+    args = parser.parse_args(argv)
+    # Every posted update would be logged
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count, args.users)
+
+    if args.url:
+        elapsed = asyncio.run(post_all(args.url, updates, args.concurrency, args.secret))
+        print(f"{len(updates)} updates accepted in {elapsed:.2f}s ({len(updates) / elapsed:.0f} updates/s)")
+        return
+
+    asyncio.run(replay_against_started_bot(updates, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Ranking of liked quotes: by score, then alphabetically by book, read in index order.
+"""
+from db.connection import get_connection, transaction
+from db.db_fill_in import db_fill_in_rows
+from db.db_modify import modify_cell
+from db.db_ratings import BEST_QUOTES_ORDER, get_best_quotes_page, iter_best_quotes
+
+BOOKS = ["zen", "Anna", "bell", None, "Carol", "alpha"]
+
+
+def _expected_ranking() -> list[tuple]:
+    rows = get_connection().execute(
+        'SELECT id, book, score FROM quotes_view WHERE score > 0'
+    ).fetchall()
+    rows.sort(key=lambda row: (-row[2], row[1] is not None, (row[1] or '').lower(), row[0]))
+    return [row[0] for row in rows]
+
+
+def test_best_quotes_are_ranked_by_score_then_book(db_path):
+    db_fill_in_rows([(BOOKS[i % len(BOOKS)], "Author", f"Quote {i}") for i in range(60)])
+    with transaction() as conn:
+        conn.execute('UPDATE quotes SET score = id % 3 WHERE id % 2 = 0')
+    modify_cell(2, 'book', 'Aardvark')
+
+    expected = _expected_ranking()
+    assert [quote['id'] for page in range(3) for quote in get_best_quotes_page(page, 7)] == expected[:21]
+    contents = {row[0]: row[1] for row in get_connection().execute('SELECT id, content FROM quotes')}
+    assert [content for content, _, _ in iter_best_quotes()] == [contents[id] for id in expected]
+    assert get_connection().execute('SELECT book_sort FROM quotes WHERE id = 2').fetchone()[0] == 'Aardvark'
+
+
+def test_best_quotes_are_not_sorted_per_query(db_path):
+    db_fill_in_rows([("Book", "Author", "Quote")])
+    plan = get_connection().execute(f'''
+        EXPLAIN QUERY PLAN
+        SELECT q.id FROM quotes q WHERE q.score > 0 ORDER BY {BEST_QUOTES_ORDER} LIMIT 20
+    ''').fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "idx_quotes_best" in details
+    assert "TEMP B-TREE" not in details
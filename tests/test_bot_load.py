@@ -0,0 +1,134 @@
+"""
+Load test: many users ask for random quotes, vote and search while another
+user's large CSV upload is being imported, against a fake Bot API.
+
+Every first press loads the user's seen history and refills the prefetch
+ring from the database, and votes are flushed during the import, so both
+go through the thread pool the import also uses.
+"""
+import time
+import asyncio
+
+from telegram import Update
+
+from app import bot
+from app.cache import TTLCache
+from app.get_random_line import on_ratings_flushed
+from app.messages import ADD_QUOTES_BUTTON, RANDOM_QUOTE_BUTTON
+from app.prefetch import QuotePrefetcher
+from db.connection import get_connection
+from db.db_fill_in import db_fill_in_rows
+from db.db_ratings import RatingBuffer
+from tests.fake_telegram import callback_update, message_update
+
+# Rows in the uploaded file, a few seconds of import work
+UPLOAD_ROWS = 40000
+
+# Users pressing buttons and searching during the import
+USERS = 40
+
+# Chat ids of the users asking for random quotes, voting and searching
+RANDOM_USERS = 1000
+VOTING_USERS = 2000
+SEARCHING_USERS = 3000
+
+# Slowest acceptable answer to a button press while the import runs
+MAX_P99_LATENCY = 0.5
+
+
+def _csv(rows: int) -> bytes:
+    lines = ["source,author,quote"]
+    lines += [f"Book {i % 50},Author {i % 20},Uploaded quote number {i} about patience and time" for i in range(rows)]
+    return "\n".join(lines).encode()
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+async def _run(fake) -> dict:
+    application = bot.build_application("123:test", with_updater=False)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    async def put(raw: dict) -> None:
+        await application.update_queue.put(Update.de_json(raw, application.bot))
+
+    async def idle() -> None:
+        # The conversation state is stored after the handler returns, i.e. after its reply
+        while application.update_queue.qsize() or application.update_processor.current_concurrent_updates:
+            await asyncio.sleep(0.01)
+
+    try:
+        uploader = 1
+        await put(message_update(1, uploader, ADD_QUOTES_BUTTON))
+        await fake.wait_for("sendMessage", uploader)
+        await idle()
+        fake.add_file("upload", _csv(UPLOAD_ROWS))
+        await put(message_update(2, uploader, document={
+            "file_id": "upload", "file_unique_id": "upload", "file_name": "quotes.csv",
+        }))
+        await fake.wait_for("getFile")
+        import_started = time.monotonic()
+
+        pressed_at = {}
+        voted_at = {}
+        for number in range(USERS):
+            pressed_at[RANDOM_USERS + number] = time.monotonic()
+            await put(message_update(100 + number, RANDOM_USERS + number, RANDOM_QUOTE_BUTTON))
+            voted_at[str(200 + number)] = time.monotonic()
+            action = "like" if number % 4 else "dislike"
+            await put(callback_update(200 + number, VOTING_USERS + number, f"{action}_{number % 10 + 1}"))
+            await put(message_update(300 + number, SEARCHING_USERS + number, "/search patience"))
+            if number == USERS // 2:
+                # The scheduled flush, run while the import is still writing
+                flushed = asyncio.create_task(bot.flush_ratings(None))
+            await asyncio.sleep(0.05)
+        await flushed
+
+        answers = await fake.wait_for("answerCallbackQuery", count=USERS)
+        quotes = []
+        for number in range(USERS):
+            quotes.append((await fake.wait_for("sendMessage", RANDOM_USERS + number))[0])
+            await fake.wait_for("sendMessage", SEARCHING_USERS + number)
+        replies = await fake.wait_for("sendMessage", uploader, count=2, timeout=120)
+        import_finished = replies[1].at
+        await bot.flush_ratings(None)
+        return {
+            "vote_latencies": [call.at - voted_at[call.params["callback_query_id"]] for call in answers],
+            "quote_latencies": [call.at - pressed_at[int(call.params["chat_id"])] for call in quotes],
+            "answers": answers + quotes,
+            "import_started": import_started,
+            "import_finished": import_finished,
+            "import_reply": replies[1].params["text"],
+        }
+    finally:
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+
+
+def test_buttons_are_answered_while_an_upload_is_imported(db_path, fake_telegram, tmp_path, monkeypatch):
+    # Uploads are downloaded into ./app
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "app").mkdir()
+    monkeypatch.setattr(bot, "prefetcher", QuotePrefetcher())
+    monkeypatch.setattr(bot, "rating_buffer", RatingBuffer(on_flush=on_ratings_flushed))
+    monkeypatch.setattr(bot, "active_interactions", TTLCache(maxsize=10000, ttl=3600))
+    db_fill_in_rows([("Seed book", "Seed author", f"Seed quote {i} on patience") for i in range(100)])
+
+    result = asyncio.run(_run(fake_telegram))
+
+    assert result["import_reply"] == f"Successfully added {UPLOAD_ROWS} quotes from 100 books."
+    # The presses were answered during the import, not queued behind it
+    assert all(call.at < result["import_finished"] for call in result["answers"])
+    assert result["import_finished"] - result["import_started"] > 1
+    assert bot.prefetcher.stats["hits"] + bot.prefetcher.stats["misses"] == USERS
+    assert bot.prefetcher.stats["refills"] >= 1
+    assert _percentile(result["quote_latencies"], 0.99) < MAX_P99_LATENCY
+    assert _percentile(result["vote_latencies"], 0.99) < MAX_P99_LATENCY
+    # Every vote was written, some of them by the flush during the import
+    likes, dislikes = get_connection().execute('SELECT SUM(likes), SUM(dislikes) FROM quotes').fetchone()
+    assert (likes, dislikes) == (USERS - USERS // 4, USERS // 4)
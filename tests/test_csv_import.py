@@ -0,0 +1,68 @@
+"""
+Large CSV uploads are committed in batches, the command line import in one transaction.
+"""
+import sqlite3
+
+import pytest
+
+from app import make_quotes_from_csv
+from app.make_quotes_from_csv import import_csv_file, import_csv_files
+from db import db_fill_in
+
+ROWS = 1000
+
+BATCH_SIZE = 100
+
+
+def _write_csv(path, rows: int) -> str:
+    lines = ["source,author,quote"]
+    lines += [f"Book {i % 7},Author {i % 3},Quote number {i}" for i in range(rows)]
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return str(path)
+
+
+def _probing(rows, db_path: str, probes: list):
+    """Passes rows through, trying to take the write lock from another connection halfway."""
+    for number, row in enumerate(rows):
+        if number == ROWS // 2:
+            other = sqlite3.connect(db_path, timeout=0)
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                probes.append(other.execute("SELECT COUNT(*) FROM quotes").fetchone()[0])
+                other.rollback()
+            except sqlite3.OperationalError:
+                probes.append(None)
+            finally:
+                other.close()
+        yield row
+
+
+@pytest.fixture
+def probed_import(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_fill_in, "INSERT_BATCH_SIZE", BATCH_SIZE)
+    iter_csv_quotes = make_quotes_from_csv.iter_csv_quotes
+    probes = []
+    monkeypatch.setattr(
+        make_quotes_from_csv, "iter_csv_quotes",
+        lambda *args: _probing(iter_csv_quotes(*args), db_path, probes),
+    )
+    return _write_csv(tmp_path / "quotes.csv", ROWS), probes
+
+
+def test_uploaded_file_lets_other_writers_in_between_batches(probed_import):
+    path, probes = probed_import
+
+    results = import_csv_file(path)
+
+    assert sum(result.inserted for result in results) == ROWS
+    # The batches read so far are committed and the write lock is free
+    assert probes == [ROWS // 2]
+
+
+def test_command_line_import_is_one_transaction(probed_import):
+    path, probes = probed_import
+
+    results = import_csv_files([path])
+
+    assert sum(result.inserted for result in results) == ROWS
+    assert probes == [None]
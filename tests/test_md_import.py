@@ -0,0 +1,36 @@
+"""
+Markdown exports are streamed into the database, a file without quotes adds nothing.
+"""
+import pytest
+
+from app.quotes_from_md import import_md_file
+from db.connection import get_connection
+
+HEADER = "---\nНазвание: Пустая книга\nАвтор: Никто\n---\n# Цитаты\n"
+
+
+def _counts() -> tuple[int, int, int]:
+    cursor = get_connection().cursor()
+    return tuple(cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("quotes", "books", "authors"))
+
+
+def test_file_without_quotes_leaves_no_book_or_author(db_path, tmp_path):
+    path = tmp_path / "empty.md"
+    path.write_text(HEADER + "---\n\n---\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="No quotes"):
+        import_md_file(str(path))
+
+    assert _counts() == (0, 0, 0)
+
+
+def test_quotes_are_imported_once(db_path, tmp_path):
+    path = tmp_path / "book.md"
+    path.write_text(HEADER + "---\nПервая цитата\n---\nВторая цитата\n", encoding="utf-8")
+
+    first = import_md_file(str(path))
+    again = import_md_file(str(path))
+
+    assert (first.inserted, first.skipped) == (2, 0)
+    assert (again.inserted, again.skipped) == (0, 2)
+    assert _counts() == (2, 1, 1)
@@ -0,0 +1,99 @@
+"""
+Upgrading a database created by the first release, with only the bare quotes table.
+"""
+import sqlite3
+
+import pytest
+
+from db import migrations
+from db.db_fill_in import quote_hash, quote_payload
+from db.db_init import init_schema
+from db.migrations import MIGRATIONS, migrate, schema_version
+
+ROWS = 20000
+
+# Every tenth quote has no book and every seventh no author
+BOOKS = 200
+AUTHORS = 50
+
+
+def _create_v0_database(path: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            book TEXT,
+            author TEXT,
+            entry_date DATETIME,
+            value INTEGER CHECK (value >= 1 AND value <= 10),
+            last_seen DATETIME
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO quotes (content, book, author, entry_date, value) VALUES (?, ?, ?, ?, ?)',
+        [
+            (
+                f"Quote number {i} about patience",
+                None if i % 10 == 0 else f"Book {i % BOOKS}",
+                None if i % 7 == 0 else f"Author {i % AUTHORS}",
+                "2024-01-01 00:00:00",
+                10 if i % 3 == 0 else 5,
+            )
+            for i in range(ROWS)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_first_release_database_is_upgraded(tmp_path):
+    path = str(tmp_path / "quotes.db")
+    _create_v0_database(path)
+    conn = sqlite3.connect(path)
+
+    init_schema(conn)
+
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert conn.execute('SELECT COUNT(*) FROM quotes').fetchone()[0] == ROWS
+    with_book, with_author = conn.execute('SELECT COUNT(book_id), COUNT(author_id) FROM quotes').fetchone()
+    assert with_book == sum(1 for i in range(ROWS) if i % 10)
+    assert with_author == sum(1 for i in range(ROWS) if i % 7)
+    # Book 0, 10, 20, ... only ever appeared on quotes without a book
+    assert conn.execute('SELECT COUNT(*) FROM books').fetchone()[0] == len({i % BOOKS for i in range(ROWS) if i % 10})
+    assert conn.execute('SELECT COUNT(*) FROM authors').fetchone()[0] == AUTHORS
+    assert conn.execute('SELECT COUNT(*) FROM quotes WHERE payload IS NULL OR content_hash IS NULL').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(book_sort) FROM quotes').fetchone()[0] == with_book
+    # The frozen copies in the migrations still agree with the importing code
+    for content, book, author, payload, content_hash in conn.execute(
+        'SELECT content, book, author, payload, content_hash FROM quotes_view ORDER BY id LIMIT 100'
+    ):
+        assert payload == quote_payload(content)
+        assert content_hash == quote_hash(content, book, author)
+    assert conn.execute('SELECT COUNT(*) FROM quotes WHERE score = 1').fetchone()[0] == len(range(0, ROWS, 3))
+
+    conn.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('integrity-check')")
+    assert conn.execute(
+        "SELECT COUNT(*) FROM quotes_fts WHERE quotes_fts MATCH 'patience'"
+    ).fetchone()[0] == ROWS
+    assert conn.execute(
+        "SELECT COUNT(*) FROM quotes_fts WHERE quotes_fts MATCH 'book:\"Book 7\"'"
+    ).fetchone()[0] == len([i for i in range(ROWS) if i % BOOKS == 7 and i % 10])
+    conn.close()
+
+
+def test_interrupted_migration_is_rolled_back(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / "quotes.db"))
+
+    def interrupted(cursor: sqlite3.Cursor) -> None:
+        cursor.execute('CREATE TABLE half_done (id INTEGER)')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [MIGRATIONS[0], interrupted])
+    with pytest.raises(KeyboardInterrupt):
+        migrate(conn)
+
+    assert not conn.in_transaction
+    assert schema_version(conn) == 1
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,47 @@
+"""
+Editing a quote keeps its hash, payload and rendered messages in step with it.
+"""
+import sqlite3
+
+import pytest
+
+from app.get_random_line import QUOTE_COLUMNS, _row_to_dict
+from app.messages import render_quote
+from db.connection import get_connection
+from db.db_fill_in import db_fill_in_rows, quote_hash
+from db.db_modify import modify_cell
+
+
+def _quote(id: int) -> dict:
+    row = get_connection().execute(f'SELECT {QUOTE_COLUMNS} FROM quotes_view WHERE id = ?', (id,)).fetchone()
+    return _row_to_dict(row)
+
+
+def _text(id: int) -> str:
+    return "\n".join(render_quote(_quote(id))[0])
+
+
+def test_edited_quote_is_hashed_and_rendered_again(db_path):
+    db_fill_in_rows([("Old book", "Author", "Old words"), ("Old book", "Author", "Other words")])
+    assert "Old words" in _text(1)
+
+    modify_cell(1, 'content', "New words")
+
+    assert "New words" in _text(1)
+    assert _quote(1)['content_hash'] == quote_hash("New words", "Old book", "Author")
+
+    modify_cell(1, 'book', "New book")
+
+    assert "New book" in _text(1)
+    assert _quote(1)['content_hash'] == quote_hash("New words", "New book", "Author")
+    # The re-import of the edited quote is recognised as a duplicate
+    assert db_fill_in_rows([("New book", "Author", "New words")])[0].skipped == 1
+
+
+def test_edit_into_a_duplicate_is_refused(db_path):
+    db_fill_in_rows([("Book", "Author", "First"), ("Book", "Author", "Second")])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        modify_cell(2, 'content', "First")
+
+    assert "Second" in _text(2)
@@ -0,0 +1,28 @@
+"""
+Building the best quotes PDF only clears out versions older than the one just built.
+"""
+import os
+
+from app import make_pdf
+from app.make_pdf import get_best_quotes_pdfs
+from db.connection import transaction
+
+
+def _set_version(version: int) -> None:
+    with transaction() as conn:
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'best_quotes_version'", (version,))
+
+
+def test_build_keeps_newer_and_previous_versions(db_path, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "pdf_cache"
+    monkeypatch.setattr(make_pdf, "PDF_CACHE_DIR", str(cache_dir))
+    for version in (1, 2, 9):
+        os.makedirs(cache_dir / f"best_quotes_v{version}")
+        (cache_dir / f"best_quotes_v{version}" / "best_quotes.pdf").write_bytes(b"%PDF")
+    _set_version(5)
+
+    paths = get_best_quotes_pdfs()
+
+    assert paths == [str(cache_dir / "best_quotes_v5" / "best_quotes.pdf")]
+    # v1 is stale, v2 may still be read by a delivery, v9 was built by a newer process
+    assert sorted(os.listdir(cache_dir)) == ["best_quotes_v2", "best_quotes_v5", "best_quotes_v9"]
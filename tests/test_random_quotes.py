@@ -0,0 +1,82 @@
+import sqlite3
+
+from app import get_random_line
+from app.get_random_line import draw_quotes, pick_unseen_quotes, reserve_random_quotes
+from app.weighted_sampler import WeightedQuoteSampler
+from db.clear_db import clear_database
+from db.connection import get_connection
+from db.db_fill_in import db_fill_in_rows
+
+
+def test_sampler_loads_without_holding_the_write_lock(db_path, monkeypatch):
+    db_fill_in_rows([("Book", "Author", f"Quote {i}") for i in range(50)])
+    writable_during_load = []
+    load = WeightedQuoteSampler.load
+
+    def checked_load(self, cursor):
+        # Another process must still be able to write while the table is read
+        other = sqlite3.connect(db_path, timeout=0)
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            other.rollback()
+            writable_during_load.append(True)
+        except sqlite3.OperationalError:
+            writable_during_load.append(False)
+        finally:
+            other.close()
+        load(self, cursor)
+
+    monkeypatch.setattr(get_random_line, "QUOTE_SELECTION", "weighted")
+    monkeypatch.setattr(WeightedQuoteSampler, "load", checked_load)
+
+    quotes = reserve_random_quotes(10)
+
+    assert writable_during_load == [True]
+    assert len({quote['id'] for quote in quotes}) == 10
+
+
+class _RacingCursor:
+    """Cursor whose first fetch lets another sync of the sampler run in between."""
+
+    def __init__(self, cursor, sampler):
+        self._cursor = cursor
+        self._sampler = sampler
+        self._raced = False
+
+    def execute(self, *args):
+        self._cursor.execute(*args)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if not self._raced:
+            self._raced = True
+            self._sampler.sync_new(self._cursor.connection.cursor())
+        return rows
+
+
+def test_concurrent_syncs_add_new_quotes_once(db_path):
+    db_fill_in_rows([("Book", "Author", f"Quote {i}") for i in range(5)])
+    sampler = WeightedQuoteSampler()
+    sampler.load(get_connection().cursor())
+    db_fill_in_rows([("Book", "Author", f"New quote {i}") for i in range(5)])
+
+    sampler.sync_new(_RacingCursor(get_connection().cursor(), sampler))
+
+    assert sampler.max_id == 10
+    assert sampler._tree.total() == 10 * sampler.policy.weight(0)
+
+
+def test_deleted_quotes_drawn_from_the_sampler_are_forgotten(db_path, monkeypatch):
+    db_fill_in_rows([("Book", "Author", f"Quote {i}") for i in range(20)])
+    monkeypatch.setattr(get_random_line, "QUOTE_SELECTION", "weighted")
+    assert draw_quotes(5)
+    sampler = get_random_line._sampler
+    clear_database()
+
+    for _ in range(50):
+        assert draw_quotes(5) == []
+        assert pick_unseen_quotes([1]) == {}
+        if sampler._tree.total() <= 1e-9:
+            break
+
+    assert sampler._tree.total() <= 1e-9
@@ -0,0 +1,35 @@
+"""
+Votes are buffered and recorded with their counters in one flush, once per message and user.
+"""
+from db.connection import get_connection
+from db.db_fill_in import db_fill_in_rows
+from db.db_ratings import RatingBuffer
+
+
+def _counters(id: int) -> tuple:
+    return get_connection().execute('SELECT likes, dislikes, score FROM quotes WHERE id = ?', (id,)).fetchone()
+
+
+def test_votes_are_counted_once_per_message_and_user(db_path):
+    db_fill_in_rows([("Book", "Author", "First"), ("Book", "Author", "Second")])
+    flushed = []
+    buffer = RatingBuffer(on_flush=flushed.append)
+
+    assert buffer.add(10, 1, 1, 'like')
+    assert not buffer.add(10, 1, 1, 'dislike')
+    assert buffer.add(10, 2, 1, 'like')
+    assert buffer.add(11, 1, 2, 'dislike')
+    assert buffer.flush() == 2
+
+    assert _counters(1) == (2, 0, 2)
+    assert _counters(2) == (0, 1, -1)
+    assert get_connection().execute('SELECT COUNT(*) FROM message_ratings').fetchone()[0] == 3
+
+    # Rated again once the bot has forgotten the message, e.g. after a restart
+    restarted = RatingBuffer(on_flush=flushed.append)
+    assert restarted.add(10, 1, 1, 'dislike')
+    assert restarted.add(12, 1, 1, 'like')
+    assert restarted.flush() == 1
+
+    assert _counters(1) == (3, 0, 3)
+    assert flushed == [{1: [2, 0], 2: [0, 1]}, {1: [1, 0]}]
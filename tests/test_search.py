@@ -0,0 +1,44 @@
+"""
+The full-text index follows edits and deletions of quotes.
+"""
+from db.clear_db import clear_database
+from db.connection import get_connection
+from db.db_fill_in import db_fill_in_rows
+from db.db_modify import modify_cell
+from db.db_search import search_quotes
+
+
+def _found(query: str) -> list[int]:
+    return [quote['id'] for quote in search_quotes(query).quotes]
+
+
+def _check_index() -> None:
+    """Raises sqlite3.DatabaseError if the index differs from the quotes it was built from."""
+    get_connection().execute("INSERT INTO quotes_fts (quotes_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_index_follows_edits_and_clearing(db_path):
+    db_fill_in_rows([("Walden", "Thoreau", "Simplify your life"), ("Essays", "Emerson", "Trust thyself")])
+    assert _found("simplify") == [1]
+
+    modify_cell(1, 'content', "Rather than love, give me truth")
+    modify_cell(2, 'book', "Nature")
+    modify_cell(2, 'author', "Waldo")
+
+    assert _found("simplify") == []
+    assert _found("truth") == [1]
+    assert _found("essays") == []
+    assert _found("nature") == [2]
+    assert _found("emerson") == []
+    assert _found("waldo") == [2]
+    assert _found("walden thoreau") == [1]
+    _check_index()
+
+    clear_database()
+
+    assert _found("truth") == []
+    assert _found("nature") == []
+    _check_index()
+    db_fill_in_rows([("Walden", "Thoreau", "Simplify your life")])
+    assert len(_found("simplify")) == 1
+    _check_index()
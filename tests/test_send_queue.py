@@ -0,0 +1,78 @@
+"""
+The send queue and scheduled broadcasts against a fake Bot API.
+"""
+import time
+import asyncio
+from types import SimpleNamespace
+
+from telegram import Bot
+
+from app import bot
+from app.scheduler import QuoteScheduler
+from app.send_queue import SendQueue
+from db.db_fill_in import db_fill_in_rows
+
+# Subscribers of the broadcast
+USERS = range(1, 11)
+
+# Global sends per second in the broadcast test, slow enough that delivery outlasts the job
+BROADCAST_RATE = 10
+
+
+def _telegram(fake) -> Bot:
+    return Bot("123:test", base_url=f"{fake.url}/bot")
+
+
+def test_rate_limited_messages_are_sent_after_the_retry_delay(fake_telegram):
+    async def run() -> list:
+        queue = SendQueue()
+        async with _telegram(fake_telegram) as telegram:
+            fake_telegram.fail_next("sendMessage", retry_after=1)
+            futures = [
+                queue.submit(chat_id, lambda chat_id=chat_id: telegram.send_message(chat_id, f"quote {chat_id}"))
+                for chat_id in (1, 2, 3)
+            ]
+            results = await asyncio.wait_for(asyncio.gather(*futures), 10)
+            await queue.close()
+        assert queue.stats["rate_limited"] == 1
+        assert queue.stats["retried"] == 1
+        assert queue.stats["sent"] == 3
+        return results
+
+    results = asyncio.run(run())
+
+    assert sorted(message.chat.id for message in results) == [1, 2, 3]
+    assert len(fake_telegram.calls_to("sendMessage")) == 4
+    # The rejected message was sent again once the retry delay had passed
+    rejected, retried = fake_telegram.calls_to("sendMessage", fake_telegram.calls_to("sendMessage")[0].params["chat_id"])
+    assert retried.at - rejected.at >= 1
+
+
+def test_broadcast_returns_before_the_quotes_are_sent(db_path, fake_telegram, monkeypatch):
+    # Too long for one message, every quote is sent in parts
+    db_fill_in_rows([("Book", "Author", f"Quote {i} " + "word " * 1000) for i in range(50)])
+    scheduler = QuoteScheduler()
+    for user_id in USERS:
+        scheduler.subscribe(user_id, None)
+    monkeypatch.setattr(bot, "scheduler", scheduler)
+    monkeypatch.setattr(bot, "send_queue", SendQueue(rate=BROADCAST_RATE))
+
+    async def run() -> float:
+        async with _telegram(fake_telegram) as telegram:
+            started = time.monotonic()
+            await bot.send_quote(SimpleNamespace(bot=telegram))
+            returned = time.monotonic() - started
+            await bot.send_queue.close(timeout=30)
+        return returned
+
+    returned = asyncio.run(run())
+
+    calls = fake_telegram.calls_to("sendMessage")
+    assert returned < 1
+    assert calls[-1].at - calls[0].at > 1
+    for user_id in USERS:
+        parts = fake_telegram.calls_to("sendMessage", user_id)
+        # The parts arrive in order, with the rating keyboard under the last one
+        assert len(parts) >= 2
+        assert parts[0].params["text"].startswith("Quote")
+        assert [bool(part.params.get("reply_markup")) for part in parts] == [False] * (len(parts) - 1) + [True]
@@ -0,0 +1,129 @@
+"""
+Sharded mode: the dispatcher routes updates by user id to two spawned
+worker processes, which talk to a fake Bot API.
+"""
+import queue
+import socket
+import asyncio
+import multiprocessing
+
+import httpx
+import tornado.web
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from app import bot, sharding
+from db.db_users import save_subscription
+from tests.fake_telegram import callback_update, message_update
+
+SHARDS = 2
+
+USERS = range(1, 21)
+
+SECRET = "sharding-secret"
+
+# Slot every subscriber is scheduled in
+SLOT = "12:00"
+
+
+def _recording_worker(shard: int, shards: int, updates, token: str, events) -> None:
+    """Runs the regular worker entry point, reporting the users it handles and schedules."""
+    build_application = bot.build_application
+
+    def build_recording_application(token: str, with_updater: bool = True):
+        application = build_application(token, with_updater)
+        post_init = application.post_init
+
+        async def record_update(update: Update, context) -> None:
+            events.put(("handled", shard, update.effective_user.id))
+
+        async def report_schedule(application) -> None:
+            await post_init(application)
+            events.put(("scheduled", shard, sorted(bot.scheduler.due_users(SLOT)), len(bot.scheduler)))
+
+        application.add_handler(TypeHandler(Update, record_update), group=-1)
+        application.post_init = report_schedule
+        return application
+
+    bot.build_application = build_recording_application
+    sharding._run_worker(shard, shards, updates, token)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _next_event(events, timeout: float = 60) -> tuple:
+    try:
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        raise AssertionError("A worker stopped reporting") from None
+
+
+async def _dispatch(queues: list, updates: list[dict]) -> None:
+    app = tornado.web.Application([
+        ("/telegram", sharding.UpdateRouter, {"secret_token": SECRET, "queues": queues}),
+    ])
+    port = _free_port()
+    server = app.listen(port, "127.0.0.1")
+    try:
+        async with httpx.AsyncClient() as client:
+            for update in updates:
+                response = await client.post(
+                    f"http://127.0.0.1:{port}/telegram",
+                    json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                )
+                response.raise_for_status()
+    finally:
+        server.stop()
+
+
+def test_updates_and_schedules_stay_on_their_users_shard(db_path, fake_telegram, monkeypatch):
+    # Spawned workers read the Bot API address from the environment
+    monkeypatch.setenv("TELEGRAM_API_URL", fake_telegram.url)
+    for user_id in USERS:
+        save_subscription(user_id, "1", [SLOT])
+
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    queues = [context.Queue() for _ in range(SHARDS)]
+    workers = [
+        context.Process(target=_recording_worker, args=(shard, SHARDS, queues[shard], "123:test", events))
+        for shard in range(SHARDS)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        schedules = {}
+        for _ in range(SHARDS):
+            _, shard, due, subscribed = _next_event(events)
+            schedules[shard] = (due, subscribed)
+
+        updates = []
+        for user_id in USERS:
+            updates.append(message_update(len(updates) + 1, user_id, "/start"))
+            updates.append(callback_update(len(updates) + 1, user_id, "disabled"))
+        asyncio.run(_dispatch(queues, updates))
+
+        handled = [_next_event(events) for _ in updates]
+        asyncio.run(fake_telegram.wait_for("answerCallbackQuery", count=len(USERS)))
+        asyncio.run(fake_telegram.wait_for("sendMessage", count=len(USERS)))
+    finally:
+        for updates_queue in queues:
+            updates_queue.put(None)
+        for worker in workers:
+            worker.join(sharding.WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+
+    for shard in range(SHARDS):
+        own_users = [user_id for user_id in USERS if user_id % SHARDS == shard]
+        assert schedules[shard] == (own_users, len(own_users))
+
+    assert sorted(user_id for _, _, user_id in handled) == sorted([*USERS, *USERS])
+    assert all(shard == user_id % SHARDS for _, shard, user_id in handled)
+    assert {int(call.params["chat_id"]) for call in fake_telegram.calls_to("sendMessage")} == set(USERS)
+    assert all(worker.exitcode == 0 for worker in workers)
@@ -0,0 +1,25 @@
+from db.connection import get_connection
+from db.db_users import delete_subscription, load_subscriptions, save_subscription
+
+
+def test_schedules_are_restored_from_their_stored_slots(db_path):
+    save_subscription(1, '2', ['08:00', '20:00'])
+    save_subscription(2, '0', None)
+    save_subscription(3, '1', ['08:00'])
+    # Changing the schedule replaces the old slots
+    save_subscription(3, '3', ['08:00', '15:00', '20:00'])
+    save_subscription(4, '1', ['08:00'])
+    delete_subscription(4)
+
+    assert load_subscriptions() == {
+        1: ('2', ['08:00', '20:00']),
+        2: ('0', None),
+        3: ('3', ['08:00', '15:00', '20:00']),
+    }
+
+
+def test_slot_index_is_gone(db_path):
+    indexes = {row[0] for row in get_connection().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'subscription_slots'"
+    )}
+    assert 'idx_subscription_slots_slot' not in indexes